@@ -0,0 +1,3 @@
+'''
+Data handling for the GPI valve control GUI.
+'''
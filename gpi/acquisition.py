@@ -0,0 +1,145 @@
+'''
+Background acquisition of the fast gauge readings.
+'''
+
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from gpi.data import SAMPLE_RATE, decode_GPI_data
+
+
+# One get_GPI_data reply: time and sample count of its first reading, number of
+# readings dropped just before it, raw words, decoded pressures (Torr) and the
+# get_status_registers array read with it (None unless read_status)
+Block = namedtuple('Block', ['time', 'index', 'gap', 'words', 'abs_pressures', 'diff_pressures', 'status'],
+                   defaults=(None,))
+
+
+def block_times(block, sample_rate=SAMPLE_RATE):
+    '''
+    Time stamps of the samples in a block, every 1/sample_rate from its first one.
+    '''
+    return block.time + np.arange(len(block.words))/sample_rate
+
+
+class Acquisition(threading.Thread):
+    '''
+    Drains get_GPI_data continuously on its own connection and hands decoded
+    blocks to the GUI through a bounded queue.
+
+    The driver is created inside the thread so that its socket is never used
+    by the GUI thread. With a koheron driver, get_GPI_data and
+    get_GPI_data_index go out in one batch, so each poll is one round trip.
+    Blocks are time stamped from the server's sample count as
+    t0 + index/sample_rate, and samples the server dropped from its full
+    queue show up as a gap in the count (counted in dropped_samples). If the
+    consumer falls behind, the oldest queued block is dropped and counted in
+    lost_samples. Sinks get every block on this thread and must not block
+    (e.g. Recorder.record). With read_status, the status registers are read
+    along with every poll and the latest array is kept in status, so the
+    GUI never waits for the Red Pitaya.
+    '''
+    def __init__(self, connect_driver, poll_interval=0.05, max_blocks=100, sinks=(), read_status=False,
+                 sample_rate=SAMPLE_RATE):
+        '''
+        Parameters
+            connect_driver: callable returning a new GPI_RP driver
+            poll_interval: float, seconds between get_GPI_data calls
+            max_blocks: int, blocks held before the oldest is dropped, 0 to
+                only hand the blocks to the sinks
+            sinks: sequence of callables taking each Block
+            read_status: bool, also read get_status_registers on every poll
+            sample_rate: float, gauge words per second of the driver (e.g.
+                SimulatedRedPitaya.sample_rate)
+        '''
+        super().__init__(name='GPI acquisition', daemon=True)
+        self.connect_driver = connect_driver
+        self.poll_interval = poll_interval
+        self.read_status = read_status
+        self.sample_rate = sample_rate
+        self.status = None # latest get_status_registers array
+        self.blocks = queue.Queue(maxsize=max_blocks) if max_blocks else None
+        self.sinks = list(sinks)
+        self.lost_samples = 0
+        self.dropped_samples = 0
+        self.t0 = None # time of sample index 0
+        self.next_index = None
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            driver = self.connect_driver()
+            while not self._stop_event.is_set():
+                words, index, status = self._read(driver)
+                now = time.time()
+                if status is not None:
+                    self.status = status
+                if len(words):
+                    block = self._make_block(now, index, words, status)
+                    for sink in self.sinks:
+                        sink(block)
+                    self._put(block)
+                self._stop_event.wait(self.poll_interval)
+        except Exception as e:
+            self.error = e
+
+    def _read(self, driver):
+        batch = getattr(getattr(driver, 'client', None), 'batch', None)
+        if batch is None: # simulator or test driver
+            words, index = driver.get_GPI_data(), driver.get_GPI_data_index()
+            return words, index, driver.get_status_registers() if self.read_status else None
+        with batch():
+            words = driver.get_GPI_data()
+            index = driver.get_GPI_data_index()
+            status = driver.get_status_registers() if self.read_status else None
+        return words.result(), index.result(), None if status is None else status.result()
+
+    def _make_block(self, now, index, words, status=None):
+        if self.next_index is not None and index < self.next_index:
+            # Count went backwards, the instrument was restarted
+            self.t0 = self.next_index = None
+        # A reading cannot arrive before it was taken: follow earlier estimates
+        # of t0 at once and later ones slowly, they come from network delays
+        # or from drift between the Red Pitaya and local clocks.
+        t0 = now - (index + len(words) - 1)/self.sample_rate
+        if self.t0 is None or t0 < self.t0:
+            self.t0 = t0
+        else:
+            self.t0 += 0.01*(t0 - self.t0)
+        gap = 0 if self.next_index is None else index - self.next_index
+        self.dropped_samples += gap
+        self.next_index = index + len(words)
+        return Block(self.t0 + index/self.sample_rate, index, gap, words, *decode_GPI_data(words), status=status)
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def get_blocks(self):
+        '''
+        All blocks received since the last call, oldest first. Never blocks.
+        '''
+        blocks = []
+        while self.blocks is not None:
+            try:
+                blocks.append(self.blocks.get_nowait())
+            except queue.Empty:
+                return blocks
+        return blocks
+
+    def _put(self, block):
+        while self.blocks is not None:
+            try:
+                self.blocks.put_nowait(block)
+                return
+            except queue.Full:
+                try:
+                    self.lost_samples += len(self.blocks.get_nowait().words)
+                except queue.Empty:
+                    pass
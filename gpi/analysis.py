@@ -0,0 +1,68 @@
+'''
+Post-puff analysis of the differential pressure in the plenum.
+'''
+
+import os
+import numpy as np
+from scipy.signal import medfilt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def flow_rates(times, pressures, plenum_volume, scales=(0.02, 0.005), step=0.0005, trim=100):
+    '''
+    Flow rate out of the plenum from its pressure trace, by central
+    differences of the linearly interpolated pressure on an even time grid.
+    For every grid time t and scale dx this is the same as
+    plenum_volume*scipy.misc.derivative(interp1d(times, pressures), t, dx=dx),
+    computed for the whole grid at once.
+    Parameters
+        times: NumPy array of sample times (s)
+        pressures: NumPy array of pressures (Torr)
+        plenum_volume: float, plenum volume (L)
+        scales: sequence of half-widths dx of the differences (s)
+        step: float, spacing of the time grid (s)
+        trim: int, grid points dropped at both ends (must cover the largest scale)
+    Returns
+        tuple: grid times and a list with one flow rate array (Torr-L/s) per scale
+    '''
+    order = np.argsort(times, kind='stable')
+    times, pressures = np.asarray(times)[order], np.asarray(pressures)[order]
+    grid = np.arange(times[0], times[-1], step)[trim:-trim]
+    rates = []
+    for dx in scales:
+        rise = np.interp(grid + dx, times, pressures) - np.interp(grid - dx, times, pressures)
+        rates.append(plenum_volume*rise/(2*dx))
+    return grid, rates
+
+
+def save_puff_plot(data_path, times, pressures, title, plenum_volume):
+    '''
+    Save a shot window and plot it with its flow rates to a PNG next to it.
+    Runs in a worker process, so it only uses the Agg backend.
+    Parameters
+        data_path: str, .npy file written with the times and differential pressures
+        times: NumPy array of sample times relative to T1 (s)
+        pressures: NumPy array of differential pressures (Torr)
+        title: str or int, figure title
+        plenum_volume: float, plenum volume (L)
+    Returns
+        str: path of the PNG
+    '''
+    np.save(data_path, [times, pressures])
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.suptitle(title)
+    ax = fig.add_subplot(211)
+    pressures = medfilt(pressures, 11)
+    ax.plot(times, pressures)
+    ax.set_ylabel('Diff. pressure (Torr)')
+    ax = fig.add_subplot(212)
+    newtimes, (dp_coarse, dp_fine) = flow_rates(times, pressures, plenum_volume, scales=(.02, .005))
+    ax.plot(newtimes, medfilt(dp_fine, 11))
+    ax.plot(newtimes, medfilt(dp_coarse, 11))
+    ax.set_xlabel('t-T1 (s)')
+    ax.set_ylabel('Flow rate (Torr-L/sec)')
+    png_path = os.path.splitext(data_path)[0] + '.png'
+    fig.savefig(png_path)
+    return png_path
@@ -0,0 +1,141 @@
+'''
+Fixed-size buffers for the pressure histories kept by the GUI.
+'''
+
+from functools import reduce
+from math import gcd
+import numpy as np
+
+
+class RingBuffer(object):
+    '''
+    Fixed-capacity history of samples with several named float fields.
+
+    Every sample is stored twice, at i and i + capacity, so the latest n
+    samples are always one contiguous slice: appending a batch costs
+    O(batch) and reading the most recent samples returns views, not copies.
+    '''
+    def __init__(self, capacity, fields):
+        '''
+        Parameters
+            capacity: int, number of samples kept
+            fields: sequence of field names, e.g. ('t', 'abs', 'diff')
+        '''
+        self.capacity = int(capacity)
+        self.fields = tuple(fields)
+        self._index = {name: i for i, name in enumerate(self.fields)}
+        self._data = np.zeros((len(self.fields), 2*self.capacity))
+        self._pos = 0 # where the next sample goes, in [0, capacity)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, field):
+        '''
+        View of all samples of one field, oldest first.
+        '''
+        return self._field_view(self._index[field], self._size)
+
+    def append(self, *columns):
+        '''
+        Add a batch of samples, one array per field in the order of self.fields.
+        Only the newest capacity samples are kept if the batch is longer.
+        '''
+        if len(columns) != len(self.fields):
+            raise ValueError('Expected %d columns, received %d' % (len(self.fields), len(columns)))
+        columns = np.broadcast_arrays(*[np.atleast_1d(c) for c in columns])
+        batch = np.array(columns, dtype=self._data.dtype)[:, -self.capacity:]
+        n = batch.shape[1]
+        if n == 0:
+            return
+        cap = self.capacity
+        start, end = self._pos, self._pos + n
+        self._data[:, start:end] = batch
+        if end <= cap:
+            self._data[:, start+cap:end+cap] = batch
+        else:
+            self._data[:, start+cap:] = batch[:, :cap-start]
+            self._data[:, :end-cap] = batch[:, cap-start:]
+        self._pos = end % cap
+        self._size = min(self._size + n, cap)
+
+    def last(self, n):
+        '''
+        Views of the latest n samples (fewer if not available yet).
+        Returns
+            tuple of NumPy arrays, one per field
+        '''
+        n = max(0, min(int(n), self._size))
+        return tuple(self._field_view(i, n) for i in range(len(self.fields)))
+
+    def _field_view(self, i, n):
+        stop = self._pos + self.capacity
+        return self._data[i, stop-n:stop]
+
+
+class RollingAverage(object):
+    '''
+    Moving averages over a few fixed windows, updated batch by batch.
+
+    Incoming samples are summed in blocks of the largest size that divides
+    every window (10 ms for windows of 10 ms, 100 ms and 1 s). The block sums
+    are kept in a RingBuffer, so an update costs O(batch) and a mean costs
+    O(window/block). Means cover complete blocks only and therefore lag the
+    newest sample by less than one block.
+    '''
+    def __init__(self, fields, windows, sample_rate):
+        '''
+        Parameters
+            fields: sequence of field names, e.g. ('t', 'abs', 'diff')
+            windows: sequence of averaging windows (s)
+            sample_rate: float, samples per second
+        '''
+        self.fields = tuple(fields)
+        self.windows = tuple(windows)
+        self._window_sizes = [int(round(w*sample_rate)) for w in self.windows]
+        if min(self._window_sizes) < 1:
+            raise ValueError('Averaging windows must be at least one sample long')
+        self.block_size = reduce(gcd, self._window_sizes)
+        self._blocks = RingBuffer(max(self._window_sizes)//self.block_size, self.fields)
+        self._pending_sum = np.zeros(len(self.fields))
+        self._pending_count = 0
+
+    def update(self, *columns):
+        '''
+        Add a batch of samples, one array per field in the order of self.fields.
+        '''
+        batch = np.array(np.broadcast_arrays(*[np.atleast_1d(c) for c in columns]), dtype=float)
+        block = self.block_size
+        # Complete the block left over from the previous batch first
+        head = batch[:, :block-self._pending_count]
+        self._pending_sum += head.sum(axis=1)
+        self._pending_count += head.shape[1]
+        if self._pending_count < block:
+            return
+        rest = batch[:, head.shape[1]:]
+        n_blocks = rest.shape[1] // block
+        block_sums = rest[:, :n_blocks*block].reshape(len(self.fields), n_blocks, block).sum(axis=2)
+        self._blocks.append(*np.column_stack([self._pending_sum, block_sums]))
+        tail = rest[:, n_blocks*block:]
+        self._pending_sum = tail.sum(axis=1)
+        self._pending_count = tail.shape[1]
+
+    def mean(self, window):
+        '''
+        Average of the latest window seconds, one of the configured windows.
+        Returns
+            tuple of floats, one per field (NaN before any sample arrived)
+        '''
+        try:
+            window_size = self._window_sizes[self.windows.index(window)]
+        except ValueError:
+            raise ValueError('No averaging window of %s s, choose from %s' % (window, self.windows))
+        block_sums = self._blocks.last(window_size // self.block_size)
+        n_samples = len(block_sums[0]) * self.block_size
+        if n_samples == 0:
+            # Not a single complete block yet
+            if self._pending_count == 0:
+                return (np.nan,) * len(self.fields)
+            return tuple(self._pending_sum / self._pending_count)
+        return tuple(np.sum(s) / n_samples for s in block_sums)
@@ -0,0 +1,124 @@
+'''
+Conversion of GPI_RP gauge readings to pressures.
+
+Every 0.1 ms the data_collector core glues two 14-bit readings into one
+zero-padded uint32: bits 14-27 hold the absolute gauge and bits 0-13 the
+differential gauge, both as two's complement numbers.
+'''
+
+import numpy as np
+
+
+SAMPLE_RATE = 10000 # Hz, rate of packed gauge words from data_collector
+ADC_BITS = 14
+ADC_MASK = 2**ADC_BITS - 1
+ADC_SIGN_BIT = 2**(ADC_BITS - 1)
+
+
+def int_to_float(reading):
+    return 2/(2**14-1)*signed_conversion(reading)
+
+
+def signed_conversion(reading):
+    '''
+    Convert Red Pitaya binary output to a uint32.
+    '''
+    binConv = ''
+    if int(reading[0], 2) == 1:
+        for bit in reading[1::]:
+            if bit == '1':
+                binConv += '0'
+            else:
+                binConv += '1'
+        intNum = -int(binConv, 2) - 1
+    else:
+        for bit in reading[1::]:
+            binConv += bit
+        intNum = int(binConv, 2)
+    return intNum
+
+
+def abs_bin_to_torr(binary_string):
+    # Calibration for IN 1 of W7XRP2 with a 0.252 divider
+    abs_voltage = 0.0661+4.526*int_to_float(binary_string) #
+    # 500 Torr/Volt
+    return 500*abs_voltage
+
+
+def diff_bin_to_torr(binary_string):
+    # Calibration for IN 2 of W7XRP2 with a 0.342 divider
+    diff_voltage = 0.047+3.329*int_to_float(binary_string)
+    # 10 Torr/Volt
+    return 10*diff_voltage
+
+
+def abs_torr(combined_string):
+    abs_binary_string = '{0:032b}'.format(combined_string)[-28:-14]
+    return abs_bin_to_torr(abs_binary_string)
+
+
+def diff_torr(combined_string):
+    diff_binary_string = '{0:032b}'.format(combined_string)[-14:]
+    return diff_bin_to_torr(diff_binary_string)
+
+
+def counts_to_float(counts):
+    '''
+    Vectorized int_to_float for 14-bit two's complement ADC counts.
+    Parameters
+        counts: NumPy array of unsigned 14-bit values
+    Returns
+        NumPy float64 array of ADC readings in [-1, 1]
+    '''
+    signed = (np.asarray(counts, dtype=np.int32) ^ ADC_SIGN_BIT) - ADC_SIGN_BIT
+    return 2/(2**14-1)*signed
+
+
+def abs_counts_to_torr(counts):
+    # Same calibration as abs_bin_to_torr, operation order kept for identical results
+    return 500*(0.0661+4.526*counts_to_float(counts))
+
+
+def diff_counts_to_torr(counts):
+    # Same calibration as diff_bin_to_torr, operation order kept for identical results
+    return 10*(0.047+3.329*counts_to_float(counts))
+
+
+def decode_GPI_data(words):
+    '''
+    Convert a block of packed gauge words from get_GPI_data to pressures.
+    Gives exactly the same values as abs_torr and diff_torr applied per word.
+    Parameters
+        words: NumPy uint32 array (as returned by recv_vector)
+    Returns
+        tuple of NumPy float64 arrays: absolute and differential pressures (Torr)
+    '''
+    words = np.asarray(words, dtype=np.uint32)
+    abs_counts = (words >> ADC_BITS) & ADC_MASK
+    diff_counts = words & ADC_MASK
+    return abs_counts_to_torr(abs_counts), diff_counts_to_torr(diff_counts)
+
+
+def float_to_counts(readings):
+    '''
+    Inverse of counts_to_float: ADC readings in [-1, 1] to unsigned 14-bit
+    two's complement counts, rounded and clipped to the ADC range.
+    '''
+    signed = np.clip(np.round(np.asarray(readings)*(2**14-1)/2), -ADC_SIGN_BIT, ADC_SIGN_BIT - 1)
+    return (signed.astype(np.int64) & ADC_MASK).astype(np.uint32)
+
+
+def abs_torr_to_counts(pressures):
+    return float_to_counts((np.asarray(pressures)/500 - 0.0661)/4.526)
+
+
+def diff_torr_to_counts(pressures):
+    return float_to_counts((np.asarray(pressures)/10 - 0.047)/3.329)
+
+
+def encode_GPI_data(abs_pressures, diff_pressures):
+    '''
+    Pack pressures into gauge words like data_collector, inverse of decode_GPI_data
+    up to the ADC resolution.
+    '''
+    return (abs_torr_to_counts(abs_pressures) << ADC_BITS) | diff_torr_to_counts(diff_pressures)
@@ -0,0 +1,30 @@
+'''
+Display decimation of long high-rate traces.
+'''
+
+import numpy as np
+
+
+def minmax_envelope(x, y, n_bins):
+    '''
+    Reduce a trace to the minimum and maximum of each of n_bins equal bins,
+    e.g. one bin per pixel column, so that drawing it costs 2*n_bins points
+    however long it is and no spike is lost. The points are real samples,
+    kept in their original order.
+    Parameters
+        x: NumPy array, sample times
+        y: NumPy array, sample values
+        n_bins: int, number of bins (plot width in pixels)
+    Returns
+        tuple of NumPy arrays: decimated x and y (the inputs if already short)
+    '''
+    n_bins = max(int(n_bins), 1)
+    bin_size = len(y) // n_bins
+    if bin_size < 3:
+        return x, y
+    # Drop the oldest samples that do not fill a whole bin
+    start = len(y) - n_bins*bin_size
+    bins = y[start:].reshape(n_bins, bin_size)
+    extremes = np.sort(np.stack([bins.argmin(axis=1), bins.argmax(axis=1)], axis=1), axis=1)
+    idx = (extremes + start + bin_size*np.arange(n_bins)[:, None]).ravel()
+    return x[idx], y[idx]
@@ -0,0 +1,141 @@
+'''
+Continuous record of the raw GPI stream in memory-mapped segment files.
+
+Each segment is a preallocated .npy file of uint32 words next to a .idx
+file with one INDEX_DTYPE record per written block, so a segment can be
+read back while it is still being written:
+
+    words, index = read_segment('/path/raw_20190212_101500_000000.npy')
+'''
+
+import datetime
+import os
+import queue
+import threading
+
+import numpy as np
+
+from gpi.data import SAMPLE_RATE
+
+
+# Where each block starts in the segment, how many words it has, and the
+# sample count and time of its first word
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('index', '<u8'), ('time', '<f8')])
+
+
+def read_segment(path):
+    '''
+    Load a recorded segment without copying it into memory.
+    Parameters
+        path: str, .npy segment file
+    Returns
+        tuple: memory-mapped uint32 words (valid part only) and the block index
+    '''
+    index = np.fromfile(os.path.splitext(path)[0] + '.idx', dtype=INDEX_DTYPE)
+    words = np.load(path, mmap_mode='r')
+    n_words = int(index['offset'][-1] + index['length'][-1]) if len(index) else 0
+    return words[:n_words], index
+
+
+class Recorder(threading.Thread):
+    '''
+    Appends every raw get_GPI_data block to rotating segment files.
+
+    record() only queues the block, the writes happen on this thread so they
+    never stall acquisition. Blocks recorded after a write error or stop()
+    are dropped and counted in lost_samples. A new segment is started when the current one
+    is full or older than segment_duration seconds.
+    '''
+    def __init__(self, folder, segment_samples=600*SAMPLE_RATE, segment_duration=600, max_blocks=1000):
+        '''
+        Parameters
+            folder: str, directory for the segment files
+            segment_samples: int, words preallocated per segment
+            segment_duration: float, seconds before a segment is rotated
+            max_blocks: int, blocks queued before new ones are dropped
+        '''
+        super().__init__(name='GPI recorder', daemon=True)
+        self.folder = folder
+        self.segment_samples = int(segment_samples)
+        self.segment_duration = segment_duration
+        self.lost_samples = 0
+        self.error = None
+        self._blocks = queue.Queue(maxsize=max_blocks)
+        self._stopping = threading.Event()
+        self._segment = None
+
+    def record(self, block):
+        '''
+        Queue a gpi.acquisition.Block for writing. Never blocks.
+        '''
+        if self.error is not None or self._stopping.is_set():
+            self.lost_samples += len(block.words)
+            return
+        try:
+            self._blocks.put_nowait(block)
+        except queue.Full:
+            self.lost_samples += len(block.words)
+
+    def stop(self, timeout=5):
+        '''
+        Write the queued blocks and close the segment, waiting at most
+        timeout seconds. Returns at once if the writer already failed.
+        '''
+        self._stopping.set()
+        try:
+            self._blocks.put_nowait(None) # wakes the writer, which also stops once the queue is empty
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            while True:
+                try:
+                    block = self._blocks.get(timeout=0.1)
+                except queue.Empty:
+                    if self._stopping.is_set():
+                        break
+                    continue
+                if block is None:
+                    break
+                self._write(block)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._close_segment()
+
+    def _write(self, block):
+        words = np.asarray(block.words, dtype='uint32')
+        start_time, index = block.time, block.index
+        while len(words):
+            if self._segment is None or self._segment_pos == self.segment_samples or \
+               start_time - self._segment_start > self.segment_duration:
+                self._open_segment(start_time)
+            n = min(len(words), self.segment_samples - self._segment_pos)
+            self._segment[self._segment_pos:self._segment_pos+n] = words[:n]
+            np.array([(self._segment_pos, n, index, start_time)], dtype=INDEX_DTYPE).tofile(self._index_file)
+            self._index_file.flush()
+            self._segment_pos += n
+            words = words[n:]
+            start_time += n/SAMPLE_RATE
+            index += n
+
+    def _open_segment(self, start_time):
+        self._close_segment()
+        name = datetime.datetime.fromtimestamp(start_time).strftime('raw_%Y%m%d_%H%M%S_%f')
+        path = os.path.join(self.folder, name)
+        self._segment = np.lib.format.open_memmap(path + '.npy', mode='w+', dtype='uint32',
+                                                  shape=(self.segment_samples,))
+        self._index_file = open(path + '.idx', 'wb')
+        self._segment_pos = 0
+        self._segment_start = start_time
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.flush()
+        self._index_file.close()
+        self._segment = None
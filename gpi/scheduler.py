@@ -0,0 +1,97 @@
+'''
+Deadline-based task scheduling on top of the Tk event loop.
+'''
+
+import heapq
+import itertools
+import math
+import time
+
+
+class Task(object):
+    '''
+    A function due at deadline (time.time() seconds), repeated every period if set.
+    '''
+    def __init__(self, deadline, period, func, args):
+        self.deadline = deadline
+        self.period = period
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler(object):
+    '''
+    Runs periodic and one-shot tasks from the Tk event loop.
+
+    Tasks are kept in a heap ordered by deadline and a single root.after
+    timer is armed for the earliest one, so nothing runs (and no CPU is
+    used) between deadlines. Periodic tasks are rescheduled from their
+    previous deadline, not from the time they ran, so they do not drift.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self._heap = []
+        self._counter = itertools.count() # tie breaker for equal deadlines
+        self._after_id = None
+        self._armed_deadline = None
+
+    def every(self, period, func, *args, delay=None):
+        '''
+        Call func(*args) every period seconds, the first time after delay
+        seconds (default: one period).
+        '''
+        delay = period if delay is None else delay
+        return self._add(Task(time.time() + delay, period, func, args))
+
+    def at(self, deadline, func, *args):
+        '''
+        Call func(*args) once at the time.time() value deadline.
+        '''
+        return self._add(Task(deadline, None, func, args))
+
+    def stop(self):
+        for _, _, task in self._heap:
+            task.cancel()
+        self._heap = []
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _add(self, task):
+        heapq.heappush(self._heap, (task.deadline, next(self._counter), task))
+        self._arm()
+        return task
+
+    def _arm(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return
+        deadline = self._heap[0][0]
+        if self._after_id is not None:
+            if self._armed_deadline <= deadline:
+                return
+            self.root.after_cancel(self._after_id)
+        delay_ms = max(0, int(math.ceil((deadline - time.time())*1000)))
+        self._after_id = self.root.after(delay_ms, self._run_due)
+        self._armed_deadline = deadline
+
+    def _run_due(self):
+        self._after_id = None
+        now = time.time()
+        try:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, task = heapq.heappop(self._heap)
+                if task.cancelled:
+                    continue
+                if task.period is not None:
+                    # Skip missed periods instead of running them back to back
+                    task.deadline += task.period * (1 + (now - task.deadline) // task.period)
+                    heapq.heappush(self._heap, (task.deadline, next(self._counter), task))
+                task.func(*task.args)
+        finally:
+            self._arm()
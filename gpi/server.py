@@ -0,0 +1,344 @@
+'''
+Headless service that owns the GPI Red Pitaya and shares it with local clients.
+
+get_GPI_data drains the server queue, so only one process may read it. The
+GPIServer reads it for everyone: each subscriber gets every decoded block,
+and valve commands from all clients go through one lock onto a single
+connection. Run it with
+
+    python3 -m gpi.server [--host w7xrp2] [--record FOLDER] [--shm NAME]
+
+and use RemoteDriver and RemoteAcquisition in place of GPI_RP and
+Acquisition to talk to it. The socket lives in a directory private to the
+user ($XDG_RUNTIME_DIR), and clients must prove they know the key in the
+0600 file next to it (or $GPI_SERVER_AUTHKEY) before any message, which
+are pickles, is exchanged. With --shm the samples are also published in a
+gpi.shm ring, which consumers of the full-rate stream can read without
+copies.
+'''
+
+import argparse
+import os
+import queue
+import socket
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from gpi.acquisition import Acquisition
+
+
+# Unix socket the server listens on, in a directory only the user can write to
+RUNTIME_DIR = os.getenv('XDG_RUNTIME_DIR') or os.path.join(tempfile.gettempdir(), 'gpi-%d' % os.getuid())
+DEFAULT_ADDRESS = os.path.join(RUNTIME_DIR, 'gpi_server.sock')
+# Commands that must only be called by the server's acquisition thread
+STREAM_COMMANDS = ('get_GPI_data', 'get_GPI_data_index')
+
+
+def _check_owner(path, private=False):
+    '''
+    Raise PermissionError unless path belongs to the current user and, if
+    private, nobody else can access it (otherwise nobody else can write it).
+    '''
+    st = os.lstat(path)
+    if st.st_uid != os.getuid():
+        raise PermissionError('%s is not owned by the current user' % path)
+    if st.st_mode & (0o077 if private else 0o022):
+        raise PermissionError('%s is accessible by other users' % path)
+
+
+def _load_authkey(address, create=False):
+    '''
+    Key shared by the server at address and its clients: $GPI_SERVER_AUTHKEY,
+    else the contents of address + '.key', made by the server if create.
+    '''
+    if os.getenv('GPI_SERVER_AUTHKEY'):
+        return os.getenv('GPI_SERVER_AUTHKEY').encode()
+    path = address + '.key'
+    if create and not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+    _check_owner(path, private=True)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _connect(address):
+    '''
+    Open an authenticated connection to the GPIServer at address, after
+    checking that its socket and directory belong to the current user.
+    '''
+    _check_owner(os.path.dirname(os.path.abspath(address)))
+    _check_owner(address)
+    return Client(address, family='AF_UNIX', authkey=_load_authkey(address))
+
+
+def _remove_stale_socket(address):
+    '''
+    Delete the socket file left behind by a server that was killed, but
+    refuse to take over the address of a server that is still running.
+    '''
+    if not os.path.exists(address):
+        return
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+    except (ConnectionRefusedError, FileNotFoundError):
+        if os.path.exists(address):
+            os.unlink(address)
+    else:
+        raise RuntimeError('A GPI server is already listening on %s' % address)
+    finally:
+        probe.close()
+
+
+class _Subscriber(threading.Thread):
+    '''
+    Sends the blocks published to it down one client connection.
+
+    If the client falls behind, the oldest queued block is dropped; the
+    client sees it as a jump in the sample count.
+    '''
+    def __init__(self, conn, max_blocks):
+        super().__init__(name='GPI subscriber', daemon=True)
+        self.conn = conn
+        self.blocks = queue.Queue(maxsize=max_blocks)
+        self.closed = False
+
+    def publish(self, block):
+        while True:
+            try:
+                self.blocks.put_nowait(block)
+                return
+            except queue.Full:
+                try:
+                    self.blocks.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        try:
+            while True:
+                block = self.blocks.get()
+                if block is None:
+                    break
+                self.conn.send(block)
+        except (OSError, EOFError):
+            pass # client went away
+        finally:
+            self.closed = True
+            self.conn.close()
+
+
+class GPIServer(object):
+    '''
+    Fans the acquisition stream out to subscribers and serializes commands.
+
+    A client opens a connection to address and sends 'subscribe' to receive
+    gpi.acquisition.Block objects, or 'commands' to then send (name, args)
+    requests, each answered with (True, result) or (False, exception).
+    '''
+    def __init__(self, driver, connect_driver, address=DEFAULT_ADDRESS, max_blocks=100, sinks=()):
+        '''
+        Parameters
+            driver: GPI_RP driver used for the commands
+            connect_driver: callable returning a new GPI_RP driver for the acquisition thread
+            address: str, path of the Unix socket to listen on
+            max_blocks: int, blocks queued per subscriber before the oldest is dropped
+            sinks: sequence of callables taking each Block, e.g. Recorder.record
+        '''
+        self.driver = driver
+        self.address = address
+        self.max_blocks = max_blocks
+        # Blocks are only handed out through _publish, lost_samples stays 0.
+        # They carry the status registers, so clients never have to ask for them.
+        self.acquisition = Acquisition(connect_driver, max_blocks=0, sinks=[self._publish] + list(sinks),
+                                       read_status=True)
+        self._command_lock = threading.Lock()
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._closing = False
+        folder = os.path.dirname(os.path.abspath(address))
+        os.makedirs(folder, 0o700, exist_ok=True)
+        _check_owner(folder)
+        self._authkey = _load_authkey(address, create=True)
+        _remove_stale_socket(address)
+        self._listener = Listener(address, family='AF_UNIX', authkey=self._authkey)
+
+    def serve_forever(self):
+        self.acquisition.start()
+        try:
+            while not self._closing:
+                try:
+                    conn = self._listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    continue # peer without the key, or gone during the handshake
+                if self._closing:
+                    conn.close()
+                    break
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self.acquisition.stop()
+            with self._subscribers_lock:
+                for subscriber in self._subscribers:
+                    subscriber.publish(None)
+            self._listener.close()
+
+    def close(self):
+        '''
+        Make serve_forever return. Can be called from any thread.
+        '''
+        self._closing = True
+        wake = socket.socket(socket.AF_UNIX) # accept() returns once the handshake fails
+        try:
+            wake.connect(self.address)
+        except OSError:
+            pass # already stopped
+        finally:
+            wake.close()
+
+    def _publish(self, block):
+        with self._subscribers_lock:
+            self._subscribers = [s for s in self._subscribers if not s.closed]
+            for subscriber in self._subscribers:
+                subscriber.publish(block)
+
+    def _handle(self, conn):
+        try:
+            kind = conn.recv()
+        except (OSError, EOFError):
+            conn.close()
+            return
+        if kind == 'subscribe':
+            subscriber = _Subscriber(conn, self.max_blocks)
+            with self._subscribers_lock:
+                self._subscribers.append(subscriber)
+            subscriber.start()
+        elif kind == 'commands':
+            self._serve_commands(conn)
+        else:
+            conn.close()
+
+    def _serve_commands(self, conn):
+        try:
+            while True:
+                name, args = conn.recv()
+                try:
+                    if name.startswith('_') or name in STREAM_COMMANDS:
+                        raise ValueError('%s cannot be called through the GPI server' % name)
+                    with self._command_lock:
+                        reply = (True, getattr(self.driver, name)(*args))
+                except Exception as e:
+                    reply = (False, e)
+                conn.send(reply)
+        except (OSError, EOFError):
+            pass # client went away
+        finally:
+            conn.close()
+
+
+class RemoteDriver(object):
+    '''
+    Stand-in for GPI_RP that runs every command through a GPIServer.
+    '''
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self._lock = threading.Lock()
+        self._conn = _connect(address)
+        self._conn.send('commands')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        def method(*args):
+            with self._lock:
+                self._conn.send((name, args))
+                ok, result = self._conn.recv()
+            if not ok:
+                raise result
+            return result
+        return method
+
+
+class RemoteAcquisition(Acquisition):
+    '''
+    Acquisition that receives its blocks from a GPIServer instead of the device.
+
+    Blocks the server had to drop for this client are counted in lost_samples,
+    samples the Red Pitaya dropped in dropped_samples, as for Acquisition.
+    status follows the status registers the server reads with the blocks.
+    '''
+    def __init__(self, address=DEFAULT_ADDRESS, max_blocks=100, sinks=()):
+        '''
+        Parameters
+            address: str, Unix socket of the GPIServer
+            max_blocks: int, blocks held before the oldest is dropped
+            sinks: sequence of callables taking each Block
+        '''
+        super().__init__(None, max_blocks=max_blocks, sinks=sinks)
+        self.address = address
+
+    def run(self):
+        try:
+            with _connect(self.address) as conn:
+                conn.send('subscribe')
+                while not self._stop_event.is_set():
+                    if not conn.poll(0.1):
+                        continue
+                    block = conn.recv()
+                    if self.next_index is not None and block.index >= self.next_index:
+                        self.lost_samples += block.index - block.gap - self.next_index
+                    self.dropped_samples += block.gap
+                    self.next_index = block.index + len(block.words)
+                    if block.status is not None:
+                        self.status = block.status
+                    for sink in self.sinks:
+                        sink(block)
+                    self._put(block)
+        except Exception as e:
+            self.error = e
+
+
+def main():
+    # Imported here so that the clients above work without the koheron package
+    import koheron
+    from GPI_RP.GPI_RP import GPI_RP
+    from gpi.recorder import Recorder
+    from gpi.shm import SharedRingWriter
+
+    parser = argparse.ArgumentParser(description='Share the GPI Red Pitaya with local clients.')
+    parser.add_argument('--host', default=os.getenv('HOST', 'w7xrp2'), help='hostname of the Red Pitaya')
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help='Unix socket to listen on')
+    parser.add_argument('--record', metavar='FOLDER', help='also record the raw stream to FOLDER')
+    parser.add_argument('--shm', metavar='NAME', help='also publish the samples in shared memory NAME')
+    args = parser.parse_args()
+
+    driver = GPI_RP(koheron.connect(args.host, name='GPI_RP'))
+    sinks = []
+    recorder = None
+    if args.record:
+        recorder = Recorder(args.record)
+        recorder.start()
+        sinks.append(recorder.record)
+    ring = None
+    if args.shm:
+        ring = SharedRingWriter(args.shm)
+        sinks.append(ring.record)
+    server = GPIServer(driver, lambda: GPI_RP(koheron.KoheronClient(args.host)), args.address, sinks=sinks)
+    print('Serving GPI_RP on %s at %s' % (args.host, args.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if recorder:
+            recorder.stop()
+        if ring:
+            ring.close()
+        if server.acquisition.error:
+            print('Acquisition stopped: %s' % server.acquisition.error)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+Shared-memory ring of decoded GPI samples for local consumers.
+
+One writer (the acquisition) appends a RECORD_DTYPE record per sample; any
+number of readers in other processes map the same memory and follow it
+with their own cursor, without locks and without copying the samples:
+
+    ring = SharedRingWriter('gpi')           # e.g. as an Acquisition sink
+    reader = SharedRingReader('gpi')         # in another process
+    records = reader.read()                  # new samples since the last call
+    latest = reader.latest(5)                # or simply the last 5 s
+
+Like RingBuffer, every record is stored twice so that any run of up to
+capacity records is one contiguous view. The header holds two sample
+counts: reserved is raised before a batch is written and head after, so
+a reader knows which records are complete and which may be overwritten.
+This relies on aligned 8-byte stores being atomic and seen in order by
+other processes, as on x86-64.
+'''
+
+import os
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from gpi.data import SAMPLE_RATE
+
+
+RECORD_DTYPE = np.dtype([('index', '<u8'), ('abs', '<f8'), ('diff', '<f8'), ('word', '<u4')], align=True)
+HEADER_DTYPE = np.dtype([('capacity', '<u8'), ('reserved', '<u8'), ('head', '<u8')])
+HEADER_SIZE = 64 # bytes, records start on a cache line
+
+
+def _map(shm):
+    buf = shm.buf
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buf)
+    capacity = int(header['capacity'])
+    records = np.ndarray((2*capacity,), dtype=RECORD_DTYPE, buffer=buf, offset=HEADER_SIZE)
+    return header, records, capacity
+
+
+class SharedRingWriter(object):
+    '''
+    Creates the shared ring and appends gpi.acquisition.Block samples to it.
+    '''
+    def __init__(self, name, capacity=60*SAMPLE_RATE):
+        '''
+        Parameters
+            name: str, name of the shared memory block
+            capacity: int, records kept (default one minute)
+        '''
+        size = HEADER_SIZE + 2*int(capacity)*RECORD_DTYPE.itemsize
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that crashed before close()
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        np.ndarray((), dtype=HEADER_DTYPE, buffer=self._shm.buf)['capacity'] = capacity
+        self._header, self._records, self.capacity = _map(self._shm)
+        self.name = name
+
+    def record(self, block):
+        '''
+        Append all samples of a block. Same signature as Recorder.record so
+        it can be an Acquisition sink.
+        '''
+        self.write(block.index, block.abs_pressures, block.diff_pressures, block.words)
+
+    def write(self, index, abs_pressures, diff_pressures, words):
+        '''
+        Append consecutive samples starting at sample count index.
+        '''
+        n = len(words)
+        if n > self.capacity:
+            index += n - self.capacity
+            abs_pressures, diff_pressures, words = (a[-self.capacity:] for a in (abs_pressures, diff_pressures, words))
+            n = self.capacity
+        if n == 0:
+            return
+        head = int(self._header['head'])
+        # Readers must see reserved raised before the records change and head
+        # raised after: plain stores are enough as x86-64 does not reorder
+        # them, other architectures would need a memory barrier here
+        self._header['reserved'] = head + n
+        batch = np.empty(n, dtype=RECORD_DTYPE)
+        batch['index'] = index + np.arange(n, dtype='uint64')
+        batch['abs'] = abs_pressures
+        batch['diff'] = diff_pressures
+        batch['word'] = words
+        cap = self.capacity
+        start = head % cap
+        end = start + n
+        self._records[start:end] = batch
+        if end <= cap:
+            self._records[start+cap:end+cap] = batch
+        else:
+            self._records[start+cap:] = batch[:cap-start]
+            self._records[:end-cap] = batch[cap-start:]
+        self._header['head'] = head + n # publishes the records, see above
+
+    def close(self):
+        '''
+        Release and remove the shared memory. Readers keep their mapping.
+        '''
+        del self._header, self._records
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedRingReader(object):
+    '''
+    Follows a SharedRingWriter from any process with its own read cursor.
+
+    The returned arrays are views into the shared memory: they are only
+    guaranteed to hold the same samples until the writer has written
+    capacity more records, so copy whatever has to be kept longer.
+    Samples overwritten before this reader got to them are counted in
+    lost_samples.
+    '''
+    def __init__(self, name):
+        '''
+        Parameters
+            name: str, name of the shared memory block
+        '''
+        try:
+            self._shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Before Python 3.13 every process that attaches also registers
+            # the block and would remove it when it exits
+            self._shm = shared_memory.SharedMemory(name)
+            if os.name == 'posix': # tracked under the name with its leading /
+                resource_tracker.unregister('/' + self._shm.name.lstrip('/'), 'shared_memory')
+        self._header, self._records, self.capacity = _map(self._shm)
+        self.cursor = int(self._header['head']) # only samples written from now on
+        self.lost_samples = 0
+        self._last_start = self.cursor
+
+    def read(self):
+        '''
+        Records written since the last call, oldest first.
+        Returns
+            NumPy array of RECORD_DTYPE (a view)
+        '''
+        # Load head before reserved, the reverse of the writer's store order
+        # (relies on x86-64 ordering, see SharedRingWriter.write)
+        head = int(self._header['head'])
+        oldest = int(self._header['reserved']) - self.capacity
+        if self.cursor < oldest:
+            self.lost_samples += oldest - self.cursor
+            self.cursor = oldest
+        records = self._view(head, head - self.cursor)
+        self.cursor = head
+        return records
+
+    def latest(self, seconds, sample_rate=SAMPLE_RATE):
+        '''
+        The most recent seconds of records, fewer if not available. Does not
+        move the cursor.
+        Returns
+            NumPy array of RECORD_DTYPE (a view)
+        '''
+        head = int(self._header['head'])
+        available = head - max(int(self._header['reserved']) - self.capacity, 0)
+        return self._view(head, min(int(seconds*sample_rate), available))
+
+    def overrun(self):
+        '''
+        True if the writer may have overwritten some of the records returned
+        by the last read() or latest() call since, i.e. a copy taken now
+        cannot be trusted.
+        '''
+        return int(self._header['reserved']) - self.capacity > self._last_start
+
+    def _view(self, head, n):
+        self._last_start = head - n
+        stop = head % self.capacity + self.capacity
+        return self._records[stop-n:stop]
+
+    def close(self):
+        del self._header, self._records
+        self._shm.close()
@@ -0,0 +1,310 @@
+'''
+Simulated Red Pitaya with a model of the GPI plenum, for testing without the board.
+
+SimulatedRedPitaya has the same commands as the GPI_RP driver. The plenum
+pressure follows the valves (V5 fills from the gas supply, V4 pumps out,
+V7 vents and FV2 puffs into the vessel), the gauges read it back with
+noise, and get_GPI_data returns packed gauge words at sample_rate with
+the server's queue behaviour: samples pile up between calls and the
+oldest are dropped past queue_size. Every command can be delayed by an
+injected network latency and jitter.
+
+    HOST=simulator python3 gui.py
+
+with GPI_SIM_RATE (Hz), GPI_SIM_LATENCY and GPI_SIM_JITTER (s) to change
+sample_rate, latency and jitter.
+'''
+
+import threading
+import time
+
+import numpy as np
+
+from gpi.data import SAMPLE_RATE, encode_GPI_data
+from GPI_RP.GPI_RP import STATUS_REGISTERS, STATUS_DTYPE
+
+
+ATMOSPHERE = 760 # Torr
+# Valve conductances (L/s) and the pressure (Torr) on their far side
+VALVES = {
+    'V5': (0.5, 1500), # gas supply
+    'V4': (0.5, 0), # mechanical pump
+    'V7': (0.5, ATMOSPHERE), # vent
+    'FV2': (0.05, 0), # fast valve into the vessel
+}
+
+
+class SimulatedRedPitaya(object):
+    '''
+    Stand-in for GPI_RP driven by a plenum model.
+
+    The model runs on the samples: every call first advances it to the
+    current time, integrating the pressure exactly over each stretch with
+    constant valve states. The puff timer works like the hardware, FV2 is
+    open from fast_delay_k to fast_delay_k + fast_duration_k ms after
+    send_T1 if fast_permission_k is set and the safe state is off.
+    '''
+    def __init__(self, sample_rate=SAMPLE_RATE, queue_size=50000, latency=0, jitter=0,
+                 pressure=ATMOSPHERE, plenum_volume=0.802, abs_noise=0.2, diff_noise=0.005,
+                 abs_offset=-0.5, clock=time.time, seed=None):
+        '''
+        Parameters
+            sample_rate: float, gauge words per second (10 kHz on the board)
+            queue_size: int, samples kept between get_GPI_data calls
+            latency: float, seconds added to every command
+            jitter: float, up to this many seconds more, uniformly distributed
+            pressure: float, initial plenum pressure (Torr)
+            plenum_volume: float, plenum volume (L)
+            abs_noise, diff_noise: float, RMS noise of the gauges (Torr)
+            abs_offset: float, zero offset of the absolute gauge (Torr)
+            clock: callable returning the time in seconds
+            seed: int, seed of the noise and jitter
+        '''
+        self.sample_rate = sample_rate
+        self.queue_size = int(queue_size)
+        self.latency = latency
+        self.jitter = jitter
+        self.plenum_volume = plenum_volume
+        self.abs_noise = abs_noise
+        self.diff_noise = diff_noise
+        self.abs_offset = abs_offset
+        self.clock = clock
+        self.W7X_permission = 1
+        self.pressure = float(pressure)
+        self.reference_pressure = float(pressure) # behind V3, what the diff gauge compares to
+        self.control = dict.fromkeys(['led', 'GPI_safe_state', 'slow_1_manual', 'slow_2_manual',
+                                      'slow_3_manual', 'slow_4_manual', 'fast_manual',
+                                      'fast_permission_1', 'fast_permission_2', 'fast_delay_1',
+                                      'fast_delay_2', 'fast_duration_1', 'fast_duration_2',
+                                      'send_T1', 'reset_time', 'analog_out'], 0)
+        self._rng = np.random.RandomState(seed)
+        self._lock = threading.Lock() # the GUI and acquisition threads share one instance
+        self._start = clock()
+        self._samples = 0 # samples produced since the start
+        self._T1_sample = None
+        self._fast_open = False
+        self._queue = np.zeros(0, dtype='uint32')
+        self._last_word = encode_GPI_data(pressure, 0)
+        self._data_index = 0
+
+    # Valve and puff controls
+
+    def set_led(self, led):
+        self._write('led', led)
+
+    def set_analog_out(self, analog_out):
+        self._write('analog_out', analog_out)
+
+    def set_GPI_safe_state(self, state):
+        self._write('GPI_safe_state', state)
+
+    def set_slow_1(self, state):
+        self._write('slow_1_manual', state)
+
+    def set_slow_2(self, state):
+        self._write('slow_2_manual', state)
+
+    def set_slow_3(self, state):
+        self._write('slow_3_manual', state)
+
+    def set_slow_4(self, state):
+        self._write('slow_4_manual', state)
+
+    def set_fast(self, state):
+        self._write('fast_manual', state)
+
+    def set_fast_permission_1(self, state):
+        self._write('fast_permission_1', state)
+
+    def set_fast_permission_2(self, state):
+        self._write('fast_permission_2', state)
+
+    def set_fast_delay_1(self, state):
+        self._write('fast_delay_1', state)
+
+    def set_fast_delay_2(self, state):
+        self._write('fast_delay_2', state)
+
+    def set_fast_duration_1(self, state):
+        self._write('fast_duration_1', state)
+
+    def set_fast_duration_2(self, state):
+        self._write('fast_duration_2', state)
+
+    def reset_time(self, state):
+        self._write('reset_time', state)
+
+    def send_T1(self, state):
+        with self._lock:
+            self._advance()
+            if state and not self.control['send_T1']:
+                self._T1_sample = self._samples
+            self.control['send_T1'] = state
+        self._network_delay()
+
+    # Data
+
+    def get_GPI_data(self, out=None):
+        with self._lock:
+            self._advance()
+            words, self._queue = self._queue, np.zeros(0, dtype='uint32')
+            self._data_index = self._samples - len(words)
+        self._network_delay()
+        if out is not None:
+            if len(words) > len(out):
+                raise ValueError('Output array too small: %d elements received.' % len(words))
+            out[:len(words)] = words
+            return out[:len(words)]
+        return words
+
+    def get_GPI_data_index(self):
+        self._network_delay()
+        return self._data_index
+
+    def get_buffer_length(self):
+        return self._read()['buffer_length']
+
+    def get_fifo_length(self):
+        self._network_delay()
+        return 0
+
+    def reset_fifo(self):
+        self._network_delay()
+
+    # Status registers
+
+    def get_status_registers(self):
+        status = self._read()
+        return np.array([status.get(name, 0) for name in STATUS_REGISTERS], dtype='uint32')
+
+    def get_status(self):
+        return self.get_status_registers().view(STATUS_DTYPE)[0]
+
+    def get_W7X_permission(self):
+        return self._read()['W7X_permission']
+
+    def get_analog_out(self):
+        return self._read()['analog_out_sts']
+
+    def get_abs_gauge(self):
+        return self._read()['abs_gauge']
+
+    def get_diff_gauge(self):
+        return self._read()['diff_gauge']
+
+    def get_analog_input_0(self):
+        return self._read()['analog_input_0']
+
+    def get_analog_input_1(self):
+        return self._read()['analog_input_1']
+
+    def get_slow_1_sts(self):
+        return self._read()['slow_1_sts']
+
+    def get_slow_2_sts(self):
+        return self._read()['slow_2_sts']
+
+    def get_slow_3_sts(self):
+        return self._read()['slow_3_sts']
+
+    def get_slow_4_sts(self):
+        return self._read()['slow_4_sts']
+
+    def get_fast_sts(self):
+        return self._read()['fast_sts']
+
+    def _write(self, register, value):
+        with self._lock:
+            self._advance() # the old valve states hold until now
+            self.control[register] = value
+        self._network_delay()
+
+    def _read(self):
+        with self._lock:
+            self._advance()
+            word = int(self._last_word)
+            status = {
+                'W7X_T1': self.control['send_T1'],
+                'W7X_permission': self.W7X_permission,
+                'abs_gauge': (word >> 14) & 0x3FFF,
+                'diff_gauge': word & 0x3FFF,
+                'slow_1_sts': self.control['slow_1_manual'],
+                'slow_2_sts': self.control['slow_2_manual'],
+                'slow_3_sts': self.control['slow_3_manual'],
+                'slow_4_sts': self.control['slow_4_manual'],
+                'fast_sts': int(self._fast_open),
+                'analog_out_sts': self.control['analog_out'],
+                'buffer_length': len(self._queue),
+            }
+        self._network_delay()
+        return status
+
+    def _network_delay(self):
+        delay = self.latency + self.jitter*self._rng.random_sample()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _advance(self):
+        '''
+        Run the model up to the current time and queue the new gauge words.
+        '''
+        n = int((self.clock() - self._start)*self.sample_rate) - self._samples
+        if n <= 0:
+            return
+        # Samples that would be dropped from the queue only move the model on
+        skipped = max(0, n - self.queue_size)
+        if skipped:
+            self._integrate(skipped)
+        plenum, reference = self._integrate(n - skipped)
+        abs_pressures = plenum + self.abs_offset + self.abs_noise*self._rng.standard_normal(len(plenum))
+        diff_pressures = plenum - reference + self.diff_noise*self._rng.standard_normal(len(plenum))
+        words = encode_GPI_data(abs_pressures, diff_pressures)
+        self._queue = np.concatenate([self._queue, words])[-self.queue_size:]
+        self._last_word = words[-1]
+
+    def _integrate(self, n):
+        '''
+        Plenum and reference pressures of the next n samples.
+        '''
+        samples = self._samples + 1 + np.arange(n)
+        fast_open = self._fast_valve(samples)
+        # Stretches with constant valve states
+        edges = np.concatenate([[0], np.flatnonzero(np.diff(fast_open)) + 1, [n]])
+        plenum = np.empty(n)
+        for start, stop in zip(edges[:-1], edges[1:]):
+            plenum[start:stop] = self._relax(stop - start, fast_open[start])
+        # V3 (slow_3) is open when its signal is 0, the reference then follows the plenum
+        if self.control['slow_3_manual']:
+            reference = np.full(n, self.reference_pressure)
+        else:
+            reference = plenum
+            self.reference_pressure = self.pressure
+        self._samples += n
+        self._fast_open = bool(fast_open[-1])
+        return plenum, reference
+
+    def _relax(self, n, fast_open):
+        '''
+        Exact solution of V dP/dt = sum C (P_valve - P) over n samples.
+        '''
+        is_open = {'V5': self.control['slow_1_manual'], 'V4': self.control['slow_2_manual'],
+                   'V7': self.control['slow_4_manual'], 'FV2': fast_open}
+        conductance = sum(VALVES[v][0] for v in VALVES if is_open[v])
+        if conductance == 0:
+            return np.full(n, self.pressure)
+        equilibrium = sum(VALVES[v][0]*VALVES[v][1] for v in VALVES if is_open[v]) / conductance
+        decay = np.exp(-conductance/self.plenum_volume/self.sample_rate*np.arange(1, n + 1))
+        pressures = equilibrium + (self.pressure - equilibrium)*decay
+        self.pressure = pressures[-1]
+        return pressures
+
+    def _fast_valve(self, samples):
+        is_open = np.full(len(samples), bool(self.control['fast_manual']))
+        if self._T1_sample is not None and not self.control['GPI_safe_state']:
+            t_ms = (samples - self._T1_sample)*1000/self.sample_rate
+            for k in (1, 2):
+                if self.control['fast_permission_%d' % k]:
+                    delay = self.control['fast_delay_%d' % k]
+                    duration = self.control['fast_duration_%d' % k]
+                    is_open |= (t_ms >= delay) & (t_ms < delay + duration)
+        return is_open
@@ -11,92 +11,57 @@ import os
 import time
 import math
 import datetime
+import contextlib
+import multiprocessing
+from multiprocessing import AuthenticationError
+from concurrent.futures import ProcessPoolExecutor
 import koheron 
-from GPI_RP.GPI_RP import GPI_RP
+from GPI_RP.GPI_RP import GPI_RP, STATUS_DTYPE
+from gpi.data import SAMPLE_RATE, abs_counts_to_torr, diff_counts_to_torr
+from gpi.buffers import RingBuffer, RollingAverage
+from gpi.decimate import minmax_envelope
+from gpi.acquisition import Acquisition, block_times
+from gpi.scheduler import Scheduler
+from gpi.recorder import Recorder
+from gpi.server import DEFAULT_ADDRESS, RemoteDriver, RemoteAcquisition
+from gpi.simulator import SimulatedRedPitaya
+from gpi.analysis import save_puff_plot
 import numpy as np
-from scipy.interpolate import interp1d
-from scipy.misc import derivative
-from scipy.signal import medfilt
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
 
-HOST = 'w7xrp2' # hostname of red pitaya being used
-UPDATE_INTERVAL = 1  # seconds between plot updates
+HOST = 'w7xrp2' # hostname of red pitaya being used, 'simulator' for a SimulatedRedPitaya
+# SimulatedRedPitaya settings, e.g. GPI_SIM_RATE=1e6 GPI_SIM_LATENCY=0.005 HOST=simulator python3 gui.py
+SIMULATOR_RATE = float(os.getenv('GPI_SIM_RATE', SAMPLE_RATE)) # Hz, gauge words per second
+SIMULATOR_LATENCY = float(os.getenv('GPI_SIM_LATENCY', 0)) # seconds added to every command
+SIMULATOR_JITTER = float(os.getenv('GPI_SIM_JITTER', 0)) # seconds, up to this much more per command
+UPDATE_INTERVAL = 1  # seconds between averaged readings for the labels and pump logic
+PLOT_INTERVAL = 0.1 # seconds between plot refreshes
+POLL_INTERVAL = 0.1 # seconds between reads of the acquisition queue
 CONTROL_INTERVAL = 0.2 # seconds between pump/fill loop iterations
+STATUS_INTERVAL = 0.1 # seconds between read backs of the valve states
 PLOT_TIME_RANGE = 30 # seconds of history shown in plots
+FILL_AVERAGE = 0.1 # seconds, running average compared with the desired fill pressure
+AVERAGE_WINDOWS = (0.01, FILL_AVERAGE, UPDATE_INTERVAL) # seconds, running averages kept of the fast readings
 DEFAULT_PUFF = 0.05  # seconds duration for each puff 
 PRETRIGGER = 10 # seconds between T0 and T1
+MAX_PUFF_START = 20 # seconds after T1, latest puff start accepted
+MAX_PUFF_DURATION = 2 # seconds, puffs must be shorter
+# Seconds from T0 to the end of the saved shot window (which starts 1 s
+# before T1 and ends 2 s after the last puff)
+SHOT_WINDOW = PRETRIGGER + MAX_PUFF_START + MAX_PUFF_DURATION + 3
 FILL_MARGIN = 5 # Torr, stop this amount short of desired fill pressure to avoid overshoot
 MECH_PUMP_LIMIT = 770 # Torr, max pressure the mechanical pump should work on
 PUMPED_OUT = 0 # Torr, desired pumped out pressure
 PLENUM_VOLUME = 0.802 # L 
 SAVE_FOLDER = '/usr/local/cmod/codes/spectroscopy/gpi/W7X/diff_pressures/' # for puff pressure data
+RECORD_FOLDER = '/usr/local/cmod/codes/spectroscopy/gpi/W7X/raw_data/' # for the continuous 10 kHz record
+VALVE_STATUS_REGISTERS = {'V5': 'slow_1_sts', 'V4': 'slow_2_sts', 'V3': 'slow_3_sts', 
+                          'V7': 'slow_4_sts', 'FV2': 'fast_sts'}
 
 
-def int_to_float(reading):
-    return 2/(2**14-1)*signed_conversion(reading)
-    
-    
-def signed_conversion(reading):
-    '''
-    Convert Red Pitaya binary output to a uint32.
-    '''
-    binConv = ''
-    if int(reading[0], 2) == 1:
-        for bit in reading[1::]:
-            if bit == '1':
-                binConv += '0'
-            else:
-                binConv += '1'
-        intNum = -int(binConv, 2) - 1
-    else:
-        for bit in reading[1::]:
-            binConv += bit
-        intNum = int(binConv, 2)
-    return intNum
-    
-    
-def abs_bin_to_torr(binary_string):
-    # Calibration for IN 1 of W7XRP2 with a 0.252 divider 
-    abs_voltage = 0.0661+4.526*int_to_float(binary_string) # 
-    # 500 Torr/Volt
-    return 500*abs_voltage
-    
-    
-def diff_bin_to_torr(binary_string):
-    # Calibration for IN 2 of W7XRP2 with a 0.342 divider
-    diff_voltage = 0.047+3.329*int_to_float(binary_string) 
-    # 10 Torr/Volt
-    return 10*diff_voltage
-    
-    
-def abs_torr(combined_string):
-    abs_binary_string = '{0:032b}'.format(combined_string)[-28:-14]
-    return abs_bin_to_torr(abs_binary_string)
-    
-    
-def diff_torr(combined_string):
-    diff_binary_string = '{0:032b}'.format(combined_string)[-14:]
-    return diff_bin_to_torr(diff_binary_string)
-    
-    
-def find_nearest(array, value):
-    '''
-    Find index of first value in an ORDERED array closest to given value.
-    Parameters
-        array: NumPy array
-        value: int or float
-    Returns
-        int: argument of array value closest to value supplied
-    '''
-    idx = np.searchsorted(array, value, side='left')
-    if idx > 0 and (idx == len(array) or np.fabs(value - array[idx-1]) < np.fabs(value - array[idx])):
-        return idx-1
-    return idx
-        
-        
 class FakeRedPitaya(object):
     '''
     Lets the GUI window open even if Red Pitaya cannot be reached.
@@ -108,6 +73,9 @@ class FakeRedPitaya(object):
         def method(*args):
             return 0
         return method
+        
+    def get_status(self):
+        return np.zeros((), dtype=STATUS_DTYPE)
 
 
 class GUI:
@@ -178,7 +146,8 @@ class GUI:
         
         permission_controls_frame = tk.Frame(controls_frame, background=gray)
         W7X_permission_label = tk.Label(permission_controls_frame, text='W7-X permission', background=gray)
-        W7X_permission_check = tk.Checkbutton(permission_controls_frame, background=gray, state=tk.DISABLED)
+        self.W7X_permission = tk.IntVar()
+        W7X_permission_check = tk.Checkbutton(permission_controls_frame, background=gray, state=tk.DISABLED, variable=self.W7X_permission)
         
         GPI_safe_state_label = tk.Label(permission_controls_frame, text='GPI safe state', background=gray)
         self.GPI_safe_status = tk.IntVar()
@@ -187,22 +156,33 @@ class GUI:
         action_controls_frame = tk.Frame(controls_frame, background=gray)
         GPI_T0_button = ttk.Button(action_controls_frame, text='T0 trigger', width=10, command=self.handle_T0)
         
-        self.pressure_times = []
-        self.abs_pressures = []
-        self.diff_pressures = []
-        self.pressure_avg_times = []
-        self.abs_avg_pressures = []
-        self.diff_avg_pressures = []
-        
         self.fig = Figure(figsize=(3.5, 6), dpi=100, facecolor=gray)
         self.fig.subplots_adjust(left=0.2)
         # Absolute pressure plot matplotlib setup
         self.ax_abs = self.fig.add_subplot(211)
+        self.ax_abs.yaxis.tick_right()
+        self.ax_abs.yaxis.set_label_position('right')
+        self.ax_abs.set_ylabel('Torr')
+        plt.setp(self.ax_abs.get_xticklabels(), visible=False)
+        self.ax_abs.grid(True, color='#c9dae5')
+        self.ax_abs.patch.set_facecolor('#e3eff7')
         # Differential pressure plot matplotlib setup
-        self.ax_diff = self.fig.add_subplot(212)
+        self.ax_diff = self.fig.add_subplot(212, sharex=self.ax_abs)
+        self.ax_diff.yaxis.tick_right()
+        self.ax_diff.yaxis.set_label_position('right')
+        self.ax_diff.set_ylabel('Torr')
+        self.ax_diff.set_xlabel('Seconds')
+        self.ax_diff.grid(True, color='#e5d5c7')
+        self.ax_diff.patch.set_facecolor('#f7ebe1')
+        self.ax_diff.set_xlim(-PLOT_TIME_RANGE, 0)
+        # Lines are only redrawn on top of the cached background (blitting)
+        self.abs_line, = self.ax_abs.plot([], [], c='C0', linewidth=2, animated=True)
+        self.diff_line, = self.ax_diff.plot([], [], c='C1', linewidth=2, animated=True)
+        self.plot_background = None
         # Plot tkinter setup
         self.fig.set_tight_layout(True)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
+        self.canvas.mpl_connect('draw_event', self._cache_plot_background)
         self.canvas.draw()
         
         # I use this to figure out valve label positions
@@ -273,24 +253,63 @@ class GUI:
         
         try:
             GPI_host = os.getenv('HOST', HOST)
-            GPI_client = koheron.connect(GPI_host, name='GPI_RP')
-            self._add_to_log('Connected to Red Pitaya')
-            self.RP_driver = GPI_RP(GPI_client)
+            remote = False
+            if os.path.exists(DEFAULT_ADDRESS):
+                # A gpi.server owns the Red Pitaya (and records its stream), share it
+                try:
+                    self.RP_driver = RemoteDriver(DEFAULT_ADDRESS)
+                    remote = True
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket left behind by a server that was killed
+                    self._add_to_log('GPI server not running')
+                except (OSError, EOFError, AuthenticationError) as e:
+                    # Not our server (or it failed the handshake): never exchange pickles with it
+                    self._add_to_log('GPI server refused: %s' % e)
+            if remote:
+                self.acquisition = RemoteAcquisition(DEFAULT_ADDRESS)
+                self.recorder = None
+                self._add_to_log('Connected to GPI server')
+            elif GPI_host == 'simulator':
+                simulator = SimulatedRedPitaya(sample_rate=SIMULATOR_RATE, latency=SIMULATOR_LATENCY,
+                                               jitter=SIMULATOR_JITTER)
+                self.RP_driver = simulator
+                self.acquisition = Acquisition(lambda: simulator, read_status=True, sample_rate=simulator.sample_rate)
+                self.recorder = None
+                self._add_to_log('Running on a simulated Red Pitaya')
+            else:
+                GPI_client = koheron.connect(GPI_host, name='GPI_RP')
+                self._add_to_log('Connected to Red Pitaya')
+                self.RP_driver = GPI_RP(GPI_client)
+                # Fast readings come in over a second connection owned by the acquisition thread
+                self.recorder = Recorder(RECORD_FOLDER)
+                self.acquisition = Acquisition(lambda: GPI_RP(koheron.KoheronClient(GPI_host)),
+                                               sinks=[self.recorder.record], read_status=True)
         except Exception as e:
             print(e)
             self.RP_driver = FakeRedPitaya()
+            self.acquisition = None
+            self.recorder = None
             self._add_to_log('Red Pitaya unreachable - simulating...')
         
-        self.last_plot = None
+        # Fast readings of the last PLOT_TIME_RANGE seconds, or of the whole
+        # shot for plot_puffs, and 1 s averages
+        self.sample_rate = self.acquisition.sample_rate if self.acquisition else SAMPLE_RATE
+        self.fast_history = RingBuffer(max(PLOT_TIME_RANGE, SHOT_WINDOW)*self.sample_rate, ('t', 'abs', 'diff'))
+        self.avg_history = RingBuffer(PLOT_TIME_RANGE/UPDATE_INTERVAL, ('t', 'abs', 'diff'))
+        self.averages = RollingAverage(('t', 'abs', 'diff'), AVERAGE_WINDOWS, self.sample_rate)
+        
+        self.scheduler = Scheduler(self.root)
+        # Post-shot plots are made in a separate process so that control keeps running
+        self.analysis_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        self.pending_analyses = []
         self.filling = False
         self.preparing_to_pump_out = False
         self.pumping_out = False
-        self.mainloop_running = True   
         self.T0 = None
-        self.sent_T1_to_RP = False
-        self.done_puff_prep = False
+        self.puff_tasks = []
         self.both_puffs_done = None
-        self.starting_up = True
+        self.reported_lost_samples = 0
+        self.reported_unrecorded_samples = 0
         
         #self.RP_driver.set_GPI_safe_state(0)
         
@@ -305,67 +324,53 @@ class GUI:
         # self.handle_valve('FV2', command='close', no_confirm=True)
         self._add_to_log('Finished setting default state')
         self.RP_driver.send_T1(0)
-        
-        last_control = time.time()
-        self.last_plot = time.time() + UPDATE_INTERVAL # +... to get more fast data before first average
-        
-        while self.mainloop_running:
-            now = time.time()
-            
-            # Pump and fill loop logic
-            if now - last_control > CONTROL_INTERVAL:
-                if self.preparing_to_pump_out:
-                    if self.abs_avg_pressures[-1] < MECH_PUMP_LIMIT:
-                        self._add_to_log('Completed prep for pump out')
-                        self.handle_valve('V7', command='close')
-                        self.preparing_to_pump_out = False
-                        self.handle_pump_refill(skip_prep=True)
-                if self.pumping_out:
-                    done_pumping = all([p < PUMPED_OUT for p in self.abs_avg_pressures[-5:]])
-                    if done_pumping:
-                        self.handle_valve('V4', command='close')
-                        self.pumping_out = False
-                        self._add_to_log('Completed pump out. Beginning fill.')
-                        self.handle_valve('V5', command='open')
-                        self.filling = True
-                if self.filling:
-                    desired_pressure = float(self.desired_pressure_entry.get())
-                    if self.abs_pressures[-1] > desired_pressure - FILL_MARGIN:
-                        self.handle_valve('V5', command='close')
-                        self.filling = False
-                        self._add_to_log('Completed fill to %.2f Torr' % desired_pressure)
-                last_control =  now
-                
-                # Get data on slower timescale now that it's queue-based
-                self.get_data()
-            
-            # Stuff to do before and after puffs
-            if self.T0:
-                first_puff_start = 0 if self.start(1) == 0 or self.start(2) == 0 else \
-                                   min(self.start(1) or math.inf, self.start(2) or math.inf)
-                if now > self.T0 + PRETRIGGER - 1 + first_puff_start and not self.done_puff_prep:
-                    self.handle_valve('V3', command='close')
-                    self.done_puff_prep = True
-                if now > self.T0 + PRETRIGGER and not self.sent_T1_to_RP:
-                    self.RP_driver.send_T1(1)
-                    self.RP_driver.send_T1(0)
-                    self.sent_T1_to_RP = True
-                if now > self.T0 + PRETRIGGER + self.both_puffs_done + 2:
-                    self.handle_valve('V3', command='open')
-                    self._change_puff_gui_state(tk.NORMAL)
-                    self.plot_puffs()
-                    self.T0 = None
-                    self.sent_T1_to_RP = False
-             
-            # Draw GUI and get callback results ((...).after(...))
-            self.root.update()
-            
-            # Reduce CPU usage during non-crucial times
-            if not (self.preparing_to_pump_out or self.pumping_out or self.filling or self.T0):
-                time.sleep(.01)
+        if self.recorder:
+            self.recorder.start()
+        if self.acquisition:
+            self.acquisition.start()
+        
+        self.scheduler.every(CONTROL_INTERVAL, self.control_pump_fill)
+        self.scheduler.every(POLL_INTERVAL, self.get_data)
+        self.scheduler.every(STATUS_INTERVAL, self.update_status)
+        # Wait a little longer for the first average to get more fast data
+        self.scheduler.every(UPDATE_INTERVAL, self.update_averages, delay=2*UPDATE_INTERVAL)
+        self.scheduler.every(PLOT_INTERVAL, self.draw_plots, delay=2*UPDATE_INTERVAL)
+        self.scheduler.every(POLL_INTERVAL, self.check_puff_analyses)
+        self.root.mainloop()
+        
+    def control_pump_fill(self):
+        '''
+        Pump and fill loop logic, runs every CONTROL_INTERVAL.
+        '''
+        if self.preparing_to_pump_out:
+            if self.avg_history['abs'][-1] < MECH_PUMP_LIMIT:
+                self._add_to_log('Completed prep for pump out')
+                self.handle_valve('V7', command='close')
+                self.preparing_to_pump_out = False
+                self.handle_pump_refill(skip_prep=True)
+        if self.pumping_out:
+            done_pumping = all(self.avg_history['abs'][-5:] < PUMPED_OUT)
+            if done_pumping:
+                self.handle_valve('V4', command='close')
+                self.pumping_out = False
+                self._add_to_log('Completed pump out. Beginning fill.')
+                self.handle_valve('V5', command='open')
+                self.filling = True
+        if self.filling:
+            desired_pressure = float(self.desired_pressure_entry.get())
+            _, abs_pressure, _ = self.averages.mean(FILL_AVERAGE)
+            if abs_pressure > desired_pressure - FILL_MARGIN:
+                self.handle_valve('V5', command='close')
+                self.filling = False
+                self._add_to_log('Completed fill to %.2f Torr' % desired_pressure)
                              
     def _quit_tkinter(self):
-        self.mainloop_running = False # ends our custom while loop
+        self.scheduler.stop()
+        self.analysis_pool.shutdown(wait=False)
+        if self.acquisition:
+            self.acquisition.stop()
+        if self.recorder:
+            self.recorder.stop()
         self.root.quit()      # stops mainloop 
         self.root.destroy()   # this is necessary on Windows to prevent
                               # Fatal Python Error: PyEval_RestoreThread: NULL tstate
@@ -422,87 +427,112 @@ class GUI:
         
     def abs_torr_single_reading(self):
         abs_counts = self.RP_driver.get_abs_gauge()
-        bin_number = '{0:014b}'.format(abs_counts)
-        return abs_bin_to_torr(bin_number)
+        return float(abs_counts_to_torr(abs_counts))
 
     def diff_torr_single_reading(self):
         diff_counts = self.RP_driver.get_diff_gauge()
-        bin_number = '{0:014b}'.format(diff_counts)
-        return diff_bin_to_torr(bin_number)
+        return float(diff_counts_to_torr(diff_counts))
         
     def get_data(self):
-        # Add fast readings
-        combined_pressure_history = self.RP_driver.get_GPI_data()
-        now = time.time()
-        abs_pressures = [abs_torr(i) for i in combined_pressure_history]
-        diff_pressures = [diff_torr(i) for i in combined_pressure_history]
-        self.abs_pressures.extend(abs_pressures)
-        self.diff_pressures.extend(diff_pressures)
-        self.pressure_times = np.arange(now-0.0001*(len(self.abs_pressures)-1), now, 0.0001)
-        if len(combined_pressure_history) == 50000:
-            # Show this message except during program startup, 
-            # when there is always a backlog of data
-            if not self.starting_up:
-                self._add_to_log('Lost some data due to network lag')
-            else:
-                self.starting_up = False
-        
-        now = time.time()
-        if now - self.last_plot > UPDATE_INTERVAL:
-            # Add latest average reading
-            interval_start = find_nearest(np.array(self.pressure_times)-now, -UPDATE_INTERVAL)
-            self.pressure_avg_times.append(np.mean(self.pressure_times[interval_start:]))
-            self.abs_avg_pressures.append(np.mean(self.abs_pressures[interval_start:]))
-            self.diff_avg_pressures.append(np.mean(self.diff_pressures[interval_start:]))
-            
-            # Remove fast readings older than PLOT_TIME_RANGE seconds
-            if not self.T0: # in case the puff delays are longer than PLOT_TIME_RANGE
-                range_start = find_nearest(np.array(self.pressure_times)-now, -PLOT_TIME_RANGE)
-                self.pressure_times = self.pressure_times[range_start:]
-                self.abs_pressures = self.abs_pressures[range_start:]
-                self.diff_pressures = self.diff_pressures[range_start:]
-            
-            # Remove average readings older than PLOT_TIME_RANGE seconds
-            avgs_start = find_nearest(np.array(self.pressure_avg_times)-now, -PLOT_TIME_RANGE)
-            self.pressure_avg_times = self.pressure_avg_times[avgs_start:]
-            self.abs_avg_pressures = self.abs_avg_pressures[avgs_start:]
-            self.diff_avg_pressures = self.diff_avg_pressures[avgs_start:]
-
-            self.draw_plots()
-            self.last_plot = now
+        # Add fast readings decoded by the acquisition thread
+        blocks = self.acquisition.get_blocks() if self.acquisition else []
+        for block in blocks:
+            times = block_times(block, self.sample_rate)
+            self.fast_history.append(times, block.abs_pressures, block.diff_pressures)
+            self.averages.update(times, block.abs_pressures, block.diff_pressures)
+            if block.gap:
+                self._add_to_log('Lost %d samples due to network lag' % block.gap)
+        if self.acquisition:
+            if self.acquisition.lost_samples > self.reported_lost_samples:
+                self._add_to_log('Lost %d samples, GUI fell behind acquisition' % 
+                                 (self.acquisition.lost_samples - self.reported_lost_samples))
+                self.reported_lost_samples = self.acquisition.lost_samples
+            if self.acquisition.error:
+                self._add_to_log('Acquisition stopped: %s' % self.acquisition.error)
+                self.acquisition.error = None
+        if self.recorder:
+            if self.recorder.lost_samples > self.reported_unrecorded_samples:
+                self._add_to_log('Recorder dropped %d samples' % 
+                                 (self.recorder.lost_samples - self.reported_unrecorded_samples))
+                self.reported_unrecorded_samples = self.recorder.lost_samples
+            if self.recorder.error:
+                self._add_to_log('Raw data recording stopped: %s' % self.recorder.error)
+                self.recorder.error = None
+        
+    def update_status(self):
+        '''
+        Show the valve states and W7-X permission read back from the Red Pitaya.
+        The acquisition thread reads all status registers along with the fast
+        data, this only shows the latest ones.
+        '''
+        if self.acquisition is None:
+            status = self.RP_driver.get_status() # FakeRedPitaya, no round trip
+        elif self.acquisition.status is None:
+            return # not read yet
+        else:
+            status = self.acquisition.status.view(STATUS_DTYPE)[0]
+        for valve_name, register in VALVE_STATUS_REGISTERS.items():
+            is_open = bool(status[register])
+            # V3 has opposite status logic
+            is_open = not is_open if valve_name == 'V3' else is_open
+            getattr(self, '%s_indicator' % valve_name).config(bg='green' if is_open else 'red')
+        self.W7X_permission.set(int(status['W7X_permission']))
+        
+    def update_averages(self):
+        # Add latest average reading
+        # Readings older than PLOT_TIME_RANGE seconds drop out of the ring buffers
+        self.avg_history.append(*self.averages.mean(UPDATE_INTERVAL))
             
     def draw_plots(self):
         # Do not attempt to draw plots if no data has been collected
         now = time.time()
-        relative_times = [t - now for t in self.pressure_avg_times]
-        if not relative_times:
+        if not len(self.avg_history):
             return
-        self.ax_diff.cla()
-        self.ax_abs.cla()
-        
-        # Absolute gauge plot setup
-        self.ax_abs.yaxis.tick_right()
-        self.ax_abs.yaxis.set_label_position('right')
-        self.ax_abs.plot(relative_times, self.abs_avg_pressures, c='C0', linewidth=2)
-        self.ax_abs.set_ylabel('Torr')
-        plt.setp(self.ax_abs.get_xticklabels(), visible=False)
-        self.ax_abs.grid(True, color='#c9dae5')
-        self.ax_abs.patch.set_facecolor('#e3eff7')
-        
-        # Differential gauge plot setup
-        self.ax_diff.yaxis.tick_right()
-        self.ax_diff.yaxis.set_label_position('right')
-        self.ax_diff.plot(relative_times, self.diff_avg_pressures, c='C1', linewidth=2)
-        self.ax_diff.set_ylabel('Torr')
-        self.ax_diff.set_xlabel('Seconds')
-        self.ax_diff.grid(True, color='#e5d5c7')
-        self.ax_diff.patch.set_facecolor('#f7ebe1')
+        # Plot the min/max envelope of the full-rate history, one bin per pixel
+        # column, so fast transients stay visible at a fixed drawing cost
+        n_bins = max(int(self.ax_abs.bbox.width), 1)
+        times, abs_pressures, diff_pressures = self.fast_history.last(PLOT_TIME_RANGE*self.sample_rate)
+        abs_times, abs_envelope = minmax_envelope(times, abs_pressures, n_bins)
+        diff_times, diff_envelope = minmax_envelope(times, diff_pressures, n_bins)
+        self.abs_line.set_data(abs_times - now, abs_envelope)
+        self.diff_line.set_data(diff_times - now, diff_envelope)
         
         # Update labels
-        self.abs_gauge_label['text'] = '%.1f\nTorr' % round(self.abs_avg_pressures[-1], 1)
-        self.diff_gauge_label['text'] = '%.1f\nTorr' % round(self.diff_avg_pressures[-1], 1)
+        self.abs_gauge_label['text'] = '%.1f\nTorr' % round(self.avg_history['abs'][-1], 1)
+        self.diff_gauge_label['text'] = '%.1f\nTorr' % round(self.avg_history['diff'][-1], 1)
+        
+        # Full redraw only when the axes change, otherwise just the lines
+        rescaled_abs = self._rescale_y(self.ax_abs, abs_envelope)
+        rescaled_diff = self._rescale_y(self.ax_diff, diff_envelope)
+        if rescaled_abs or rescaled_diff or self.plot_background is None:
+            self.canvas.draw() # calls _cache_plot_background
+        else:
+            self._blit_lines()
         
-        self.fig.canvas.draw_idle()
+    def _rescale_y(self, ax, values):
+        '''
+        Set new y limits if the values left the current ones or fill less than
+        a quarter of them. Returns True if the limits changed.
+        '''
+        if not np.isfinite(values).any():
+            return False
+        low, high = np.nanmin(values), np.nanmax(values)
+        margin = max((high - low)*0.2, 1)
+        bottom, top = ax.get_ylim()
+        if bottom <= low and high <= top and (top - bottom) < 4*(high - low + 2*margin):
+            return False
+        ax.set_ylim(low - margin, high + margin)
+        return True
+        
+    def _cache_plot_background(self, event):
+        self.plot_background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._blit_lines()
+        
+    def _blit_lines(self):
+        self.canvas.restore_region(self.plot_background)
+        self.ax_abs.draw_artist(self.abs_line)
+        self.ax_diff.draw_artist(self.diff_line)
+        self.canvas.blit(self.fig.bbox)
         
     def handle_valve(self, valve_name, command=None, no_confirm=True):
         if valve_name == 'FV2':
@@ -567,11 +597,11 @@ class GUI:
         This method only initiates the above processes. For the rest of the code related to this 
         logic, see the mainloop method.
         '''
-        if self.abs_avg_pressures[-1] > MECH_PUMP_LIMIT and not skip_prep:
+        if self.avg_history['abs'][-1] > MECH_PUMP_LIMIT and not skip_prep:
             self._add_to_log('Preparing for pump out')
             self.handle_valve('V7', command='open')
             self.preparing_to_pump_out = True
-        elif self.abs_avg_pressures[-1] > PUMPED_OUT:
+        elif self.avg_history['abs'][-1] > PUMPED_OUT:
             self._add_to_log('Starting to pump out')
             self.handle_valve('V4', command='open')
             self.pumping_out = True
@@ -579,10 +609,11 @@ class GUI:
             self._add_to_log('No need to pump out')
         
     def handle_T0(self):
-        valid_start_1 = self.start(1) is not None and self.start(1) >= 0
-        valid_start_2 = self.start(2) is not None and self.start(2) >= 0
-        valid_duration_1 = self.duration(1) and 0 < self.duration(1) < 2
-        valid_duration_2 = self.duration(2) and 0 < self.duration(2) < 2
+        # Later or longer puffs would not fit in fast_history
+        valid_start_1 = self.start(1) is not None and 0 <= self.start(1) <= MAX_PUFF_START
+        valid_start_2 = self.start(2) is not None and 0 <= self.start(2) <= MAX_PUFF_START
+        valid_duration_1 = self.duration(1) and 0 < self.duration(1) < MAX_PUFF_DURATION
+        valid_duration_2 = self.duration(2) and 0 < self.duration(2) < MAX_PUFF_DURATION
         puff_1_happening = self.permission_1.get() and valid_start_1 and valid_duration_1
         puff_2_happening = self.permission_2.get() and valid_start_2 and valid_duration_2
         if not (puff_1_happening or puff_2_happening):
@@ -591,61 +622,89 @@ class GUI:
             
         self.T0 = time.time()
         self._add_to_log('---T0---')
-        self.root.after(int(PRETRIGGER*1000), self._add_to_log, '---T1---')
-        
-        self.done_puff_prep = False
         
         puff_1_done = self.start(1) + self.duration(1) if puff_1_happening else 0
         puff_2_done = self.start(2) + self.duration(2) if puff_2_happening else 0
         self.both_puffs_done = max(puff_1_done, puff_2_done)
-        self.RP_driver.reset_time(int(self.both_puffs_done*1000)) # reset puff countup timer
+        idle = 2+int(self.both_puffs_done*1000) # delay and duration of a puff that should not happen
+        # The timer and puff settings go out to the Red Pitaya together
+        with self._batch():
+            self.RP_driver.reset_time(int(self.both_puffs_done*1000)) # reset puff countup timer
+            self.RP_driver.set_fast_delay_1(int(self.start(1)*1000) if puff_1_happening else idle)
+            self.RP_driver.set_fast_duration_1(int(self.duration(1)*1000) if puff_1_happening else idle)
+            self.RP_driver.set_fast_delay_2(int(self.start(2)*1000) if puff_2_happening else idle)
+            self.RP_driver.set_fast_duration_2(int(self.duration(2)*1000) if puff_2_happening else idle)
         
         self._change_puff_gui_state(tk.DISABLED)
-
+        
+        # Puff sequence: close V3 before the first puff, send T1, then reopen V3 and save
+        for task in self.puff_tasks:
+            task.cancel()
+        T1 = self.T0 + PRETRIGGER
+        first_puff_start = 0 if self.start(1) == 0 or self.start(2) == 0 else \
+                           min(self.start(1) or math.inf, self.start(2) or math.inf)
+        self.puff_tasks = [
+            self.scheduler.at(T1 - 1 + first_puff_start, self.handle_valve, 'V3', 'close'),
+            self.scheduler.at(T1, self.send_T1),
+            self.scheduler.at(T1 + self.both_puffs_done + 2, self.finish_puffs),
+        ]
         if puff_1_happening:
-            self.RP_driver.set_fast_delay_1(int(self.start(1)*1000))
-            self.RP_driver.set_fast_duration_1(int(self.duration(1)*1000))
-            self.root.after(int((PRETRIGGER+self.start(1))*1000), self._add_to_log, 'Puff 1')
-        else:
-            self.RP_driver.set_fast_delay_1(2+int(self.both_puffs_done*1000))
-            self.RP_driver.set_fast_duration_1(2+int(self.both_puffs_done*1000))
-            
+            self.puff_tasks.append(self.scheduler.at(T1 + self.start(1), self._add_to_log, 'Puff 1'))
         if puff_2_happening:
-            self.RP_driver.set_fast_delay_2(int(self.start(2)*1000))
-            self.RP_driver.set_fast_duration_2(int(self.duration(2)*1000))
-            self.root.after(int((PRETRIGGER+self.start(2))*1000), self._add_to_log, 'Puff 2')
-        else:
-            self.RP_driver.set_fast_delay_2(2+int(self.both_puffs_done*1000))
-            self.RP_driver.set_fast_duration_2(2+int(self.both_puffs_done*1000))
+            self.puff_tasks.append(self.scheduler.at(T1 + self.start(2), self._add_to_log, 'Puff 2'))
+            
+    def _batch(self):
+        '''
+        Context in which Red Pitaya commands are queued and sent at once, if
+        the driver talks to it directly.
+        '''
+        if isinstance(self.RP_driver, GPI_RP):
+            return self.RP_driver.client.batch()
+        return contextlib.nullcontext()
+        
+    def send_T1(self):
+        self.RP_driver.send_T1(1)
+        self.RP_driver.send_T1(0)
+        self._add_to_log('---T1---')
+        
+    def finish_puffs(self):
+        self.handle_valve('V3', command='open')
+        self._change_puff_gui_state(tk.NORMAL)
+        self.plot_puffs()
+        self.T0 = None
         
     
     def plot_puffs(self):
         try:
-            times = np.array(self.pressure_times) - (self.T0 + PRETRIGGER)
-            times, pressures = zip(*[(_t, _d) for (_t, _d) in zip(times, self.diff_pressures) if _t > -1])
-            np.save(SAVE_FOLDER + 'diff_pressure_%d.npy' % int(self.T0), [times, pressures])
-            plt.figure()
-            plt.suptitle(int(self.T0))
-            plt.subplot(211)
-            pressures = medfilt(pressures, 11)
-            plt.plot(times, pressures)
-            plt.ylabel('Diff. pressure (Torr)')
-            plt.subplot(212)
-            f = interp1d(times, pressures, kind='linear')
-            newtimes = np.arange(times[0], times[-1], 0.0005)
-            dp_coarse = [PLENUM_VOLUME*derivative(f, ti, dx=.02) for ti in newtimes[100:-100]]
-            dp_fine = [PLENUM_VOLUME*derivative(f, ti, dx=.005) for ti in newtimes[100:-100]]
-            plt.plot(newtimes[100:-100], medfilt(dp_fine,11))
-            plt.plot(newtimes[100:-100], medfilt(dp_coarse,11))
-            plt.xlabel('t-T1 (s)')
-            plt.ylabel('Flow rate (Torr-L/sec)')
-            plt.savefig(SAVE_FOLDER + 'diff_pressure_%d.png' % int(self.T0))
-            plt.ion() # to continue execution after closing window
-            plt.show()
-            plt.pause(0.001) # to continue execution after closing window
-            self._add_to_log('Saved data with suffix %d' % int(self.T0))
+            times = self.fast_history['t'] - (self.T0 + PRETRIGGER)
+            after_start = times > -1
+            times, pressures = times[after_start], self.fast_history['diff'][after_start]
+            data_path = SAVE_FOLDER + 'diff_pressure_%d.npy' % int(self.T0)
+            # The worker gets a copy of the window and writes both the data and
+            # the PNG, so a slow SAVE_FOLDER never stalls this thread
+            future = self.analysis_pool.submit(save_puff_plot, data_path, times, pressures,
+                                               int(self.T0), PLENUM_VOLUME)
+            self.pending_analyses.append((future, int(self.T0)))
         except Exception as e:
-            self._add_to_log('Save pressure data failed: %s' % e)
+            self._add_to_log('Puff analysis failed: %s' % e)
+            
+    def check_puff_analyses(self):
+        for future, suffix in [a for a in self.pending_analyses if a[0].done()]:
+            self.pending_analyses.remove((future, suffix))
+            try:
+                png_path = future.result()
+                self._add_to_log('Saved data with suffix %d' % suffix)
+                self._show_image(png_path, 'Puffs %d' % suffix)
+            except Exception as e:
+                self._add_to_log('Puff analysis failed: %s' % e)
+                
+    def _show_image(self, path, title):
+        win = tk.Toplevel()
+        win.title(title)
+        photo = ImageTk.PhotoImage(Image.open(path))
+        image = tk.Label(win, image=photo)
+        image.image = photo
+        image.pack()
 
  
 if __name__ == '__main__':
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os, time
-from koheron import command, connect
+from koheron import command, KoheronCluster
 
 class Cluster(object):
     def __init__(self, client):
@@ -49,21 +49,16 @@ class Cluster(object):
 if __name__=="__main__":
     # Define the IP addresses of the 4 Red Pitayas
     hosts = ['192.168.1.14', '192.168.1.5', '192.168.1.13', '192.168.1.6']
-    clients = []
-    drivers = []
+    cluster = KoheronCluster.connect(hosts, Cluster, instrument='cluster', restart=False)
+    drivers = [cluster.drivers[host] for host in hosts]
 
-    for i, host in enumerate(hosts):
-        clients.append(connect(host, 'cluster', restart=False))
-        drivers.append(Cluster(clients[i]))
+    # Same settings on all boards at once
+    cluster.set_freq(10e6).raise_errors()
+    cluster.set_clk_source('crystal').raise_errors()
+    cluster.ctl_sata(1, 0).raise_errors()
+    cluster.set_pulse_generator(100, 200).raise_errors()
 
-    for driver in drivers:
-        driver.set_freq(10e6)
-        driver.set_clk_source('crystal')
-        driver.ctl_sata(1, 0)
-        driver.set_pulse_generator(100, 200)
-
-    for i in [1,2,3]:
-        drivers[i].set_clk_source('sata')
+    cluster.subset(hosts[1:]).set_clk_source('sata').raise_errors()
 
     drivers[0].ctl_sata(1, 0)
     drivers[1].ctl_sata(0, 7)
@@ -74,5 +69,3 @@ if __name__=="__main__":
         drivers[1].phase_shift(1)
         print(i)
         time.sleep(0.01)
-
-
@@ -27,6 +27,6 @@ class Decimator(object):
         pass
 
     @command()
-    def read_adc(self):
-        return self.client.recv_array(8192, dtype='int32', check_type=False)
+    def read_adc(self, out=None):
+        return self.client.recv_array(8192, dtype='int32', check_type=False, out=out)
 
@@ -26,10 +26,12 @@ li, = ax.plot(x, y)
 ax.set_ylim((-2**31, 2**31))
 fig.canvas.draw()
 
+data = np.zeros(n, dtype='int32') # reused for every read
+
 
 while True:
     try:
-        data = driver.read_adc()
+        driver.read_adc(out=data)
         print(driver.get_fifo_length())
         li.set_ydata(data)
         fig.canvas.draw()
@@ -54,10 +54,10 @@ class Pulse(object):
         pass
 
     @command()
-    def get_next_pulse(self, n_pts):
+    def get_next_pulse(self, n_pts, out=None):
         assert n_pts > 0
         assert n_pts <= 16386
-        data_rcv = self.client.recv_vector(dtype='uint32')
+        data_rcv = self.client.recv_vector(dtype='uint32', out=out)
         assert(data_rcv[0] & (1 << 15) == (1 << 15))
         return data_rcv
 
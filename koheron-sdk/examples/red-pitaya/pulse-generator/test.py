@@ -43,9 +43,11 @@ ax.set_xlabel('FIFO sample number')
 ax.set_ylabel('ADC raw value')
 fig.canvas.draw()
 
+buff = np.zeros(n, dtype='uint32') # reused for every pulse
+
 while True:
     try:
-        data_rcv = driver.get_next_pulse(n)
+        data_rcv = driver.get_next_pulse(n, out=buff)
         adc0 = (np.int32(data_rcv % 16384) - 8192) % 16384 - 8192
         adc1 = (np.int32((data_rcv >> 16) % 16384) - 8192) % 16384 - 8192
         print driver.get_fifo_length(), np.mean(adc0), np.mean(adc1)
@@ -6,9 +6,11 @@
 #define __DRIVERS_GPI_RP_HPP__
 
 #include <atomic>
+#include <mutex>
 #include <thread>
 #include <chrono>
 #include <queue>
+#include <array>
 
 #include <context.hpp>
 
@@ -22,6 +24,9 @@ namespace Fifo_regs {
 
 constexpr uint32_t adc_buff_size = 50000;
 
+// All status registers of config.yml, they are contiguous from adc0 on
+constexpr uint32_t n_status_registers = (reg::analog_out_sts - reg::adc0) / 4 + 1;
+
 class GPI_RP {
   public:
     GPI_RP(Context& ctx_)
@@ -142,6 +147,11 @@ class GPI_RP {
     uint32_t get_fast_sts() {
         return sts.read<reg::fast_sts>();
     }
+
+    // Snapshot of every status register in config.yml order, in one call
+    std::array<uint32_t, n_status_registers>& get_status_registers() {
+        return sts.read_array<uint32_t, n_status_registers, reg::adc0>();
+    }
     
     // Adc FIFO
 
@@ -169,7 +179,9 @@ class GPI_RP {
     // Function to return data
     std::vector<uint32_t>& get_GPI_data() {
         // ctx.log<INFO>("adc_data_queue size: %d", adc_data_queue.size());
+        std::lock_guard<std::mutex> lock(queue_mutex);
         size_t queue_count = adc_data_queue.size();
+        GPI_data_index = samples_acquired - queue_count;
         adc_data.resize(queue_count);
         for (size_t i = 0; i < queue_count; i++) {
             adc_data[i] = adc_data_queue.front();
@@ -179,6 +191,13 @@ class GPI_RP {
         return adc_data;
     }
 
+    // Sample count of the first sample returned by the last get_GPI_data call.
+    // Samples are counted from the start of the acquisition, so jumps between
+    // calls are samples dropped from the full queue.
+    uint64_t get_GPI_data_index() {
+        return GPI_data_index;
+    }
+
     void wait_for(uint32_t n_pts) {
         do {} while (get_fifo_length() < n_pts);
     }
@@ -193,6 +212,9 @@ class GPI_RP {
 
     std::queue<uint32_t> adc_data_queue;
     std::vector<uint32_t> adc_data;
+    std::mutex queue_mutex;
+    uint64_t samples_acquired = 0;
+    uint64_t GPI_data_index = 0;
     
     uint32_t fill_buffer(uint32_t);
 
@@ -248,8 +270,10 @@ inline uint32_t GPI_RP::fill_buffer(uint32_t dropped) {
         // Checking for dropped samples
         if (samples >= 32768)
             dropped += 1;
+        std::lock_guard<std::mutex> lock(queue_mutex);
         for (size_t i=0; i < samples; i++)
             adc_data_queue.push(read_fifo());    
+        samples_acquired += samples;
         while (adc_data_queue.size() > adc_buff_size)
             adc_data_queue.pop();
     }
@@ -7,6 +7,12 @@ import numpy as np
 
 from koheron import command
 
+# status_registers of config.yml in order, as returned by get_status_registers
+STATUS_REGISTERS = ('adc0', 'adc1', 'W7X_T1', 'W7X_permission', 'analog_input_0',
+                    'analog_input_1', 'abs_gauge', 'diff_gauge', 'slow_1_sts',
+                    'slow_2_sts', 'slow_3_sts', 'slow_4_sts', 'fast_sts', 'analog_out_sts')
+STATUS_DTYPE = np.dtype([(name, '<u4') for name in STATUS_REGISTERS])
+
 class GPI_RP(object):
     def __init__(self, client):
         self.client = client
@@ -39,8 +45,13 @@ class GPI_RP(object):
 
 
     @command()
-    def get_GPI_data(self):
-        return self.client.recv_vector(dtype='uint32')
+    def get_GPI_data(self, out=None):
+        return self.client.recv_vector(dtype='uint32', out=out)
+
+
+    @command()
+    def get_GPI_data_index(self):
+        return self.client.recv_uint64()
         
         
     @command()
@@ -171,3 +182,16 @@ class GPI_RP(object):
     @command()
     def get_fast_sts(self):
         return self.client.recv_uint32()
+
+
+    @command()
+    def get_status_registers(self):
+        return self.client.recv_array(len(STATUS_REGISTERS), dtype='uint32')
+
+
+    def get_status(self):
+        '''
+        All status registers in one round trip, as a STATUS_DTYPE record,
+        e.g. get_status()['slow_1_sts'].
+        '''
+        return self.get_status_registers().view(STATUS_DTYPE)[0]
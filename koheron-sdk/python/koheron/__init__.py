@@ -1,10 +1,13 @@
 from .version import __version__
 
 from .koheron import KoheronClient
+from .koheron import ThreadLocalClient
 from .koheron import command
 from .koheron import ConnectionError
 from .koheron import connect
 from .koheron import run_instrument
 from .koheron import upload_instrument
 from .alpha250 import Alpha250
-
+from .async_client import AsyncKoheronClient
+from .async_client import async_command
+from .cluster import KoheronCluster
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+asyncio client for koheron-server, with the wire format and get_cmds
+manifest of KoheronClient.
+
+    class Driver(object):
+        def __init__(self, client):
+            self.client = client
+
+        @async_command()
+        async def get_value(self):
+            return await self.client.recv_uint32()
+
+    client = await AsyncKoheronClient.connect(host)
+    values = await asyncio.gather(*[Driver(client).get_value() for i in range(10)])
+
+Commands can be in flight concurrently: each request is written as soon as
+the command is called and the replies, which koheron-server sends in
+request order, are read in turn.
+'''
+
+import asyncio
+import socket
+import json
+import struct
+import numpy as np
+
+from .koheron import KoheronClient, ConnectionError, make_command, check_server_version, reply_struct, reply_structs
+
+# --------------------------------------------
+# Command decorator
+# --------------------------------------------
+
+def async_command(classname=None, funcname=None):
+    ''' Like command, for coroutine driver methods reading the reply from an AsyncKoheronClient '''
+    def real_command(func):
+        cmd_name = funcname or func.__name__
+        async def wrapper(self, *args, **kwargs):
+            client = self.client
+            cmd = client.get_command(classname or self.__class__.__name__, cmd_name)
+            return await client.call(cmd, cmd.frame(*args), lambda: func(self, *args, **kwargs))
+        return wrapper
+    return real_command
+
+# --------------------------------------------
+# AsyncKoheronClient
+# --------------------------------------------
+
+class AsyncKoheronClient:
+    ''' Connection to koheron-server on asyncio streams
+
+    Create it with connect() (or open() on an instance), inside a running
+    event loop. Replies are matched to requests by order: each call gets a
+    reply task that waits for the previous one to finish reading, so the
+    stream stays in sync even if the awaiting caller is cancelled.
+    '''
+    def __init__(self, host='', port=36000, unixsock='', check_types=True):
+        if type(host) != str:
+            raise TypeError('IP address must be a string')
+
+        if type(port) != int:
+            raise TypeError('Port number must be an integer')
+
+        self.host = host
+        self.port = port
+        self.unixsock = unixsock
+        self.is_connected = False
+        self.reader = None
+        self.writer = None
+        self.last_reply = None # reply task of the last request sent
+        self.check_types = check_types
+        self.last_command = None # CompiledCommand whose reply is read next
+
+    @classmethod
+    async def connect(cls, host='', port=36000, unixsock='', check_types=True):
+        client = cls(host, port, unixsock, check_types)
+        await client.open()
+        return client
+
+    async def open(self):
+        try:
+            if self.host != '':
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                # Disable Nagle algorithm for real-time response
+                sock = self.writer.get_extra_info('socket')
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            elif self.unixsock != '':
+                self.reader, self.writer = await asyncio.open_unix_connection(self.unixsock)
+            else:
+                raise ValueError('Unknown socket type')
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectionError('Failed to connect to {}:{} : {}'.format(self.host or self.unixsock, self.port, e))
+        self.is_connected = True
+        # Both requests go out before the first reply is read
+        self.writer.write(bytes(make_command(1, 0, [])) + bytes(make_command(1, 1, [])))
+        check_server_version((await self.recv_dynamic_payload()).decode('utf8'))
+        self.parse_commands(json.loads((await self.recv_dynamic_payload()).decode('utf8')))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            if hasattr(self.writer, 'wait_closed'): # Python 3.7+
+                try:
+                    await self.writer.wait_closed()
+                except OSError:
+                    pass
+            self.is_connected = False
+
+    async def __aenter__(self):
+        if not self.is_connected:
+            await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Manifest and return type checks are the same as for KoheronClient
+    parse_commands = KoheronClient.parse_commands
+    set_command_tables = KoheronClient.set_command_tables
+    get_ids = KoheronClient.get_ids
+    get_command = KoheronClient.get_command
+    last_return = KoheronClient.last_return
+    check_ret_type = KoheronClient.check_ret_type
+    scalar_reply = KoheronClient.scalar_reply
+    check_ret_array = KoheronClient.check_ret_array
+    check_ret_vector = KoheronClient.check_ret_vector
+    check_ret_tuple = KoheronClient.check_ret_tuple
+
+    # -------------------------------------------------------
+    # Send/Receive
+    # -------------------------------------------------------
+
+    async def call(self, cmd, frame, read_reply):
+        ''' Send a request frame and await read_reply() once the earlier replies are read '''
+        self.writer.write(bytes(frame)) # compiled frames reuse their buffer
+        reply = asyncio.ensure_future(self._read_reply(self.last_reply, cmd, read_reply))
+        # A cancelled caller never retrieves the result
+        reply.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self.last_reply = reply
+        try:
+            await self.writer.drain()
+        except OSError:
+            raise ConnectionError('send_command: Socket connection broken')
+        return await asyncio.shield(reply)
+
+    async def _read_reply(self, previous, cmd, read_reply):
+        if previous is not None:
+            await asyncio.wait([previous])
+        self.last_command = cmd
+        return await read_reply()
+
+    async def recv_all(self, n_bytes):
+        '''Receive exactly n_bytes bytes.'''
+        try:
+            return await self.reader.readexactly(n_bytes)
+        except (asyncio.IncompleteReadError, OSError):
+            raise ConnectionError('recv_all: Socket connection broken.')
+
+    async def recv_dynamic_payload(self):
+        reserved, class_id, func_id, length = struct.unpack('>IHHI', await self.recv_all(12))
+        assert reserved == 0
+        return await self.recv_all(length)
+
+    async def recv(self, fmt='I'):
+        _struct = reply_struct(fmt)
+        t = _struct.unpack(await self.recv_all(_struct.size))[3:]
+        if len(t) == 1:
+            return t[0]
+        else:
+            return t
+
+    async def recv_scalar(self, fmt='I'):
+        _struct = self.scalar_reply(fmt) if self.check_types else reply_structs[fmt]
+        return _struct.unpack(await self.recv_all(_struct.size))[3]
+
+    async def recv_uint32(self):
+        return await self.recv_scalar('I')
+
+    async def recv_uint64(self):
+        return await self.recv_scalar('Q')
+
+    async def recv_int32(self):
+        return await self.recv_scalar('i')
+
+    async def recv_float(self):
+        return await self.recv_scalar('f')
+
+    async def recv_double(self):
+        return await self.recv_scalar('d')
+
+    async def recv_bool(self):
+        return await self.recv_scalar('?')
+
+    async def recv_string(self, check_type=True):
+        if check_type:
+            self.check_ret_type(['const std::string', 'std::string', 'const char *', 'const char*'])
+        return (await self.recv_dynamic_payload()).decode('utf8')
+
+    async def recv_json(self, check_type=True):
+        if check_type:
+            self.check_ret_type(['const std::string', 'std::string', 'const char *', 'const char*'])
+        return json.loads(await self.recv_string(check_type=False))
+
+    async def recv_vector(self, dtype='uint32', check_type=True, out=None):
+        '''Receive a numpy array with unknown length, into out if given.'''
+        dtype = self.last_return().vector_layout(dtype, check_type and self.check_types)
+        data = np.frombuffer(await self.recv_dynamic_payload(), dtype=dtype)
+        return data if out is None else _copy_to(out, data)
+
+    async def recv_array(self, shape, dtype='uint32', check_type=True, out=None):
+        '''Receive a numpy array with known shape, into out if given.'''
+        dtype, arr_len = self.last_return().array_layout(shape, dtype, check_type and self.check_types)
+        await self.recv(fmt='')
+        data = np.frombuffer(await self.recv_all(dtype.itemsize * arr_len), dtype=dtype)
+        return data.reshape(shape) if out is None else _copy_to(out, data).reshape(shape)
+
+    async def recv_tuple(self, fmt, check_type=True):
+        if check_type:
+            self.check_ret_tuple()
+        return tuple(await self.recv(fmt))
+
+def _copy_to(out, data):
+    if out.dtype != data.dtype:
+        raise TypeError('Invalid output type. Expected {} but received {}.'.format(data.dtype, out.dtype))
+    if len(data) > out.size or not out.flags.c_contiguous:
+        raise ValueError('Output array too small or not contiguous: {} elements received.'.format(len(data)))
+    view = out.reshape(-1)[:len(data)]
+    view[:] = data
+    return view
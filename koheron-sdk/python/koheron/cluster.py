@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Several boards running the same instrument, driven together.
+
+    cluster = KoheronCluster.connect(hosts, Cluster, instrument='cluster')
+    cluster.set_freq(10e6).raise_errors()         # on all boards at once
+    cluster.subset(hosts[1:]).set_clk_source('sata')
+    cluster.synchronized('trig_pulse')            # requests sent back to back
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .koheron import KoheronClient, CommandFuture, connect
+
+class ClusterError(Exception):
+    ''' Raised by ClusterResult.raise_errors, with the errors per board '''
+    def __init__(self, errors):
+        Exception.__init__(self, ', '.join('{}: {}'.format(board, e) for board, e in errors.items()))
+        self.errors = errors
+
+class ClusterResult(dict):
+    ''' Return values per board of a cluster call, and the errors of the boards that failed '''
+    def __init__(self, results, errors):
+        dict.__init__(self, results)
+        self.errors = errors
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def raise_errors(self):
+        if self.errors:
+            raise ClusterError(self.errors)
+        return self
+
+class KoheronCluster:
+    ''' Drivers of the same instrument on several boards
+
+    Calling a driver method on the cluster calls it on every board (or on
+    the boards given by boards=) concurrently, one thread per board, and
+    returns a ClusterResult. Boards are named by their host unless drivers
+    is a dict.
+    '''
+    def __init__(self, drivers, executor=None):
+        if not isinstance(drivers, dict):
+            drivers = dict((driver.client.host, driver) for driver in drivers)
+        self.drivers = drivers
+        self.boards = list(drivers)
+        self.executor = executor or ThreadPoolExecutor(max_workers=max(len(drivers), 1))
+
+    @classmethod
+    def connect(cls, hosts, driver_class, instrument=None, **kwargs):
+        ''' Connect to all hosts concurrently
+
+        Args:
+            hosts: Host names or IP addresses of the boards
+            driver_class: Driver of the instrument, built with each client
+            instrument: Instrument started with connect() on each board if
+                given, otherwise the running one is used
+            kwargs: Passed to connect() (e.g. restart) or KoheronClient
+        '''
+        def open_board(host):
+            if instrument is None:
+                return driver_class(KoheronClient(host, **kwargs))
+            return driver_class(connect(host, instrument, **kwargs))
+        executor = ThreadPoolExecutor(max_workers=max(len(hosts), 1))
+        drivers = cls._gather(executor, open_board, hosts)
+        if not drivers.ok:
+            # Nothing is returned to close the boards that did connect
+            for driver in drivers.values():
+                driver.client.sock.close()
+            executor.shutdown()
+            drivers.raise_errors()
+        return cls(dict((host, drivers[host]) for host in hosts), executor)
+
+    def subset(self, boards):
+        ''' Cluster of some of the boards, sharing this one's threads '''
+        return KoheronCluster(dict((board, self.drivers[board]) for board in boards), self.executor)
+
+    def call(self, name, *args, **kwargs):
+        ''' Call driver method name on the boards (all unless boards= is given) concurrently '''
+        boards = kwargs.pop('boards', None) or self.boards
+        return self._gather(self.executor, lambda board: getattr(self.drivers[board], name)(*args, **kwargs), boards)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        return method
+
+    def synchronized(self, name, *args, **kwargs):
+        ''' Issue a command on the boards at (nearly) the same time
+
+        The request frames of all boards are built first and then sent back
+        to back from one thread, before any reply is read; the replies are
+        then read concurrently. name must be a command (or a method calling
+        commands only), e.g. send_T1.
+        '''
+        boards = kwargs.pop('boards', None) or self.boards
+        batches, values, errors = {}, {}, {}
+        try:
+            for board in boards:
+                driver = self.drivers[board]
+                batch = driver.client.batch()
+                batch.__enter__()
+                batches[board] = batch
+                try:
+                    values[board] = getattr(driver, name)(*args, **kwargs)
+                except Exception as e:
+                    errors[board] = e
+            for board in boards:
+                if board not in errors:
+                    try:
+                        batches[board].flush()
+                    except Exception as e:
+                        errors[board] = e
+            sent = [board for board in boards if board not in errors]
+            replies = self._gather(self.executor, lambda board: batches[board].read_replies(), sent)
+            errors.update(replies.errors)
+        finally:
+            for batch in batches.values():
+                batch.client.batch_queue = None
+                batch.release()
+        results = {}
+        for board in boards:
+            if board not in errors:
+                value = values[board]
+                results[board] = value.result() if isinstance(value, CommandFuture) else value
+        return ClusterResult(results, errors)
+
+    def close(self):
+        self.executor.shutdown()
+
+    @staticmethod
+    def _gather(executor, func, boards):
+        futures = dict((board, executor.submit(func, board)) for board in boards)
+        results, errors = {}, {}
+        for board, future in futures.items():
+            try:
+                results[board] = future.result()
+            except Exception as e:
+                errors[board] = e
+        return ClusterResult(results, errors)
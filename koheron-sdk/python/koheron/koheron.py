@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import socket
 import struct
+import operator
 import numpy as np
 import string
 import json
 import requests
 import time
+import threading
 
 from .version import __version__
 
@@ -50,8 +53,30 @@ def run_instrument(host, name=None, restart=False):
         r = requests.get('http://{}/api/instruments/run/{}'.format(host, name))
 
 def connect(host, *args, **kwargs):
+    ''' Run instrument name (see run_instrument) and connect to it
+
+    With cached=True the HTTP API is skipped when this process already saw
+    the server's manifest with this instrument. The manifest does not identify the
+    bitstream though: if two instruments share their drivers, or the board
+    was reflashed since, the requested instrument is not loaded and the
+    commands reach the wrong FPGA design. Only use it when the board is
+    known to run a single instrument.
+    '''
+    cached = kwargs.pop('cached', False)
+    name = args[0] if len(args) > 0 else kwargs.get('name')
+    restart = args[1] if len(args) > 1 else kwargs.get('restart', False)
+    if cached and name is not None and not restart:
+        try:
+            client = KoheronClient(host)
+            if name in client.instruments:
+                return client
+            client.sock.close()
+        except ConnectionError:
+            pass
     run_instrument(host, *args, **kwargs)
     client = KoheronClient(host)
+    if name is not None:
+        client.remember_instrument(name)
     return client
 
 def load_instrument(host, instrument='blink', always_restart=False):
@@ -66,107 +91,338 @@ def load_instrument(host, instrument='blink', always_restart=False):
 
 def command(classname=None, funcname=None):
     def real_command(func):
-        def wrapper(self, *args):
-            device_name = classname or self.__class__.__name__
-            cmd_name = funcname or func.__name__
-            device_id, cmd_id, cmd_args = self.client.get_ids(device_name, cmd_name)
-            self.client.send_command(device_id, cmd_id, cmd_args, *args)
-            self.client.last_device_called = device_name
-            self.client.last_cmd_called = cmd_name
-            return func(self, *args)
+        cmd_name = funcname or func.__name__
+        def wrapper(self, *args, **kwargs):
+            # Keyword arguments (e.g. out=) only go to func, not to the server
+            cmd = self.client.get_command(classname or self.__class__.__name__, cmd_name)
+            return self.client.call(cmd, func, self, args, kwargs)
         return wrapper
     return real_command
 
+class CompiledCommand:
+    ''' Ids and frame serializer of one command, resolved once per client '''
+    def __init__(self, device_name, cmd_name, device_id, cmd_id, cmd_args, ret=None):
+        self.device_name = device_name
+        self.cmd_name = cmd_name
+        self.device_id = device_id
+        self.cmd_id = cmd_id
+        self.args = cmd_args
+        self.ret = ret or ReturnDecoder(device_name, cmd_name, None)
+        self.serializer = Serializer(cmd_args, reuse_buffer=True)
+
+    def frame(self, *args):
+        ''' Request frame for args, only valid until the next call '''
+        return self.serializer.frame(self.device_id, self.cmd_id, args)
+
+class ReturnDecoder:
+    ''' Return type of a command, compiled once from its ret_type in get_cmds
+
+    Holds what the recv_* methods check a reply against: the C++ type, and
+    for std::array and std::vector the element dtype and array length.
+    Scalar returns get their reply struct compiled here, so recv_uint32 and
+    the like only compare its format. The dtype and length of each
+    recv_array/recv_vector call that passed the checks are remembered, so
+    repeated receives skip both.
+    '''
+    def __init__(self, device_name, cmd_name, ret_type):
+        self.name = '{}::{}'.format(device_name, cmd_name)
+        self.ret_type = ret_type
+        self.type = (ret_type or '').split('&')[0].strip()
+        self.element_type = None
+        self.dtype = None
+        self.length = None
+        if is_std_array(self.type):
+            self.kind = 'array'
+            params = get_std_array_params(self.type)
+            self.element_type = params['T']
+            self.length = int(params['N'])
+        elif is_std_vector(self.type):
+            self.kind = 'vector'
+            self.element_type = get_std_vector_params(self.type)['T']
+        elif is_std_tuple(self.type):
+            self.kind = 'tuple'
+        else:
+            self.kind = 'scalar'
+        if self.element_type in cpp_to_np_types:
+            self.dtype = np.dtype(cpp_to_np_types[self.element_type]).newbyteorder('<')
+        self.format = ret_formats.get(self.type) # struct format of scalar returns
+        self.reply = reply_struct(self.format) if self.format else None
+        self.layouts = {} # (shape or None, dtype, check) -> (little-endian dtype, length)
+
+    def check_type(self, expected_types):
+        if self.type not in expected_types:
+            raise TypeError('{} returns a {}.'.format(self.name, self.type))
+
+    def check_array(self, dtype, arr_len):
+        if self.kind != 'array':
+            raise TypeError('Expect call to recv_array [{} returns a {}].'.format(self.name, self.ret_type))
+        if self.dtype is None or np.dtype(dtype) != self.dtype:
+            raise TypeError('{} expects elements of type {}.'.format(self.name, self.element_type))
+        if arr_len != self.length:
+            raise ValueError('{} expects {} elements.'.format(self.name, self.length))
+
+    def check_vector(self, dtype):
+        if self.kind != 'vector':
+            raise TypeError('Expect call to recv_vector [{} returns a {}].'.format(self.name, self.ret_type))
+        if self.dtype is None or np.dtype(dtype) != self.dtype:
+            raise TypeError('{} expects elements of type {}.'.format(self.name, self.element_type))
+
+    # TODO add types check
+    def check_tuple(self):
+        if self.kind != 'tuple':
+            raise TypeError('{} returns a {} not a std::tuple.'.format(self.name, self.ret_type))
+
+    def array_layout(self, shape, dtype, check=True):
+        ''' Little-endian dtype and number of elements of recv_array(shape, dtype) '''
+        key = (shape if isinstance(shape, int) else tuple(shape), dtype, check)
+        try:
+            return self.layouts[key]
+        except KeyError:
+            arr_len = int(np.prod(shape))
+            if check:
+                self.check_array(dtype, arr_len)
+            return self.remember_layout(key, (np.dtype(dtype).newbyteorder('<'), arr_len))
+
+    def vector_layout(self, dtype, check=True):
+        ''' Little-endian dtype of recv_vector(dtype) '''
+        key = (None, dtype, check)
+        try:
+            return self.layouts[key][0]
+        except KeyError:
+            if check:
+                self.check_vector(dtype)
+            return self.remember_layout(key, (np.dtype(dtype).newbyteorder('<'), None))[0]
+
+    def remember_layout(self, key, layout):
+        # A command is read with a handful of shapes, but callers passing a
+        # new shape each time must not grow the cache without bound
+        if len(self.layouts) >= MAX_LAYOUTS:
+            self.layouts.clear()
+        self.layouts[key] = layout
+        return layout
+
+MAX_LAYOUTS = 16 # recv_array/recv_vector layouts remembered per command
+
+# Precompiled reply structs, by format of the returned values
+reply_structs = {}
+
+def reply_struct(fmt):
+    try:
+        return reply_structs[fmt]
+    except KeyError:
+        _struct = reply_structs[fmt] = struct.Struct('>IHH' + fmt)
+        return _struct
+
+class CommandFuture:
+    ''' Return value of a command queued in a batch, available once the batch is sent '''
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        if not self._done:
+            raise RuntimeError('The batch has not been sent yet')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+class Batch:
+    ''' Commands queued by KoheronClient.batch()
+
+    Inside the with block, decorated commands return a CommandFuture instead
+    of waiting for their reply. On exit all frames go out in one sendall,
+    then the replies are read in order (void commands have none) and the
+    futures resolved. If a reply cannot be read, the remaining ones are
+    left on the socket and the exception is raised.
+    '''
+    def __init__(self, client):
+        self.client = client
+        self.frames = []
+        self.calls = []
+        self.futures = []
+
+    def add(self, cmd, frame, func, driver, args, kwargs):
+        self.frames.append(bytes(frame)) # compiled frames reuse their buffer
+        future = CommandFuture()
+        self.calls.append((cmd, func, driver, args, kwargs, future))
+        self.futures.append(future)
+        return future
+
+    def __enter__(self):
+        if self.client.lock is not None:
+            self.client.lock.acquire() # other threads wait for the whole batch
+        if self.client.batch_queue is not None:
+            self.release()
+            raise RuntimeError('Batches cannot be nested')
+        self.client.batch_queue = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None: # nothing is sent otherwise
+                self.flush()
+                self.read_replies()
+        finally:
+            self.client.batch_queue = None
+            self.release()
+        return False
+
+    def release(self):
+        if self.client.lock is not None:
+            self.client.lock.release()
+
+    def flush(self):
+        ''' Stop queueing and send the queued frames '''
+        self.client.batch_queue = None
+        if self.frames:
+            self.client.send_frame(b''.join(self.frames))
+
+    def read_replies(self):
+        ''' Read the replies of the sent frames and resolve the futures '''
+        client = self.client
+        for i, (cmd, func, driver, args, kwargs, future) in enumerate(self.calls):
+            client.last_command = cmd
+            try:
+                future.set_result(func(driver, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+                for call in self.calls[i+1:]:
+                    call[-1].set_exception(ConnectionError('Reply lost after {} failed'.format(cmd.cmd_name)))
+                raise
+
 # --------------------------------------------
 # Helper functions
 # --------------------------------------------
 
 def make_command(*args):
-    buff = bytearray()
-    append(buff, 0, 4)        # RESERVED
-    append(buff, args[0], 2)  # driver_id
-    append(buff, args[1], 2)  # op_id
-    # Payload
-    if len(args[2:]) > 0:
-        buff += build_payload(args[2], args[3:])
-    else:
-        append(buff, 0, 8)
-    return buff
-
-def append(buff, value, size):
-    if size <= 4:
-        for i in reversed(range(size)):
-            buff.append((value >> (8 * i)) & 0xff)
-    elif size == 8:
-        append(buff, value >> 32, 4)
-        append(buff, value, 4)
-
-def append_vector(buff, array, array_params):
-    if cpp_to_np_types[array_params['T']] != array.dtype:
-        raise TypeError('Invalid array type. Expected {} but received {}.'
-                        .format(cpp_to_np_types[array_params['T']], array.dtype))
-
-    arr_bytes = bytearray(array)
-    append(buff, len(arr_bytes), 4)
-    buff += arr_bytes
-
-def append_array(buff, array, array_params):
-    if int(array_params['N']) != len(array):
-        raise ValueError('Invalid array length. Expected {} but received {}.'
-                         .format(array_params['N'], len(array)))
-
-    if cpp_to_np_types[array_params['T']] != array.dtype:
-        raise TypeError('Invalid array type. Expected {} but received {}.'
-                        .format(cpp_to_np_types[array_params['T']], array.dtype))
-
-    buff += bytearray(array)
-
-# http://stackoverflow.com/questions/14431170/get-the-bits-of-a-float-in-python
-def float_to_bits(f):
-    return struct.unpack('>l', struct.pack('>f', f))[0]
-
-def double_to_bits(d):
-    return struct.unpack('>q', struct.pack('>d', d))[0]
+    if len(args[2:]) == 0:
+        return bytearray(struct.pack('>IHHQ', 0, args[0], args[1], 0))
+    return Serializer(args[2]).frame(args[0], args[1], args[3:])
 
 def build_payload(cmd_args, args):
-    payload = bytearray()
-
-    if len(cmd_args) != len(args):
-        raise ValueError('Invalid number of arguments. Expected {} but received {}.'
-                         .format(len(cmd_args), len(args)))
-
-    if len(cmd_args) == 0:
-        return payload
-
-    for i, arg in enumerate(cmd_args):
-        if arg['type'] in ['uint8_t','int8_t']:
-            append(payload, args[i], 1)
-        elif arg['type'] in ['uint16_t','int16_t']:
-            append(payload, args[i], 2)
-        elif arg['type'] in ['uint32_t','int32_t']:
-            append(payload, args[i], 4)
-        elif arg['type'] in ['uint64_t','int64_t']:
-            append(payload, args[i], 8)
-        elif arg['type'] == 'float':
-            append(payload, float_to_bits(args[i]), 4)
-        elif arg['type'] == 'double':
-            append(payload, double_to_bits(args[i]), 8)
-        elif arg['type'] == 'bool':
-            if args[i]:
-                append(payload, 1, 1)
+    return Serializer(cmd_args).frame(0, 0, args)[8:]
+
+class Serializer:
+    ''' Request frame writer compiled from the args of a command in get_cmds
+
+    Runs of scalar arguments (and the header) are packed by one precompiled
+    struct each, std::array, std::vector and std::string arguments are copied
+    in between, all into a single buffer allocated to the frame size.
+    Integers wrap around to their width and everything but the array data
+    is big-endian.
+    '''
+    def __init__(self, cmd_args, reuse_buffer=False):
+        self.n_args = len(cmd_args)
+        self.reuse_buffer = reuse_buffer
+        self.buffer = bytearray()
+        self.steps = []
+        self.fixed_size = 0
+        fmt, scalars = '>IHH', [] # header fields are packed with the first scalars
+        for i, arg in enumerate(cmd_args):
+            _type = arg['type']
+            if _type in scalar_formats:
+                fmt += scalar_formats[_type][0]
+                scalars.append((i, scalar_formats[_type][1]))
+                continue
+            if fmt != '>':
+                self._add_scalars(fmt, scalars)
+                fmt, scalars = '>', []
+            if is_std_array(_type):
+                params = get_std_array_params(_type)
+                dtype = cpp_to_np_types[params['T']]
+                self.steps.append(('array', i, dtype, int(params['N'])))
+                self.fixed_size += np.dtype(dtype).itemsize * int(params['N'])
+            elif is_std_vector(_type):
+                self.steps.append(('vector', i, cpp_to_np_types[get_std_vector_params(_type)['T']], None))
+                self.fixed_size += 4
+            elif is_std_string(_type):
+                self.steps.append(('string', i, None, None))
+                self.fixed_size += 4
             else:
-                append(payload, 0, 1)
-        elif is_std_array(arg['type']):
-            append_array(payload, args[i], get_std_array_params(arg['type']))
-        elif is_std_vector(arg['type']):
-            append_vector(payload, args[i], get_std_vector_params(arg['type']))
-        elif is_std_string(arg['type']):
-            append(payload, len(args[i]), 4)
-            payload.extend(args[i].encode())
+                raise ValueError('Unsupported type "' + _type + '"')
+        if fmt != '>':
+            self._add_scalars(fmt, scalars)
+        self.dynamic = any(step[0] in ('vector', 'string') for step in self.steps)
+
+    def _add_scalars(self, fmt, scalars):
+        _struct = struct.Struct(fmt)
+        self.steps.append(('scalars', _struct, scalars, fmt.startswith('>IHH')))
+        self.fixed_size += _struct.size
+
+    def frame(self, device_id, cmd_id, args):
+        if len(args) != self.n_args:
+            raise ValueError('Invalid number of arguments. Expected {} but received {}.'
+                             .format(self.n_args, len(args)))
+        # Containers are checked and sized before anything is written
+        size = self.fixed_size
+        data = {}
+        for step in self.steps:
+            kind, i = step[0], step[1]
+            if kind == 'array':
+                if step[3] != len(args[i]):
+                    raise ValueError('Invalid array length. Expected {} but received {}.'
+                                     .format(step[3], len(args[i])))
+                data[i] = self._array_bytes(args[i], step[2])
+            elif kind == 'vector':
+                data[i] = self._array_bytes(args[i], step[2])
+                size += len(data[i])
+            elif kind == 'string':
+                data[i] = args[i].encode()
+                size += len(data[i])
+
+        if self.reuse_buffer and len(self.buffer) == size:
+            buff = self.buffer
         else:
-            raise ValueError('Unsupported type "' + arg['type'] + '"')
-
-    return payload
+            buff = bytearray(size)
+            if self.reuse_buffer and not self.dynamic:
+                self.buffer = buff
+
+        offset = 0
+        for step in self.steps:
+            kind, i = step[0], step[1]
+            if kind == 'scalars':
+                _struct, scalars, with_header = step[1:]
+                values = [args[j] if mask is None else operator.index(args[j]) & mask for j, mask in scalars]
+                if with_header:
+                    _struct.pack_into(buff, offset, 0, device_id, cmd_id, *values)
+                else:
+                    _struct.pack_into(buff, offset, *values)
+                offset += _struct.size
+                continue
+            if kind != 'array': # length prefix
+                struct.pack_into('>I', buff, offset, len(data[i]))
+                offset += 4
+            buff[offset:offset + len(data[i])] = data[i]
+            offset += len(data[i])
+        return buff
+
+    @staticmethod
+    def _array_bytes(array, dtype):
+        if dtype != array.dtype:
+            raise TypeError('Invalid array type. Expected {} but received {}.'
+                            .format(dtype, array.dtype))
+        return memoryview(np.ascontiguousarray(array)).cast('B')
+
+# struct formats of the scalar argument types, with the mask applied to integers
+scalar_formats = {
+    'uint8_t': ('B', 0xff), 'int8_t': ('B', 0xff),
+    'uint16_t': ('H', 0xffff), 'int16_t': ('H', 0xffff),
+    'uint32_t': ('I', 0xffffffff), 'int32_t': ('I', 0xffffffff),
+    'uint64_t': ('Q', 0xffffffffffffffff), 'int64_t': ('Q', 0xffffffffffffffff),
+    'float': ('f', None), 'double': ('d', None), 'bool': ('?', None)
+}
 
 def is_std_array(_type):
     base_type = _type.split('<')[0].strip()
@@ -204,17 +460,63 @@ cpp_to_np_types = {
   'double': 'float64'
 }
 
+# struct formats of the scalar return types read by recv_uint32, recv_float...
+ret_formats = {
+    'uint32_t': 'I', 'unsigned int': 'I',
+    'uint64_t': 'Q', 'unsigned long': 'Q',
+    'int32_t': 'i', 'int': 'i',
+    'float': 'f', 'double': 'd', 'bool': '?'
+}
+for fmt in set(ret_formats.values()):
+    reply_struct(fmt) # unchecked recv_* read reply_structs directly
+
+def check_server_version(server_version):
+    server_version_ = server_version.split('.')
+    client_version_ = __version__.split('.')
+    if  (client_version_[0] != server_version_[0]) or (client_version_[1] < server_version_[1]):
+        print('Warning: your client version {} is incompatible with the server version {}'
+               .format(__version__, server_version))
+        print('Upgrade your client with "pip install --upgrade koheron"')
+
+unknown_return = ReturnDecoder('', '', None) # for replies read without a decorated command
+
+# --------------------------------------------
+# Manifest cache
+# --------------------------------------------
+
+manifest_cache = {} # (host, server version, get_cmds manifest) -> command tables and instruments seen
+
+def make_ret_decoders(devices_idx, cmds_ret_types_list):
+    ''' ReturnDecoder of each command, by device id then command name '''
+    cmds_ret_decoders_list = [None]*len(cmds_ret_types_list)
+    for device_name, device_id in devices_idx.items():
+        cmds_ret_decoders_list[device_id] = dict(
+            (cmd_name, ReturnDecoder(device_name, cmd_name, ret_type))
+            for cmd_name, ret_type in cmds_ret_types_list[device_id].items())
+    return cmds_ret_decoders_list
+
 # --------------------------------------------
 # KoheronClient
 # --------------------------------------------
 
 class KoheronClient:
-    def __init__(self, host='', port=36000, unixsock=''):
+    def __init__(self, host='', port=36000, unixsock='', rcvbuf=16384, sndbuf=None, thread_safe=False,
+                 cache_manifest=True, check_types=True):
         ''' Initialize connection with koheron-server
 
         Args:
             host: A string with the IP address
             port: Port of the TCP connection (must be an integer)
+            rcvbuf: Size of the socket receive buffer in bytes, None for the OS
+                default (better for bulk transfers such as large vectors)
+            sndbuf: Size of the socket send buffer in bytes, None for the OS default
+            thread_safe: If True, each command (request and reply) runs under a lock
+                so that several threads can share the connection
+            cache_manifest: If True, the command tables are shared with the
+                earlier clients of this process that got the same manifest
+                from the server, instead of being parsed again
+            check_types: If False, replies are not checked against the return
+                types of the commands (faster in hot loops)
         '''
         if type(host) != str:
             raise TypeError('IP address must be a string')
@@ -226,14 +528,21 @@ class KoheronClient:
         self.port = port
         self.unixsock = unixsock
         self.is_connected = False
+        self.cache_manifest = cache_manifest
+        self.check_types = check_types
+        self.last_command = None # CompiledCommand whose reply is read next
+        self.batch_queue = None # Batch being queued, if any
+        self.lock = threading.RLock() if thread_safe else None
+        # Reused for the reply headers
+        self.header_buffer = bytearray(struct.calcsize('>IHHI'))
+        self.array_header_buffer = bytearray(struct.calcsize('>IHH'))
 
         if host != '':
             try:
                 self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-                # Prevent delayed ACK on Ubuntu
-                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
-                so_rcvbuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+                # A small receive buffer prevents delayed ACK on Ubuntu
+                self.set_buffer_sizes(rcvbuf, sndbuf)
 
                 #   Disable Nagle algorithm for real-time response:
                 self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -248,6 +557,7 @@ class KoheronClient:
         elif unixsock != '':
             try:
                 self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.set_buffer_sizes(rcvbuf, sndbuf)
                 self.sock.connect(unixsock)
                 self.is_connected = True
             except BaseException as e:
@@ -256,21 +566,54 @@ class KoheronClient:
             raise ValueError('Unknown socket type')
 
         if self.is_connected:
-            self.check_version()
-            self.load_devices()
+            self.open_session()
+
+    def set_buffer_sizes(self, rcvbuf=None, sndbuf=None):
+        ''' Set the socket receive and send buffer sizes (bytes), None keeps the current size '''
+        if rcvbuf is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if sndbuf is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
 
     def check_version(self):
         try:
             self.send_command(1, 0)
         except:
             raise ConnectionError('Failed to retrieve the server version')
-        server_version = self.recv_string(check_type=False)
-        server_version_ = server_version.split('.')
-        client_version_ = __version__.split('.')
-        if  (client_version_[0] != server_version_[0]) or (client_version_[1] < server_version_[1]):
-            print('Warning: your client version {} is incompatible with the server version {}'
-                   .format(__version__, server_version))
-            print('Upgrade your client with "pip install --upgrade koheron"')
+        check_server_version(self.recv_string(check_type=False))
+
+    def open_session(self):
+        ''' Check the server version and load the command tables, in one round trip
+
+        The manifest is only parsed if its command tables are not cached yet.
+        '''
+        try:
+            self.send_frame(make_command(1, 0, []) + make_command(1, 1, []))
+        except:
+            raise ConnectionError('Failed to send initialization command')
+        server_version = bytes(self.recv_dynamic_payload())
+        manifest = bytes(self.recv_dynamic_payload())
+        check_server_version(server_version.decode('utf8'))
+        self.manifest_key = (self.host or self.unixsock, server_version, manifest)
+        entry = manifest_cache.get(self.manifest_key) if self.cache_manifest else None
+        self.manifest_cached = entry is not None
+        if entry is None:
+            self.parse_commands(json.loads(manifest.decode('utf8')))
+            entry = {'tables': self.command_tables(), 'instruments': []}
+            if self.cache_manifest:
+                manifest_cache[self.manifest_key] = entry
+        else:
+            self.set_command_tables(entry['tables'])
+        self.instruments = list(entry['instruments']) # instruments this manifest was seen with
+
+    def remember_instrument(self, name):
+        ''' Record in the cache that the server's manifest belongs to instrument name '''
+        if name in self.instruments:
+            return
+        self.instruments.append(name)
+        entry = manifest_cache.get(self.manifest_key)
+        if entry is not None:
+            entry['instruments'] = list(self.instruments)
 
     def load_devices(self):
         try:
@@ -278,15 +621,18 @@ class KoheronClient:
         except:
             raise ConnectionError('Failed to send initialization command')
 
-        self.commands = self.recv_json(check_type=False)
-        # pprint.pprint(self.commands)
-        self.devices_idx = {}
-        self.cmds_idx_list = [None]*(2 + len(self.commands))
-        self.cmds_args_list = [None]*(2 + len(self.commands))
-        self.cmds_ret_types_list = [None]*(2 + len(self.commands))
+        self.parse_commands(self.recv_json(check_type=False))
+
+    def parse_commands(self, commands):
+        ''' Build the command tables from the get_cmds manifest '''
+        # pprint.pprint(commands)
+        devices_idx = {}
+        cmds_idx_list = [None]*(2 + len(commands))
+        cmds_args_list = [None]*(2 + len(commands))
+        cmds_ret_types_list = [None]*(2 + len(commands))
 
-        for device in self.commands:
-            self.devices_idx[device['class']] = device['id']
+        for device in commands:
+            devices_idx[device['class']] = device['id']
             cmds_idx = {}
             cmds_args = {}
             cmds_ret_type = {}
@@ -294,9 +640,47 @@ class KoheronClient:
                 cmds_idx[cmd['name']] = cmd['id']
                 cmds_args[cmd['name']] = cmd['args']
                 cmds_ret_type[cmd['name']] = cmd.get('ret_type', None)
-            self.cmds_idx_list[device['id']] = cmds_idx
-            self.cmds_args_list[device['id']] = cmds_args
-            self.cmds_ret_types_list[device['id']] = cmds_ret_type
+            cmds_idx_list[device['id']] = cmds_idx
+            cmds_args_list[device['id']] = cmds_args
+            cmds_ret_types_list[device['id']] = cmds_ret_type
+
+        self.set_command_tables((commands, devices_idx, cmds_idx_list, cmds_args_list, cmds_ret_types_list,
+                                 make_ret_decoders(devices_idx, cmds_ret_types_list)))
+
+    def command_tables(self):
+        return (self.commands, self.devices_idx, self.cmds_idx_list, self.cmds_args_list, self.cmds_ret_types_list,
+                self.cmds_ret_decoders_list)
+
+    def set_command_tables(self, tables):
+        (self.commands, self.devices_idx, self.cmds_idx_list, self.cmds_args_list, self.cmds_ret_types_list,
+         self.cmds_ret_decoders_list) = tables
+        self.compiled_commands = {}
+
+    def batch(self):
+        ''' Context in which commands are queued and sent together, see Batch
+
+        with client.batch():
+            driver.set_fast_delay_1(100)
+            count = driver.get_count()
+        print(count.result())
+        '''
+        return Batch(self)
+
+    def call(self, cmd, func, driver, args, kwargs):
+        ''' Send a compiled command and read its reply with func, or queue it in the current batch '''
+        if self.lock is None:
+            return self._call(cmd, func, driver, args, kwargs)
+        with self.lock:
+            return self._call(cmd, func, driver, args, kwargs)
+
+    def _call(self, cmd, func, driver, args, kwargs):
+        frame = cmd.frame(*args)
+        if self.batch_queue is not None:
+            return self.batch_queue.add(cmd, frame, func, driver, args, kwargs)
+        self.send_frame(frame)
+        # Return type context of the recv_* checks
+        self.last_command = cmd
+        return func(driver, *args, **kwargs)
 
     def get_ids(self, device_name, command_name):
         device_id = self.devices_idx[device_name]
@@ -304,100 +688,147 @@ class KoheronClient:
         cmd_args = self.cmds_args_list[device_id][command_name]
         return device_id, cmd_id, cmd_args
 
+    def get_command(self, device_name, command_name):
+        ''' CompiledCommand of a device command, built on first use '''
+        try:
+            return self.compiled_commands[(device_name, command_name)]
+        except KeyError:
+            device_id, cmd_id, cmd_args = self.get_ids(device_name, command_name)
+            cmd = CompiledCommand(device_name, command_name, device_id, cmd_id, cmd_args,
+                                  self.cmds_ret_decoders_list[device_id][command_name])
+            self.compiled_commands[(device_name, command_name)] = cmd
+            return cmd
+
+    def last_return(self):
+        ''' ReturnDecoder of the command whose reply is read next '''
+        if self.last_command is None:
+            return unknown_return
+        return self.last_command.ret
+
     def check_ret_type(self, expected_types):
-        device_id = self.devices_idx[self.last_device_called]
-        ret_type = self.cmds_ret_types_list[device_id][self.last_cmd_called]
-        ret_type = ret_type.split('&')[0].strip()
-        if ret_type not in expected_types:
-            raise TypeError('{}::{} returns a {}.'.format(self.last_device_called, self.last_cmd_called, ret_type))
+        if self.check_types:
+            self.last_return().check_type(expected_types)
 
     def check_ret_array(self, dtype, arr_len):
-        device_id = self.devices_idx[self.last_device_called]
-        ret_type = self.cmds_ret_types_list[device_id][self.last_cmd_called]
-        if not is_std_array(ret_type):
-            raise TypeError('Expect call to recv_array [{}::{} returns a {}].'.format(self.last_device_called, self.last_cmd_called, ret_type))
-        params = get_std_array_params(ret_type)
-        if dtype != cpp_to_np_types[params['T']]:
-            raise TypeError('{}::{} expects elements of type {}.'.format(self.last_device_called, self.last_cmd_called, params['T']))
-        if arr_len != int(params['N']):
-            raise ValueError('{}::{} expects {} elements.'.format(self.last_device_called, self.last_cmd_called, params['N']))
+        if self.check_types:
+            self.last_return().check_array(dtype, arr_len)
 
     def check_ret_vector(self, dtype):
-        device_id = self.devices_idx[self.last_device_called]
-        ret_type = self.cmds_ret_types_list[device_id][self.last_cmd_called]
-        if not is_std_vector(ret_type):
-            raise TypeError('Expect call to recv_vector [{}::{} returns a {}].'.format(self.last_device_called, self.last_cmd_called, ret_type))
-        vect_type = get_std_vector_params(ret_type)['T']
-        if dtype != cpp_to_np_types[vect_type]:
-            raise TypeError('{}::{} expects elements of type {}.'.format(self.last_device_called, self.last_cmd_called, vect_type))
+        if self.check_types:
+            self.last_return().check_vector(dtype)
 
-    # TODO add types check
     def check_ret_tuple(self):
-        device_id = self.devices_idx[self.last_device_called]
-        ret_type = self.cmds_ret_types_list[device_id][self.last_cmd_called]
-        if not is_std_tuple(ret_type):
-            raise TypeError('{}::{} returns a {} not a std::tuple.'.format(self.last_device_called, self.last_cmd_called, ret_type))
+        if self.check_types:
+            self.last_return().check_tuple()
 
     # -------------------------------------------------------
     # Send/Receive
     # -------------------------------------------------------
 
     def send_command(self, device_id, cmd_id, cmd_args=[], *args):
-        cmd = make_command(device_id, cmd_id, cmd_args, *args)
-        if self.sock.send(cmd) == 0:
+        self.send_frame(make_command(device_id, cmd_id, cmd_args, *args))
+
+    def send_frame(self, frame):
+        try:
+            self.sock.sendall(frame)
+        except socket.error:
             raise ConnectionError('send_command: Socket connection broken')
 
-    def recv_all(self, n_bytes):
-        '''Receive exactly n_bytes bytes.'''
-        data = []
+    def recv_into(self, buff):
+        '''Fill a writable buffer (bytearray, numpy array, memoryview) from the socket.'''
+        view = memoryview(buff).cast('B')
+        n_bytes = len(view)
         n_rcv = 0
         while n_rcv < n_bytes:
             try:
-                chunk = self.sock.recv(n_bytes - n_rcv)
-                if chunk == '':
-                    break
-                n_rcv += len(chunk)
-                data.append(chunk)
-            except:
+                n = self.sock.recv_into(view[n_rcv:])
+            except socket.error:
                 raise ConnectionError('recv_all: Socket connection broken.')
-        return b''.join(data)
+            if n == 0:
+                raise ConnectionError('recv_all: Socket closed after {} of {} bytes.'.format(n_rcv, n_bytes))
+            n_rcv += n
+        return buff
 
-    def recv_dynamic_payload(self):
-        reserved, class_id, func_id, length = struct.unpack('>IHHI', self.recv_all(struct.calcsize('>IHHI')))
+    def recv_all(self, n_bytes):
+        '''Receive exactly n_bytes bytes.'''
+        buff = bytearray(n_bytes)
+        # Small replies nearly always arrive in one piece
+        try:
+            n = self.sock.recv_into(buff)
+        except socket.error:
+            raise ConnectionError('recv_all: Socket connection broken.')
+        if n < n_bytes:
+            if n == 0:
+                raise ConnectionError('recv_all: Socket closed after 0 of {} bytes.'.format(n_bytes))
+            self.recv_into(memoryview(buff)[n:])
+        return buff
+
+    def recv_discard(self, n_bytes):
+        '''Receive and drop n_bytes bytes, keeping the connection in sync.'''
+        scratch = memoryview(bytearray(min(n_bytes, 65536)))
+        while n_bytes > 0:
+            n = min(n_bytes, len(scratch))
+            self.recv_into(scratch[:n])
+            n_bytes -= n
+
+    def recv_payload_into(self, n_bytes, out, dtype):
+        '''Receive n_bytes into the caller's array out and return a view of the received elements.'''
+        if out.dtype != dtype:
+            self.recv_discard(n_bytes)
+            raise TypeError('Invalid output type. Expected {} but received {}.'.format(dtype, out.dtype))
+        n_elements = n_bytes // dtype.itemsize
+        if n_elements > out.size or not out.flags.c_contiguous:
+            self.recv_discard(n_bytes)
+            raise ValueError('Output array too small or not contiguous: {} elements received.'.format(n_elements))
+        data = out.reshape(-1)[:n_elements]
+        self.recv_into(data)
+        return data
+
+    def recv_dynamic_header(self):
+        '''Receive the header of a vector or string reply and return the payload length.'''
+        reserved, class_id, func_id, length = struct.unpack('>IHHI', self.recv_into(self.header_buffer))
         assert reserved == 0
-        return self.recv_all(length)
+        return length
+
+    def recv_dynamic_payload(self):
+        return self.recv_all(self.recv_dynamic_header())
 
     def recv(self, fmt='I'):
-        fmt_ = '>IHH' + fmt
-        t = struct.unpack(fmt_, self.recv_all(struct.calcsize(fmt_)))[3:]
+        _struct = reply_struct(fmt)
+        t = _struct.unpack(self.recv_all(_struct.size))[3:]
         if len(t) == 1:
             return t[0]
         else:
             return t
 
+    def scalar_reply(self, fmt):
+        ''' Reply struct of the last command, which must return a scalar of format fmt '''
+        ret = self.last_return()
+        if ret.format != fmt:
+            raise TypeError('{} returns a {}.'.format(ret.name, ret.type))
+        return ret.reply
+
+    def recv_scalar(self, fmt='I'):
+        _struct = self.scalar_reply(fmt) if self.check_types else reply_structs[fmt]
+        return _struct.unpack(self.recv_all(_struct.size))[3]
+
     def recv_uint32(self):
-        self.check_ret_type(['uint32_t', 'unsigned int'])
-        return self.recv()
+        return self.recv_scalar('I')
 
     def recv_uint64(self):
-        self.check_ret_type(['uint64_t', 'unsigned long'])
-        return self.recv(fmt='Q')
+        return self.recv_scalar('Q')
 
     def recv_int32(self):
-        self.check_ret_type(['int32_t', 'int'])
-        return self.recv(fmt='i')
+        return self.recv_scalar('i')
 
     def recv_float(self):
-        self.check_ret_type(['float'])
-        return self.recv(fmt='f')
+        return self.recv_scalar('f')
 
     def recv_double(self):
-        self.check_ret_type(['double'])
-        return self.recv(fmt='d')
+        return self.recv_scalar('d')
 
     def recv_bool(self):
-        self.check_ret_type(['bool'])
-        return self.recv(fmt='?')
+        return self.recv_scalar('?')
 
     def recv_string(self, check_type=True):
         if check_type:
@@ -409,23 +840,27 @@ class KoheronClient:
             self.check_ret_type(['const std::string', 'std::string', 'const char *', 'const char*'])
         return json.loads(self.recv_string(check_type=False))
 
-    def recv_vector(self, dtype='uint32', check_type=True):
-        '''Receive a numpy array with unknown length.'''
-        if check_type:
-            self.check_ret_vector(dtype)
-        dtype = np.dtype(dtype)
-        buff = self.recv_dynamic_payload()
-        return np.frombuffer(buff, dtype=dtype.newbyteorder('<'))
+    def recv_vector(self, dtype='uint32', check_type=True, out=None):
+        '''Receive a numpy array with unknown length.
 
-    def recv_array(self, shape, dtype='uint32', check_type=True):
-        '''Receive a numpy array with known shape.'''
-        arr_len = int(np.prod(shape))
-        if check_type:
-            self.check_ret_array(dtype, arr_len)
-        dtype = np.dtype(dtype)
-        self.recv(fmt='')
+        If out is given, the data is written into it and a view of the
+        received length is returned. It must be large enough.
+        '''
+        dtype = self.last_return().vector_layout(dtype, check_type and self.check_types)
+        if out is not None:
+            return self.recv_payload_into(self.recv_dynamic_header(), out, dtype)
+        # The payload is read straight into the buffer the array views
+        buff = self.recv_dynamic_payload()
+        return np.frombuffer(buff, dtype=dtype)
+
+    def recv_array(self, shape, dtype='uint32', check_type=True, out=None):
+        '''Receive a numpy array with known shape, into out if given.'''
+        dtype, arr_len = self.last_return().array_layout(shape, dtype, check_type and self.check_types)
+        self.recv_into(self.array_header_buffer)
+        if out is not None:
+            return self.recv_payload_into(dtype.itemsize * arr_len, out, dtype).reshape(shape)
         buff = self.recv_all(dtype.itemsize * arr_len)
-        return np.frombuffer(buff, dtype=dtype.newbyteorder('<')).reshape(shape)
+        return np.frombuffer(buff, dtype=dtype).reshape(shape)
 
     def recv_tuple(self, fmt, check_type=True):
         if check_type:
@@ -435,3 +870,45 @@ class KoheronClient:
     def __del__(self):
         if hasattr(self, 'sock'):
             self.sock.close()
+
+class ThreadLocalClient:
+    ''' Stand-in for KoheronClient with one connection per thread
+
+    Drivers built on it can be called from any number of threads without
+    waiting for each other: every thread talks to koheron-server over its
+    own KoheronClient, opened on its first command. The connections stay
+    open until close().
+    '''
+    def __init__(self, host='', port=36000, unixsock='', **kwargs):
+        ''' Same arguments as KoheronClient, the first connection is opened at once '''
+        self.host = host
+        self.port = port
+        self.unixsock = unixsock
+        self.kwargs = kwargs
+        self.clients = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.connection()
+
+    def connection(self):
+        ''' KoheronClient of the calling thread '''
+        try:
+            return self._local.client
+        except AttributeError:
+            client = KoheronClient(self.host, self.port, self.unixsock, **self.kwargs)
+            with self._lock:
+                self.clients.append(client)
+            self._local.client = client
+            return client
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.connection(), name)
+
+    def close(self):
+        with self._lock:
+            for client in self.clients:
+                client.sock.close()
+            self.clients = []
+        self._local = threading.local()
@@ -16,8 +16,9 @@ setup(
     long_description='Please see our GitHub README',
     keywords='FPGA Linux Instrumentation',
     install_requires=['requests', 'Click'],
+    python_requires='>=3.5',
     classifiers=[
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.5'
     ],
     entry_points='''
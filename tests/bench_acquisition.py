@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Run the GUI's acquisition path (Acquisition thread, RingBuffer and
+RollingAverage updates every POLL_INTERVAL) against the simulated Red
+Pitaya at increasing sample rates and network latencies, and report the
+samples lost on the way.
+
+    python3 tests/bench_acquisition.py [seconds]
+'''
+
+import sys
+import os
+import time
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path = [root, os.path.join(root, 'koheron-sdk', 'python')] + sys.path
+from gpi.simulator import SimulatedRedPitaya
+from gpi.acquisition import Acquisition, block_times
+from gpi.buffers import RingBuffer, RollingAverage
+
+POLL_INTERVAL = 0.1
+
+def run(sample_rate, latency, jitter, duration):
+    sim = SimulatedRedPitaya(sample_rate=sample_rate, latency=latency, jitter=jitter, seed=0)
+    history = RingBuffer(30*sample_rate, ('t', 'abs', 'diff'))
+    averages = RollingAverage(('t', 'abs', 'diff'), (0.01, 0.1, 1), sample_rate)
+    acquisition = Acquisition(lambda: sim, sample_rate=sample_rate)
+    start_cpu, start = time.process_time(), time.time()
+    acquisition.start()
+    received = 0
+    while time.time() - start < duration:
+        time.sleep(POLL_INTERVAL)
+        for block in acquisition.get_blocks():
+            times = block_times(block, sample_rate)
+            history.append(times, block.abs_pressures, block.diff_pressures)
+            averages.update(times, block.abs_pressures, block.diff_pressures)
+            received += len(block.words)
+    acquisition.stop()
+    cpu = (time.process_time() - start_cpu)/(time.time() - start)
+    return received, acquisition.dropped_samples, acquisition.lost_samples, cpu
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print('%9s %8s %8s %10s %9s %9s %5s' % ('rate', 'latency', 'jitter', 'received', 'dropped', 'lost', 'cpu'))
+    for sample_rate in (10000, 100000, 1000000):
+        for latency, jitter in ((0, 0), (0.005, 0.02), (0.05, 0.2)):
+            received, dropped, lost, cpu = run(sample_rate, latency, jitter, duration)
+            print('%7d Hz %6.0f ms %6.0f ms %10d %9d %9d %4.0f%%' % (sample_rate, latency*1e3, jitter*1e3,
+                                                                    received, dropped, lost, cpu*100))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Compare the string-based gauge conversion with the vectorized decoder on
+one full get_GPI_data reply (50000 words).
+
+    python3 tests/bench_decode.py
+'''
+
+import sys
+import os
+import timeit
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.data import abs_torr, diff_torr, decode_GPI_data
+
+n_words = 50000
+words = np.random.RandomState(0).randint(0, 2**28, size=n_words).astype('uint32')
+
+def string_decoder():
+    return [abs_torr(i) for i in words], [diff_torr(i) for i in words]
+
+def vector_decoder():
+    return decode_GPI_data(words)
+
+if __name__ == '__main__':
+    abs_ref, diff_ref = string_decoder()
+    abs_vec, diff_vec = vector_decoder()
+    assert abs_vec.tolist() == abs_ref and diff_vec.tolist() == diff_ref
+
+    t_string = min(timeit.repeat(string_decoder, number=1, repeat=3))
+    t_vector = min(timeit.repeat(vector_decoder, number=10, repeat=3)) / 10
+    print('%d words' % n_words)
+    print('string decoder: %8.3f ms' % (t_string * 1e3))
+    print('numpy decoder:  %8.3f ms' % (t_vector * 1e3))
+    print('speedup:        %8.0fx' % (t_string / t_vector))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Python overhead of the koheron client per command, against the local
+stand-in server.
+
+    python3 tests/bench_koheron.py
+'''
+
+import sys
+import os
+import socket
+import struct
+import subprocess
+import timeit
+import numpy as np
+
+sys.path = [os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import KoheronClient
+from koheron.koheron import make_command
+from koheron_server import FakeKoheronServer
+from test_koheron import Loopback
+
+server = FakeKoheronServer()
+client = KoheronClient(server.host, server.port)
+driver = Loopback(client)
+cmd = client.get_command('Loopback', 'set_scalars')
+args = (429496729, -2048, 3.14, True, 2.71, 42)
+
+def uncached_frame():
+    device_id, cmd_id, cmd_args = client.get_ids('Loopback', 'set_scalars')
+    return make_command(device_id, cmd_id, cmd_args, *args)
+
+def compiled_frame():
+    return client.get_command('Loopback', 'set_scalars').frame(*args)
+
+def round_trip():
+    return driver.add(1, 2)
+
+def sequential_calls():
+    return [driver.add(i, 1) for i in range(5)]
+
+def batched_calls():
+    with client.batch():
+        results = [driver.add(i, 1) for i in range(5)]
+    return [r.result() for r in results]
+
+def cold_connect():
+    return KoheronClient(server.host, server.port, cache_manifest=False)
+
+def warm_connect():
+    return KoheronClient(server.host, server.port)
+
+FRESH_CONNECT = '''
+import sys, time
+sys.path.insert(0, {path!r})
+from koheron import KoheronClient
+start = time.perf_counter()
+KoheronClient({host!r}, {port})
+print(time.perf_counter() - start)
+'''
+
+def fresh_process_connect():
+    ''' First connect of a new process, which never finds the manifest cached '''
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'koheron-sdk', 'python')
+    code = FRESH_CONNECT.format(path=path, host=server.host, port=server.port)
+    return float(subprocess.check_output([sys.executable, '-c', code]))
+
+# Reply checks and decoding alone: recv_array fed from a local socket pair
+decode_client = KoheronClient(server.host, server.port)
+decode_client.sock, feed = socket.socketpair()
+decode_client.last_command = decode_client.get_command('Loopback', 'get_array')
+array_reply = struct.pack('>IHH', 0, 2, 9) + np.arange(16, dtype='uint32').tobytes()
+
+def decode_array():
+    feed.sendall(array_reply)
+    return decode_client.recv_array(16, dtype='uint32')
+
+scalar_client = KoheronClient(server.host, server.port)
+scalar_client.sock, scalar_feed = socket.socketpair()
+scalar_client.last_command = scalar_client.get_command('Loopback', 'get_value')
+scalar_reply = struct.pack('>IHHI', 0, 2, 1, 42) * 100
+
+def decode_scalars():
+    scalar_feed.sendall(scalar_reply)
+    for _ in range(100):
+        scalar_client.recv_uint32()
+
+bulk_driver = Loopback(KoheronClient(server.host, server.port, rcvbuf=None))
+N_BULK = 4 << 20 # 16 MB of uint32, like AdcDacDma.get_adc_data
+
+def bulk_transfer():
+    return bulk_driver.get_vector(N_BULK)
+
+if __name__ == '__main__':
+    n = 20000
+    t_uncached = min(timeit.repeat(uncached_frame, number=n, repeat=3)) / n
+    t_compiled = min(timeit.repeat(compiled_frame, number=n, repeat=3)) / n
+    t_call = min(timeit.repeat(round_trip, number=2000, repeat=3)) / 2000
+    print('frame with make_command: %6.2f us' % (t_uncached * 1e6))
+    print('compiled frame:          %6.2f us' % (t_compiled * 1e6))
+    t_sequential = min(timeit.repeat(sequential_calls, number=1000, repeat=3)) / 1000
+    t_batched = min(timeit.repeat(batched_calls, number=1000, repeat=3)) / 1000
+    t_cold = min(timeit.repeat(cold_connect, number=200, repeat=3)) / 200
+    t_warm = min(timeit.repeat(warm_connect, number=200, repeat=3)) / 200
+    t_fresh = min(fresh_process_connect() for _ in range(10))
+    t_checked = min(timeit.repeat(decode_array, number=n, repeat=3)) / n
+    decode_client.check_types = False
+    t_unchecked = min(timeit.repeat(decode_array, number=n, repeat=3)) / n
+    t_scalar_checked = min(timeit.repeat(decode_scalars, number=n // 10, repeat=3)) / (n * 10)
+    scalar_client.check_types = False
+    t_scalar_unchecked = min(timeit.repeat(decode_scalars, number=n // 10, repeat=3)) / (n * 10)
+    t_bulk = min(timeit.repeat(bulk_transfer, number=5, repeat=3)) / 5
+    print('round trip (localhost):  %6.2f us' % (t_call * 1e6))
+    print('5 commands, one by one:  %6.2f us' % (t_sequential * 1e6))
+    print('5 commands, batched:     %6.2f us' % (t_batched * 1e6))
+    print('connect, manifest parsed: %5.0f us' % (t_cold * 1e6))
+    print('connect, manifest cached: %5.0f us' % (t_warm * 1e6))
+    print('connect, fresh process:   %5.0f us' % (t_fresh * 1e6))
+    print('recv_array, checked:     %6.2f us' % (t_checked * 1e6))
+    print('recv_array, unchecked:   %6.2f us' % (t_unchecked * 1e6))
+    print('recv_uint32, checked:    %6.3f us' % (t_scalar_checked * 1e6))
+    print('recv_uint32, unchecked:  %6.3f us' % (t_scalar_unchecked * 1e6))
+    print('16 MB vector (localhost): %5.1f ms, %.0f MB/s' % (t_bulk * 1e3, 4*N_BULK/t_bulk/1e6))
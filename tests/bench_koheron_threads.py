@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Command throughput against the local stand-in server as the number of
+threads grows, for a KoheronClient shared under its lock and for a
+ThreadLocalClient with one connection per thread. The stand-in only
+simulates work with sleep, so the numbers show how waiting on the
+server overlaps, not the Python overhead of a real board.
+
+    python3 tests/bench_koheron_threads.py
+'''
+
+import sys
+import os
+import threading
+import time
+
+sys.path = [os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import KoheronClient, ThreadLocalClient, command
+from koheron_server import FakeKoheronServer, Loopback as ServerLoopback
+
+
+class SlowLoopback(ServerLoopback):
+    ''' Loopback whose commands do not hold the server's driver lock, like
+    independent devices on a board '''
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def add(self, a, b):
+        time.sleep(self.delay)
+        return (a + b) & 0xFFFFFFFF
+
+
+class Loopback(object):
+    def __init__(self, client):
+        self.client = client
+
+    @command()
+    def add(self, a, b):
+        return self.client.recv_uint32()
+
+
+class UnlockedServer(FakeKoheronServer):
+    def _execute(self, device_id, cmd_id, reader, frame):
+        if device_id == 1:
+            return super()._execute(device_id, cmd_id, reader, frame)
+        name, args, ret_type = self.commands[cmd_id]
+        values = [self._read_arg(arg_type, reader, frame) for arg_type, _ in args]
+        return self._reply(cmd_id, ret_type, getattr(self.driver, name)(*values))
+
+
+def throughput(driver, n_threads, duration=0.5):
+    counts = [0]*n_threads
+    stop = threading.Event()
+    def work(k):
+        while not stop.is_set():
+            driver.add(k, 1)
+            counts[k] += 1
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts)/duration
+
+
+if __name__ == '__main__':
+    server = UnlockedServer(SlowLoopback(delay=0.0005)) # 0.5 ms per command on the "board"
+    shared = Loopback(KoheronClient(server.host, server.port, thread_safe=True))
+    per_thread = Loopback(ThreadLocalClient(server.host, server.port))
+    print('threads   locked client   client per thread  (commands/s)')
+    for n_threads in (1, 2, 4, 8):
+        print('%7d   %13.0f   %17.0f' % (n_threads, throughput(shared, n_threads), throughput(per_thread, n_threads)))
+    server.close()
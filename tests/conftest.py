@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def koheron_manifest_cache(monkeypatch):
+    '''
+    Start each test with an empty koheron manifest cache.
+    '''
+    module = sys.modules.get('koheron.koheron')
+    if module is not None:
+        monkeypatch.setattr(module, 'manifest_cache', {})
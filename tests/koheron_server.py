@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Local stand-in for koheron-server, speaking the same wire format, for
+testing the Python clients without a board.
+'''
+
+import sys
+import os
+import json
+import socket
+import struct
+import threading
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import __version__
+
+# Scalar C++ types and their big-endian struct codes
+SCALARS = {
+    'bool': '?', 'uint8_t': 'B', 'int8_t': 'b', 'uint16_t': 'H', 'int16_t': 'h',
+    'uint32_t': 'I', 'unsigned int': 'I', 'int32_t': 'i', 'int': 'i',
+    'uint64_t': 'Q', 'unsigned long': 'Q', 'int64_t': 'q', 'float': 'f', 'double': 'd'
+}
+NP_TYPES = {
+    'bool': 'bool', 'uint8_t': 'uint8', 'int8_t': 'int8', 'uint16_t': 'uint16', 'int16_t': 'int16',
+    'uint32_t': 'uint32', 'unsigned int': 'uint32', 'int32_t': 'int32', 'uint64_t': 'uint64',
+    'int64_t': 'int64', 'float': 'float32', 'double': 'float64'
+}
+
+
+def template_args(_type):
+    return [t.strip() for t in _type.split('<', 1)[1].rsplit('>', 1)[0].split(',')]
+
+
+class Loopback(object):
+    '''
+    Commands of the stand-in server: (name, args, ret_type) and their implementation.
+    '''
+    commands = [
+        ('set_value', [('uint32_t', 'value')], 'void'),
+        ('get_value', [], 'uint32_t'),
+        ('add', [('uint32_t', 'a'), ('uint32_t', 'b')], 'uint32_t'),
+        ('set_scalars', [('uint32_t', 'a'), ('int32_t', 'b'), ('float', 'c'), ('bool', 'd'),
+                         ('double', 'e'), ('int16_t', 'f')], 'bool'),
+        ('get_scalars', [], 'std::tuple<uint32_t, int32_t, float, bool, double, int16_t>'),
+        ('get_u64', [], 'uint64_t'),
+        ('get_double', [], 'double'),
+        ('get_vector', [('uint32_t', 'n')], 'std::vector<uint32_t>&'),
+        ('get_float_vector', [('uint32_t', 'n')], 'std::vector<float>'),
+        ('get_array', [], 'std::array<unsigned int, 16ul>&'),
+        ('set_vector', [('std::vector<uint32_t>', 'data')], 'uint32_t'),
+        ('set_array', [('std::array<float, 4>', 'data'), ('uint8_t', 'tag')], 'double'),
+        ('set_string', [('std::string', 'text')], 'uint32_t'),
+        ('get_string', [], 'std::string'),
+        ('get_json', [], 'std::string'),
+        ('sleep', [('uint32_t', 'ms')], 'uint32_t'),
+    ]
+
+    def __init__(self):
+        self.value = 0
+        self.scalars = (0, 0, 0., False, 0., 0)
+        self.vector = np.zeros(0, dtype='uint32')
+        self.calls = 0
+
+    def set_value(self, value):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+    def add(self, a, b):
+        return (a + b) & 0xFFFFFFFF
+
+    def set_scalars(self, *args):
+        self.scalars = args
+        return True
+
+    def get_scalars(self):
+        return self.scalars
+
+    def get_u64(self):
+        return 2**40 + 3
+
+    def get_double(self):
+        return np.pi
+
+    def get_vector(self, n):
+        return np.arange(n, dtype='uint32')
+
+    def get_float_vector(self, n):
+        return np.arange(n, dtype='float32')/2
+
+    def get_array(self):
+        return np.arange(16, dtype='uint32')*3
+
+    def set_vector(self, data):
+        self.vector = data
+        return int(data.sum())
+
+    def set_array(self, data, tag):
+        return float(data.sum()) + tag
+
+    def set_string(self, text):
+        self.text = text
+        return len(text)
+
+    def get_string(self):
+        return 'Hello World'
+
+    def get_json(self):
+        return json.dumps({'date': '20/07/2016', 'machine': 'PC-3', 'time': '18:16:13', 'user': 'thomas'})
+
+    def sleep(self, ms):
+        threading.Event().wait(ms/1000)
+        return ms
+
+
+class FakeKoheronServer(object):
+    '''
+    Serves the Loopback commands on a local TCP port, one thread per connection.
+    Commands of one connection run in order, like on koheron-server.
+    '''
+    def __init__(self, driver=None, class_name='Loopback', device_id=2):
+        self.driver = driver or Loopback()
+        self.class_name = class_name
+        self.device_id = device_id
+        self.commands = {i: c for i, c in enumerate(self.driver.commands)}
+        self.manifest = [
+            {'class': 'KServer', 'id': 1, 'functions': [
+                {'name': 'get_version', 'id': 0, 'args': [], 'ret_type': 'const char *'},
+                {'name': 'get_cmds', 'id': 1, 'args': [], 'ret_type': 'std::string'}]},
+            {'class': class_name, 'id': device_id, 'functions': [
+                {'name': name, 'id': i, 'ret_type': ret_type,
+                 'args': [{'name': arg_name, 'type': arg_type} for arg_type, arg_name in args]}
+                for i, (name, args, ret_type) in self.commands.items()]},
+        ]
+        self.version = __version__
+        self.n_requests = 0
+        self.n_connections = 0
+        self.frames = [] # raw requests, in order of arrival
+        self._lock = threading.Lock() # one command at a time, like the server's driver mutex
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        self.host, self.port = self._sock.getsockname()
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.n_connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = conn.makefile('rb')
+        try:
+            while True:
+                header = reader.read(8)
+                if len(header) < 8:
+                    return
+                reserved, device_id, cmd_id = struct.unpack('>IHH', header)
+                frame = bytearray(header)
+                reply = self._execute(device_id, cmd_id, reader, frame)
+                with self._lock:
+                    self.frames.append(bytes(frame))
+                    self.n_requests += 1
+                if reply:
+                    conn.sendall(reply)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def _execute(self, device_id, cmd_id, reader, frame):
+        if device_id == 1:
+            if cmd_id == 0:
+                return self._dynamic(1, 0, self.version.encode())
+            return self._dynamic(1, 1, json.dumps(self.manifest).encode())
+        name, args, ret_type = self.commands[cmd_id]
+        values = [self._read_arg(arg_type, reader, frame) for arg_type, _ in args]
+        with self._lock:
+            result = getattr(self.driver, name)(*values)
+        return self._reply(cmd_id, ret_type, result)
+
+    def _read_arg(self, _type, reader, frame):
+        def read(n):
+            data = reader.read(n)
+            frame.extend(data)
+            return data
+        if _type in SCALARS:
+            fmt = '>' + SCALARS[_type]
+            return struct.unpack(fmt, read(struct.calcsize(fmt)))[0]
+        if _type.startswith('std::vector'):
+            n_bytes, = struct.unpack('>I', read(4))
+            return np.frombuffer(read(n_bytes), dtype=NP_TYPES[template_args(_type)[0]])
+        if _type.startswith('std::array'):
+            T, N = template_args(_type)
+            dtype = np.dtype(NP_TYPES[T])
+            return np.frombuffer(read(int(N.rstrip('ul'))*dtype.itemsize), dtype=dtype)
+        if _type.startswith('std::string'):
+            n_bytes, = struct.unpack('>I', read(4))
+            return read(n_bytes).decode()
+        raise ValueError(_type)
+
+    def _reply(self, cmd_id, ret_type, result):
+        header = struct.pack('>IHH', 0, self.device_id, cmd_id)
+        _type = ret_type.split('&')[0].strip()
+        if _type == 'void':
+            return b''
+        if _type in SCALARS:
+            return header + struct.pack('>' + SCALARS[_type], result)
+        if _type.startswith('std::tuple'):
+            fmt = '>' + ''.join(SCALARS[t] for t in template_args(_type))
+            return header + struct.pack(fmt, *result)
+        if _type.startswith('std::array'):
+            return header + np.asarray(result).tobytes()
+        if _type.startswith('std::vector'):
+            return self._dynamic(self.device_id, cmd_id, np.asarray(result).tobytes())
+        return self._dynamic(self.device_id, cmd_id, result.encode())
+
+    def _dynamic(self, device_id, cmd_id, payload):
+        return struct.pack('>IHHI', 0, device_id, cmd_id, len(payload)) + payload
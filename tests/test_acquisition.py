@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import time
+import numpy as np
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path = [os.path.dirname(__file__), root, os.path.join(root, 'koheron-sdk', 'python')] + sys.path
+from koheron import KoheronClient
+from GPI_RP.GPI_RP import GPI_RP
+from gpi.acquisition import Acquisition, block_times
+from gpi.data import decode_GPI_data
+from koheron_server import FakeKoheronServer
+
+
+class CountingDriver(object):
+    '''
+    Returns 10 new samples per call, every third call after 5 more were dropped.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.calls = 0
+
+    def get_GPI_data(self):
+        self.calls += 1
+        if self.calls % 3 == 0:
+            self.count += 5
+        self.index = self.count
+        words = np.arange(self.count, self.count + 10, dtype='uint32')
+        self.count += 10
+        return words
+
+    def get_GPI_data_index(self):
+        return self.index
+
+
+def test_acquisition_drops_oldest_blocks():
+    acquisition = Acquisition(CountingDriver, poll_interval=0, max_blocks=3)
+    acquisition.start()
+    time.sleep(0.1)
+    acquisition.stop()
+    assert acquisition.error is None
+    blocks = acquisition.get_blocks()
+    assert len(blocks) == 3
+    assert acquisition.lost_samples > 0
+    for block in blocks:
+        # Each test word is its own sample count
+        assert block.index == block.words[0]
+        assert np.array_equal(block.abs_pressures, decode_GPI_data(block.words)[0])
+    # 30 samples read and 5 dropped every 3 calls
+    assert acquisition.dropped_samples == 5*(acquisition.next_index // 35)
+    gaps = [b.gap for b in blocks]
+    assert sorted(gaps) == [0, 0, 5]
+
+
+def test_acquisition_without_queue_only_feeds_sinks():
+    received = []
+    acquisition = Acquisition(CountingDriver, poll_interval=0, max_blocks=0, sinks=[received.append])
+    acquisition.start()
+    time.sleep(0.1)
+    acquisition.stop()
+    assert acquisition.error is None
+    assert len(received) > 3
+    assert acquisition.get_blocks() == []
+    assert acquisition.lost_samples == 0
+
+
+def test_timebase_follows_sample_count():
+    acquisition = Acquisition(CountingDriver)
+    rng = np.random.RandomState(0)
+    t0 = 1000.
+    words = np.zeros(500, dtype='uint32')
+    blocks = []
+    for index in range(0, 50000, 500):
+        if index == 20000:
+            continue # dropped by the server
+        # Replies arrive 1 to 30 ms after their last sample was taken
+        now = t0 + (index + 499)/10000 + rng.uniform(0.001, 0.03)
+        blocks.append(acquisition._make_block(now, index, words))
+    assert acquisition.dropped_samples == 500
+    assert [b.gap for b in blocks].count(500) == 1
+    # Time stamps are never early and settle on the smallest network delay
+    errors = np.array([b.time - (t0 + b.index/10000) for b in blocks])
+    assert np.all(errors >= 0) and np.all(errors < 0.03)
+    assert np.all(errors[20:] < 0.005)
+
+
+def test_timebase_uses_the_driver_sample_rate():
+    acquisition = Acquisition(CountingDriver, sample_rate=1e6)
+    words = np.zeros(1000, dtype='uint32')
+    first = acquisition._make_block(1000., 0, words)
+    second = acquisition._make_block(1000.001, 1000, words)
+    assert np.isclose(second.time - first.time, 0.001)
+    assert np.allclose(np.diff(block_times(second, acquisition.sample_rate)), 1e-6)
+
+
+def test_acquisition_reports_errors():
+    def unreachable():
+        raise ConnectionError('no route to host')
+    acquisition = Acquisition(unreachable)
+    acquisition.start()
+    acquisition.join(1)
+    assert isinstance(acquisition.error, ConnectionError)
+
+
+class GPIStream(object):
+    '''
+    get_GPI_data and get_GPI_data_index of the stand-in koheron server.
+    '''
+    commands = [
+        ('get_GPI_data', [], 'std::vector<uint32_t>&'),
+        ('get_GPI_data_index', [], 'uint64_t'),
+        ('get_status_registers', [], 'std::array<uint32_t, 14>'),
+    ]
+
+    def __init__(self):
+        self.count = 0
+
+    def get_GPI_data(self):
+        self.index = self.count
+        self.count += 10
+        return np.arange(self.index, self.count, dtype='uint32')
+
+    def get_GPI_data_index(self):
+        return self.index
+
+    def get_status_registers(self):
+        return np.arange(14, dtype='uint32') + self.index
+
+
+class CountingClient(KoheronClient):
+    sends = 0
+
+    def send_frame(self, frame):
+        self.sends += 1
+        KoheronClient.send_frame(self, frame)
+
+
+def test_acquisition_polls_koheron_in_one_round_trip():
+    server = FakeKoheronServer(GPIStream(), class_name='GPI_RP')
+    clients = []
+    def connect_driver():
+        clients.append(CountingClient(server.host, server.port))
+        return GPI_RP(clients[-1])
+    try:
+        acquisition = Acquisition(connect_driver, poll_interval=0.01, read_status=True)
+        acquisition.start()
+        time.sleep(0.1)
+        acquisition.stop()
+    finally:
+        server.close()
+    assert acquisition.error is None
+    blocks = acquisition.get_blocks()
+    assert len(blocks) > 3 and acquisition.dropped_samples == 0
+    assert all(block.index == block.words[0] for block in blocks)
+    assert all(np.array_equal(block.status, np.arange(14) + block.index) for block in blocks)
+    assert acquisition.status is blocks[-1].status
+    # Session opening, then one send per poll (data, index and status)
+    assert clients[0].sends == 1 + len(blocks)
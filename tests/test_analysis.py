@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.interpolate import interp1d
+from scipy.signal import medfilt
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.analysis import flow_rates, save_puff_plot
+
+PLENUM_VOLUME = 0.802
+
+
+def derivative(func, x0, dx):
+    # scipy.misc.derivative(func, x0, dx) with its defaults n=1, order=3,
+    # removed from SciPy 1.12 but used by the original plot_puffs
+    weights = np.array([-1, 0, 1]) / 2.0
+    return sum(w * func(x0 + (k - 1) * dx) for k, w in enumerate(weights)) / dx
+
+
+def reference_flow_rates(times, pressures):
+    # Loop from plot_puffs before the vectorized version
+    f = interp1d(times, pressures, kind='linear')
+    newtimes = np.arange(times[0], times[-1], 0.0005)
+    dp_coarse = [PLENUM_VOLUME*derivative(f, ti, dx=.02) for ti in newtimes[100:-100]]
+    dp_fine = [PLENUM_VOLUME*derivative(f, ti, dx=.005) for ti in newtimes[100:-100]]
+    return newtimes[100:-100], dp_coarse, dp_fine
+
+
+def synthetic_puff(seed):
+    # Plenum draining through the fast valve between 0.1 s and 0.15 s after T1
+    rng = np.random.RandomState(seed)
+    times = np.arange(-1, 2.2, 1e-4) + rng.uniform(0, 1e-4)
+    drop = 1.5 * np.clip((times - 0.1) / 0.05, 0, 1)
+    pressures = 8.0 - drop + rng.normal(scale=0.02, size=len(times))
+    return times, medfilt(pressures, 11)
+
+
+def test_flow_rates_match_reference():
+    for seed in range(3):
+        times, pressures = synthetic_puff(seed)
+        ref_times, ref_coarse, ref_fine = reference_flow_rates(times, pressures)
+        newtimes, (dp_coarse, dp_fine) = flow_rates(times, pressures, PLENUM_VOLUME, scales=(.02, .005))
+        assert np.array_equal(newtimes, ref_times)
+        assert np.allclose(dp_coarse, ref_coarse, rtol=1e-9, atol=1e-9)
+        assert np.allclose(dp_fine, ref_fine, rtol=1e-9, atol=1e-9)
+
+
+def test_flow_rate_of_linear_drop():
+    times = np.arange(0, 1, 1e-4)
+    newtimes, (rate,) = flow_rates(times, 5 - 2*times, 1.0, scales=(.01,))
+    assert np.allclose(rate, -2)
+
+
+def test_save_puff_plot_in_worker(tmp_path):
+    times, pressures = synthetic_puff(0)
+    data_path = str(tmp_path / 'diff_pressure_1.npy')
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        png_path = pool.submit(save_puff_plot, data_path, times, pressures, 1, PLENUM_VOLUME).result(timeout=60)
+    assert png_path == str(tmp_path / 'diff_pressure_1.png')
+    assert os.path.getsize(png_path) > 0
+    assert np.array_equal(np.load(data_path), [times, pressures])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.buffers import RingBuffer, RollingAverage
+
+
+def test_ring_buffer_wraps():
+    ring = RingBuffer(5, ('t', 'x'))
+    history = []
+    for n in [0, 1, 3, 4, 2, 7, 1, 5, 0, 2]:
+        batch = np.arange(len(history), len(history) + n)
+        history.extend(batch)
+        ring.append(batch / 10, batch)
+        assert ring['x'].tolist() == history[-5:]
+        assert ring['t'].tolist() == [x / 10 for x in history[-5:]]
+        for k in range(7):
+            expected = history[-5:][max(0, len(history[-5:]) - k):]
+            assert ring.last(k)[1].tolist() == expected
+
+
+def test_ring_buffer_views():
+    ring = RingBuffer(4, ('a', 'b'))
+    ring.append([1, 2, 3], [4, 5, 6])
+    a, b = ring.last(2)
+    assert a.base is not None and b.base is not None
+    ring.append(7, 8)
+    assert len(ring) == 4
+    assert ring['a'].tolist() == [1, 2, 3, 7]
+    assert ring['b'].tolist() == [4, 5, 6, 8]
+
+
+def test_rolling_average_matches_block_means():
+    rng = np.random.RandomState(1)
+    averages = RollingAverage(('x', 'y'), (0.01, 0.1, 1), 10000)
+    assert averages.block_size == 100
+    history = np.zeros(0)
+    for n in [137, 0, 63, 5000, 1, 2999, 12000, 250]:
+        batch = rng.normal(size=n)
+        history = np.concatenate([history, batch])
+        averages.update(batch, 2*batch)
+        complete = history[:len(history) // 100 * 100]
+        for window, size in [(0.01, 100), (0.1, 1000), (1, 10000)]:
+            x, y = averages.mean(window)
+            assert np.isclose(x, np.mean(complete[-size:]))
+            assert np.isclose(y, 2*np.mean(complete[-size:]))
+
+
+def test_rolling_average_startup():
+    averages = RollingAverage(('x',), (0.1,), 1000)
+    assert np.isnan(averages.mean(0.1)[0])
+    averages.update([1., 2., 3.])
+    assert averages.mean(0.1) == (2.,)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.data import abs_torr, diff_torr, decode_GPI_data, encode_GPI_data
+
+
+def test_decode_all_counts():
+    # Every 14-bit value in both gauge fields, plus garbage in the padding bits
+    counts = np.arange(2**14, dtype='uint32')
+    words = (counts << 14) | counts[::-1] | np.uint32(0xF0000000)
+    abs_pressures, diff_pressures = decode_GPI_data(words)
+    assert np.array_equal(abs_pressures, [abs_torr(int(w)) for w in words])
+    assert np.array_equal(diff_pressures, [diff_torr(int(w)) for w in words])
+
+
+def test_decode_random_words():
+    words = np.random.RandomState(0).randint(0, 2**28, size=5000).astype('uint32')
+    abs_pressures, diff_pressures = decode_GPI_data(words)
+    assert abs_pressures.tolist() == [abs_torr(int(w)) for w in words]
+    assert diff_pressures.tolist() == [diff_torr(int(w)) for w in words]
+
+
+def test_decode_empty():
+    abs_pressures, diff_pressures = decode_GPI_data(np.zeros(0, dtype='uint32'))
+    assert len(abs_pressures) == 0
+    assert len(diff_pressures) == 0
+
+
+def test_encode_round_trip():
+    words = np.random.RandomState(1).randint(0, 2**28, size=1000).astype('uint32')
+    assert np.array_equal(encode_GPI_data(*decode_GPI_data(words)), words)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.decimate import minmax_envelope
+
+
+def test_envelope_keeps_extremes_of_each_bin():
+    rng = np.random.RandomState(0)
+    y = rng.normal(size=300007)
+    y[123456] = 50 # a spike much shorter than a bin
+    x = np.arange(len(y)) / 10000
+    x_env, y_env = minmax_envelope(x, y, 300)
+    assert len(x_env) == len(y_env) == 600
+    assert np.all(np.diff(x_env) >= 0)
+    bins = y[7:].reshape(300, 1000)
+    assert np.array_equal(y_env[0::2], np.where(bins.argmin(1) < bins.argmax(1), bins.min(1), bins.max(1)))
+    assert y_env.max() == 50
+    assert np.all(np.isin(x_env, x))
+
+
+def test_short_traces_are_not_decimated():
+    x, y = np.arange(10.), np.arange(10.)
+    x_env, y_env = minmax_envelope(x, y, 5)
+    assert x_env is x and y_env is y
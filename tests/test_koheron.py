@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import socket
+import threading
+import numpy as np
+import pytest
+
+sys.path = [os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import KoheronClient, ThreadLocalClient, command, ConnectionError as KoheronConnectionError
+from koheron.koheron import make_command, reply_struct, MAX_LAYOUTS
+from koheron_server import FakeKoheronServer
+
+
+class Loopback(object):
+    def __init__(self, client):
+        self.client = client
+
+    @command()
+    def set_value(self, value):
+        pass
+
+    @command()
+    def get_value(self):
+        return self.client.recv_uint32()
+
+    @command()
+    def add(self, a, b):
+        return self.client.recv_uint32()
+
+    @command()
+    def set_scalars(self, a, b, c, d, e, f):
+        return self.client.recv_bool()
+
+    @command()
+    def get_scalars(self):
+        return self.client.recv_tuple('Iif?dh')
+
+    @command()
+    def get_vector(self, n, out=None):
+        return self.client.recv_vector(dtype='uint32', out=out)
+
+    @command()
+    def get_array(self, out=None):
+        return self.client.recv_array(16, dtype='uint32', out=out)
+
+    @command()
+    def set_vector(self, data):
+        return self.client.recv_uint32()
+
+    @command()
+    def set_array(self, data, tag):
+        return self.client.recv_double()
+
+    @command()
+    def set_string(self, text):
+        return self.client.recv_uint32()
+
+    @command()
+    def get_json(self):
+        return self.client.recv_json()
+
+
+@pytest.fixture
+def server():
+    server = FakeKoheronServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def driver(server):
+    return Loopback(KoheronClient(server.host, server.port))
+
+
+def test_commands(driver):
+    driver.set_value(42)
+    assert driver.get_value() == 42
+    assert driver.add(2**32 - 1, 3) == 2
+    assert driver.set_scalars(429496729, -2048, np.pi, True, np.exp(1), 42)
+    assert driver.get_scalars() == (429496729, -2048, np.float32(np.pi), True, np.exp(1), 42)
+    assert np.array_equal(driver.get_vector(1000), np.arange(1000))
+    assert np.array_equal(driver.get_array(), np.arange(16)*3)
+    assert driver.set_vector(np.arange(10, dtype='uint32')) == 45
+    assert driver.set_array(np.ones(4, dtype='float32'), 2) == 6
+    assert driver.set_string('GPI') == 3
+    assert driver.get_json()['machine'] == 'PC-3'
+
+
+def test_commands_are_compiled_once(driver):
+    driver.set_value(1)
+    cmd = driver.client.get_command('Loopback', 'set_value')
+    driver.set_value(2)
+    assert driver.client.get_command('Loopback', 'set_value') is cmd
+    driver.client.load_devices()
+    assert driver.client.get_command('Loopback', 'set_value') is not cmd
+
+
+def test_compiled_frames_match_make_command(driver, server):
+    cmd = driver.client.get_command('Loopback', 'set_scalars')
+    values = [(429496729, -2048, np.pi, True, np.exp(1), 42),
+              (-1, 2**31, np.float32(-0.5), 0, 1e300, -1),
+              (np.uint32(7), np.int64(-9), 3, 7, -0., 65535)]
+    for args in values:
+        assert bytes(cmd.frame(*args)) == bytes(make_command(cmd.device_id, cmd.cmd_id, cmd.args, *args))
+    with pytest.raises(ValueError):
+        cmd.frame(1, 2)
+    with pytest.raises(TypeError):
+        cmd.frame(1.5, 2, 3, 4, 5, 6)
+
+
+def test_large_replies_are_received_in_place(server):
+    driver = Loopback(KoheronClient(server.host, server.port, rcvbuf=None))
+    data = driver.get_vector(1 << 20)
+    assert np.array_equal(data, np.arange(1 << 20))
+    assert data.flags.writeable # a view of the receive buffer, not a read-only copy
+    assert isinstance(data.base, (bytearray, memoryview))
+    assert np.array_equal(driver.get_array(), np.arange(16)*3)
+
+
+def test_socket_buffer_sizes(server):
+    default = KoheronClient(server.host, server.port, rcvbuf=None)
+    small = KoheronClient(server.host, server.port, rcvbuf=4096, sndbuf=8192)
+    # Linux doubles the requested sizes
+    assert small.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < \
+        default.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    assert small.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) <= 2*8192
+
+
+def test_closed_connection_raises(server):
+    client = KoheronClient(server.host, server.port)
+    client.sock.shutdown(socket.SHUT_RDWR)
+    with pytest.raises(KoheronConnectionError):
+        client.recv_all(4)
+
+
+def test_replies_into_caller_buffers(driver):
+    buff = np.zeros(100, dtype='uint32')
+    data = driver.get_vector(60, out=buff)
+    assert np.array_equal(data, np.arange(60))
+    assert np.shares_memory(data, buff)
+    assert len(driver.get_vector(0, out=buff)) == 0
+    array = np.zeros((4, 4), dtype='uint32')
+    assert np.shares_memory(driver.get_array(out=array), array)
+    assert np.array_equal(array.ravel(), np.arange(16)*3)
+    # The reply is still read off the socket when it does not fit
+    with pytest.raises(ValueError):
+        driver.get_vector(101, out=buff)
+    with pytest.raises(TypeError):
+        driver.get_vector(10, out=np.zeros(10, dtype='int32'))
+    with pytest.raises(ValueError):
+        driver.get_array(out=np.zeros(8, dtype='uint32'))
+    assert driver.add(1, 2) == 3
+
+
+def test_batch(driver, server):
+    n_requests = server.n_requests
+    with driver.client.batch() as batch:
+        driver.set_value(7) # void, no reply
+        value = driver.get_value()
+        total = driver.add(2, 3)
+        vector = driver.get_vector(5)
+        info = driver.get_json()
+        assert not value.done()
+        with pytest.raises(RuntimeError):
+            value.result()
+    assert len(batch.futures) == 5 and batch.futures[0].result() is None
+    assert value.result() == 7
+    assert total.result() == 5
+    assert np.array_equal(vector.result(), np.arange(5))
+    assert info.result()['user'] == 'thomas'
+    assert server.n_requests == n_requests + 5
+    # Back to one round trip per command
+    assert driver.add(1, 1) == 2
+
+
+def test_batch_is_not_sent_on_error(driver, server):
+    n_requests = server.n_requests
+    with pytest.raises(KeyError):
+        with driver.client.batch():
+            driver.set_value(3)
+            raise KeyError
+    assert driver.get_value() == 0
+    assert server.n_requests == n_requests + 1
+
+
+def hammer(driver, n_threads=8, n_calls=200):
+    ''' Runs commands from several threads, returns the wrong results '''
+    errors = []
+    def work(k):
+        try:
+            for i in range(n_calls):
+                if driver.add(k, i) != k + i or not np.array_equal(driver.get_vector(k), np.arange(k)):
+                    errors.append((k, i))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_thread_safe_client(server):
+    driver = Loopback(KoheronClient(server.host, server.port, thread_safe=True))
+    assert hammer(driver) == []
+    # Other threads wait for a batch to be sent
+    results = []
+    with driver.client.batch():
+        value = driver.get_value()
+        thread = threading.Thread(target=lambda: results.append(driver.add(1, 2)))
+        thread.start()
+        thread.join(0.05)
+        assert thread.is_alive()
+    thread.join()
+    assert value.result() == 0 and results == [3]
+    assert server.n_connections == 1
+
+
+def test_thread_local_client(server):
+    client = ThreadLocalClient(server.host, server.port)
+    assert hammer(Loopback(client)) == []
+    assert len(client.clients) == 9 # this thread and the 8 workers
+    client.close()
+    assert Loopback(client).add(1, 2) == 3
+
+
+def test_manifest_cache(server):
+    import koheron.koheron
+    client = KoheronClient(server.host, server.port)
+    assert not client.manifest_cached and len(koheron.koheron.manifest_cache) == 1
+    for _ in range(2):
+        driver = Loopback(KoheronClient(server.host, server.port))
+        assert driver.client.manifest_cached
+        assert driver.client.devices_idx == client.devices_idx
+        assert driver.add(2, 3) == 5
+        with pytest.raises(TypeError): # return types are checked as after parsing
+            WrongTypes(driver.client).get_value()
+    assert not KoheronClient(server.host, server.port, cache_manifest=False).manifest_cached
+    # A different manifest is parsed again
+    server.manifest[1]['functions'].pop()
+    assert not KoheronClient(server.host, server.port).manifest_cached
+
+
+def test_connect_cached_skips_http_for_known_instruments(server, monkeypatch):
+    import functools
+    import koheron.koheron
+    monkeypatch.setattr(koheron.koheron, 'KoheronClient', functools.partial(KoheronClient, port=server.port))
+    http_calls = []
+    monkeypatch.setattr(koheron.koheron, 'run_instrument', lambda *args, **kwargs: http_calls.append(args))
+    koheron.koheron.connect(server.host, name='loopback')
+    assert len(http_calls) == 1
+    # Only trusted on request: the manifest does not tell which bitstream runs
+    koheron.koheron.connect(server.host, name='loopback')
+    assert len(http_calls) == 2
+    client = koheron.koheron.connect(server.host, name='loopback', cached=True)
+    assert len(http_calls) == 2 and client.instruments == ['loopback']
+    koheron.koheron.connect(server.host, name='other', cached=True)
+    koheron.koheron.connect(server.host, 'loopback', restart=True, cached=True)
+    assert len(http_calls) == 4
+
+
+class WrongTypes(object):
+    ''' Reads Loopback replies with the wrong recv_* calls '''
+    def __init__(self, client):
+        self.client = client
+
+    @command('Loopback')
+    def get_value(self):
+        return self.client.recv_float()
+
+    @command('Loopback', 'get_vector')
+    def get_vector_as_float(self, n):
+        return self.client.recv_vector(dtype='float32')
+
+    @command('Loopback', 'get_array')
+    def get_short_array(self):
+        return self.client.recv_array(8, dtype='uint32')
+
+    @command('Loopback', 'get_array')
+    def get_array_as_vector(self):
+        return self.client.recv_vector(dtype='uint32')
+
+
+def test_return_types(server):
+    client = KoheronClient(server.host, server.port)
+    driver, wrong = Loopback(client), WrongTypes(client)
+    cmd = client.get_command('Loopback', 'get_array')
+    assert (cmd.ret.kind, cmd.ret.dtype, cmd.ret.length) == ('array', np.dtype('uint32'), 16)
+    # Errors are raised before the reply is read
+    array_reply = 8 + 16*4
+    for call, reply_size in ((wrong.get_value, 12), (lambda: wrong.get_vector_as_float(3), 12 + 3*4),
+                             (wrong.get_short_array, array_reply), (wrong.get_array_as_vector, array_reply)):
+        with pytest.raises((TypeError, ValueError)):
+            call()
+        client.recv_discard(reply_size)
+        assert driver.add(1, 1) == 2
+    # Checked layouts are remembered
+    for _ in range(2):
+        assert np.array_equal(driver.get_array(), np.arange(16)*3)
+    assert list(cmd.ret.layouts.values()) == [(np.dtype('uint32'), 16)]
+    # Scalar replies use the struct compiled from the manifest
+    value = client.get_command('Loopback', 'get_value').ret
+    assert value.reply is reply_struct('I')
+    # New shapes on every call do not grow the cache without bound
+    for n in range(2*MAX_LAYOUTS):
+        cmd.ret.array_layout((n, 1), 'uint32', check=False)
+    assert len(cmd.ret.layouts) <= MAX_LAYOUTS
+
+
+def test_unchecked_return_types(server):
+    client = KoheronClient(server.host, server.port, check_types=False)
+    wrong = WrongTypes(client)
+    assert wrong.get_value() == 0 # the bits of a uint32 0
+    assert np.array_equal(wrong.get_short_array(), np.arange(8)*3)
+    client.recv_discard(8*4)
+    assert Loopback(client).add(1, 2) == 3
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import asyncio
+import numpy as np
+import pytest
+
+sys.path = [os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import AsyncKoheronClient, async_command
+from koheron_server import FakeKoheronServer
+
+
+class Loopback(object):
+    def __init__(self, client):
+        self.client = client
+
+    @async_command()
+    async def set_value(self, value):
+        pass
+
+    @async_command()
+    async def get_value(self):
+        return await self.client.recv_uint32()
+
+    @async_command()
+    async def add(self, a, b):
+        return await self.client.recv_uint32()
+
+    @async_command()
+    async def get_scalars(self):
+        return await self.client.recv_tuple('Iif?dh')
+
+    @async_command()
+    async def get_vector(self, n, out=None):
+        return await self.client.recv_vector(dtype='uint32', out=out)
+
+    @async_command()
+    async def get_array(self):
+        return await self.client.recv_array(16, dtype='uint32')
+
+    @async_command()
+    async def set_string(self, text):
+        return await self.client.recv_uint32()
+
+    @async_command()
+    async def get_json(self):
+        return await self.client.recv_json()
+
+    @async_command()
+    async def sleep(self, ms):
+        return await self.client.recv_uint32()
+
+
+@pytest.fixture
+def server():
+    server = FakeKoheronServer()
+    yield server
+    server.close()
+
+
+def run(server, test):
+    async def main():
+        async with AsyncKoheronClient(server.host, server.port) as client:
+            return await test(Loopback(client))
+    return asyncio.run(main())
+
+
+def test_commands(server):
+    async def test(driver):
+        await driver.set_value(42)
+        assert await driver.get_value() == 42
+        assert await driver.add(2**32 - 1, 3) == 2
+        assert await driver.get_scalars() == (0, 0, 0., False, 0., 0)
+        assert np.array_equal(await driver.get_vector(1000), np.arange(1000))
+        assert np.array_equal(await driver.get_array(), np.arange(16)*3)
+        assert await driver.set_string('GPI') == 3
+        assert (await driver.get_json())['machine'] == 'PC-3'
+        buff = np.zeros(10, dtype='uint32')
+        assert np.shares_memory(await driver.get_vector(4, out=buff), buff)
+    run(server, test)
+
+
+def test_concurrent_commands_get_their_own_replies(server):
+    async def test(driver):
+        calls = []
+        for i in range(200):
+            calls += [driver.add(i, 1), driver.get_vector(i % 7), driver.set_string('x'*i)]
+        results = await asyncio.gather(*calls)
+        for i in range(200):
+            assert results[3*i] == i + 1
+            assert np.array_equal(results[3*i+1], np.arange(i % 7))
+            assert results[3*i+2] == i
+    run(server, test)
+    assert server.n_connections == 1
+
+
+def test_cancelled_call_keeps_the_stream_in_sync(server):
+    async def test(driver):
+        slow = asyncio.ensure_future(driver.sleep(100))
+        vector = asyncio.ensure_future(driver.get_vector(3))
+        await asyncio.sleep(0.01)
+        slow.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+        assert np.array_equal(await vector, np.arange(3))
+        assert await driver.add(1, 2) == 3
+    run(server, test)
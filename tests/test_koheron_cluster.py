@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import socket
+import time
+import pytest
+
+sys.path = [os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import KoheronClient, KoheronCluster, command
+from koheron.cluster import ClusterError
+from koheron_server import FakeKoheronServer
+from test_koheron import Loopback as BaseLoopback
+
+
+class Loopback(BaseLoopback):
+    @command()
+    def sleep(self, ms):
+        return self.client.recv_uint32()
+
+
+@pytest.fixture
+def servers():
+    servers = [FakeKoheronServer() for _ in range(3)]
+    yield servers
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def cluster(servers):
+    drivers = dict(('board%d' % i, Loopback(KoheronClient(s.host, s.port))) for i, s in enumerate(servers))
+    cluster = KoheronCluster(drivers)
+    yield cluster
+    cluster.close()
+
+
+def test_broadcast(cluster, servers):
+    assert cluster.set_value(5) == {'board0': None, 'board1': None, 'board2': None}
+    assert cluster.get_value() == dict.fromkeys(cluster.boards, 5)
+    cluster.subset(['board1']).set_value(8)
+    assert cluster.call('get_value', boards=['board0', 'board1']) == {'board0': 5, 'board1': 8}
+    result = cluster.add(2, 3)
+    assert result.ok and result.raise_errors() == dict.fromkeys(cluster.boards, 5)
+
+
+def test_boards_are_called_concurrently(cluster):
+    start = time.time()
+    assert cluster.sleep(200) == dict.fromkeys(cluster.boards, 200)
+    assert time.time() - start < 0.5
+
+
+def test_errors_per_board(cluster):
+    cluster.drivers['board2'].client.sock.shutdown(socket.SHUT_RDWR)
+    result = cluster.get_value()
+    assert result == {'board0': 0, 'board1': 0}
+    assert list(result.errors) == ['board2']
+    with pytest.raises(ClusterError):
+        result.raise_errors()
+    result = cluster.synchronized('add', 1, 1)
+    assert result == {'board0': 2, 'board1': 2} and list(result.errors) == ['board2']
+
+
+def test_synchronized(cluster, servers):
+    n_requests = [s.n_requests for s in servers]
+    assert cluster.synchronized('set_value', 3) == dict.fromkeys(cluster.boards, None)
+    assert cluster.synchronized('add', 1, 2) == dict.fromkeys(cluster.boards, 3)
+    assert [s.n_requests - n for s, n in zip(servers, n_requests)] == [2, 2, 2]
+    # The clients are usable normally afterwards
+    assert cluster.get_value() == dict.fromkeys(cluster.boards, 3)
+
+
+def test_connect(servers):
+    cluster = KoheronCluster.connect([servers[0].host], Loopback, port=servers[0].port)
+    assert cluster.add(1, 1) == {servers[0].host: 2}
+    with pytest.raises(ClusterError):
+        KoheronCluster.connect(['127.0.0.1'], Loopback, port=1)
+    cluster.close()
+
+
+def test_failed_connect_closes_the_boards_that_connected(servers, monkeypatch):
+    import koheron.cluster
+    from concurrent.futures import ThreadPoolExecutor
+    executors, drivers = [], []
+    class Executor(ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            ThreadPoolExecutor.__init__(self, *args, **kwargs)
+            executors.append(self)
+    def open_driver(client):
+        drivers.append(Loopback(client))
+        return drivers[-1]
+    monkeypatch.setattr(koheron.cluster, 'ThreadPoolExecutor', Executor)
+    # Nothing listens on the port of servers[0] at 127.0.0.2
+    with pytest.raises(ClusterError) as e:
+        KoheronCluster.connect([servers[0].host, '127.0.0.2'], open_driver, port=servers[0].port)
+    assert list(e.value.errors) == ['127.0.0.2']
+    assert len(drivers) == 1 and drivers[0].client.sock.fileno() == -1
+    assert executors[0]._shutdown
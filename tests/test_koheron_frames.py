@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Golden request frames, recorded from the byte-by-byte serializer of
+koheron 0.17.0, which the compiled Serializer must reproduce exactly.
+'''
+
+import sys
+import os
+import hashlib
+import numpy as np
+import pytest
+
+sys.path = [os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), '..', 'koheron-sdk', 'python')] + sys.path
+from koheron import KoheronClient
+from koheron.koheron import make_command, build_payload, Serializer
+from koheron_server import FakeKoheronServer
+from test_koheron import Loopback
+
+
+def args(*types):
+    return [{'name': 'arg%d' % i, 'type': t} for i, t in enumerate(types)]
+
+# name: (device_id, cmd_id, cmd_args, values, frame as hex)
+GOLDEN_FRAMES = {
+    'no_args': (2, 0, args(), (), '0000000000020000'),
+    'uint32': (2, 1, args('uint32_t'), (429496729,), '000000000002000119999999'),
+    'uint32_wraps_negative': (3, 7, args('uint32_t'), (-1,), '0000000000030007ffffffff'),
+    'int32_negative': (3, 8, args('int32_t'), (-2048,), '0000000000030008fffff800'),
+    'uint8_int8': (4, 2, args('uint8_t', 'int8_t'), (255, -3), '0000000000040002fffd'),
+    'uint16_int16': (4, 3, args('uint16_t', 'int16_t'), (65535, -32768), '0000000000040003ffff8000'),
+    'uint64_int64': (5, 300, args('uint64_t', 'int64_t'), (2**64 - 1, -2**40),
+                     '000000000005012cffffffffffffffffffffff0000000000'),
+    'float_double': (6, 9, args('float', 'double'), (np.pi, np.exp(1)),
+                     '000000000006000940490fdb4005bf0a8b145769'),
+    'float_int': (6, 10, args('float'), (3,), '000000000006000a40400000'),
+    'bools': (6, 11, args('bool', 'bool', 'bool'), (True, 0, 7), '000000000006000b010001'),
+    'mixed_scalars': (2, 3, args('uint32_t', 'int32_t', 'float', 'bool', 'double', 'int16_t'),
+                      (429496729, -2048, np.pi, True, np.exp(1), 42),
+                      '000000000002000319999999fffff80040490fdb014005bf0a8b145769002a'),
+    'numpy_scalars': (2, 4, args('uint32_t', 'int64_t', 'float'), (np.uint32(7), np.int64(-9), np.float32(0.5)),
+                      '000000000002000400000007fffffffffffffff73f000000'),
+    'vector_uint32': (7, 1, args('std::vector<uint32_t>'), (np.arange(5, dtype='uint32'),),
+                      '0000000000070001000000140000000001000000020000000300000004000000'),
+    'vector_empty': (7, 2, args('std::vector<float>'), (np.zeros(0, dtype='float32'),), '000000000007000200000000'),
+    'vector_between_scalars': (7, 3, args('uint16_t', 'std::vector<double>', 'uint8_t'), (513, np.array([1.5, -2.]), 9),
+                               '0000000000070003020100000010000000000000f83f00000000000000c009'),
+    'array_float': (8, 1, args('std::array<float, 4>'), (np.arange(4, dtype='float32'),),
+                    '0000000000080001000000000000803f0000004000004040'),
+    'string': (9, 1, args('std::string'), ('Hello World',), '00000000000900010000000b48656c6c6f20576f726c64'),
+    'string_and_vector': (9, 3, args('std::string', 'std::vector<int16_t>', 'uint32_t'),
+                          ('abc', np.array([-1, 2], dtype='int16'), 3),
+                          '00000000000900030000000361626300000004ffff020000000003'),
+}
+
+# Too long to spell out: length and SHA-256 of the frame
+LARGE_FRAME = (8, 2, args('uint32_t', 'float', 'std::array<uint32_t, 8192>', 'double', 'int32_t'),
+               (4223453, np.pi, np.arange(8192, dtype='uint32'), 2.654798454646, -56789),
+               32796, 'c39417077cac0925eab59ea107991bf5b235612d7ef82ebb8a4d221659d49e43')
+
+
+@pytest.mark.parametrize('name', sorted(GOLDEN_FRAMES))
+def test_golden_frames(name):
+    device_id, cmd_id, cmd_args, values, frame = GOLDEN_FRAMES[name]
+    assert bytes(make_command(device_id, cmd_id, cmd_args, *values)).hex() == frame
+    # Again from a reused buffer
+    serializer = Serializer(cmd_args, reuse_buffer=True)
+    for _ in range(2):
+        assert bytes(serializer.frame(device_id, cmd_id, values)).hex() == frame
+    assert bytes(build_payload(cmd_args, values)).hex() == frame[16:]
+
+
+def test_large_frame():
+    device_id, cmd_id, cmd_args, values, length, sha256 = LARGE_FRAME
+    frame = bytes(make_command(device_id, cmd_id, cmd_args, *values))
+    assert len(frame) == length
+    assert hashlib.sha256(frame).hexdigest() == sha256
+
+
+def test_strings_are_sized_in_bytes():
+    # The old serializer sent the number of characters, not of bytes
+    frame = bytes(make_command(9, 2, args('std::string'), u'µs'))
+    assert frame.hex() == '000000000009000200000003c2b573'
+
+
+def test_non_contiguous_arrays():
+    data = np.arange(10, dtype='uint32')
+    assert bytes(make_command(7, 1, args('std::vector<uint32_t>'), data[::2])) == \
+        bytes(make_command(7, 1, args('std::vector<uint32_t>'), data[::2].copy()))
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        make_command(1, 1, args('uint32_t', 'uint32_t'), 1)
+    with pytest.raises(ValueError):
+        make_command(1, 1, args('std::array<float, 4>'), np.zeros(3, dtype='float32'))
+    with pytest.raises(TypeError):
+        make_command(1, 1, args('std::array<float, 4>'), np.zeros(4, dtype='float64'))
+    with pytest.raises(TypeError):
+        make_command(1, 1, args('std::vector<uint32_t>'), np.zeros(4, dtype='int32'))
+    with pytest.raises(ValueError):
+        make_command(1, 1, args('std::map<int, int>'), {})
+
+
+def test_frames_on_the_wire():
+    server = FakeKoheronServer()
+    driver = Loopback(KoheronClient(server.host, server.port))
+    try:
+        driver.set_array(np.arange(4, dtype='float32'), 7)
+        driver.set_vector(np.arange(3, dtype='uint32'))
+        driver.set_string('GPI')
+        cmd = driver.client.get_command('Loopback', 'set_array')
+        assert server.frames[-3] == bytes(make_command(cmd.device_id, cmd.cmd_id, cmd.args,
+                                                       np.arange(4, dtype='float32'), 7))
+        assert server.frames[-2].hex() == '000000000002000a0000000c000000000100000002000000'
+        assert server.frames[-1].hex() == '000000000002000c00000003475049'
+    finally:
+        server.close()
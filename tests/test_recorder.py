@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.acquisition import Block
+from gpi.recorder import Recorder, read_segment
+
+
+def test_recorder_rotates_segments(tmp_path):
+    recorder = Recorder(str(tmp_path), segment_samples=1000)
+    recorder.start()
+    words = np.arange(2500, dtype='uint32')
+    for i, start in enumerate(range(0, 2500, 300)):
+        block_words = words[start:start+300]
+        recorder.record(Block(100 + start/10000, start, 0, block_words, None, None))
+    recorder.stop()
+    assert recorder.error is None
+
+    segments = sorted(str(p) for p in tmp_path.glob('*.npy'))
+    assert len(segments) == 3
+    recorded = [read_segment(path) for path in segments]
+    assert np.array_equal(np.concatenate([w for w, _ in recorded]), words)
+    assert [len(w) for w, _ in recorded] == [1000, 1000, 500]
+    # Block split over the first two segments: 100 words in the first, 200 in the second
+    first_index, second_index = recorded[0][1], recorded[1][1]
+    assert first_index['length'][-1] == 100
+    assert second_index['offset'][0] == 0 and second_index['length'][0] == 200
+    assert second_index['index'][0] == 1000
+    assert np.isclose(second_index['time'][0], first_index['time'][-1] + 100/10000)
+
+
+def test_recorder_stop_returns_after_write_error(tmp_path):
+    folder = tmp_path / 'file'
+    folder.write_bytes(b'') # makedirs fails: the writer thread exits at once
+    recorder = Recorder(str(folder), max_blocks=5)
+    recorder.start()
+    recorder.join(5)
+    for i in range(10):
+        recorder.record(Block(100 + i, 100*i, 0, np.zeros(100, dtype='uint32'), None, None))
+    recorder.stop(timeout=1)
+    assert not recorder.is_alive()
+    assert recorder.error is not None
+    assert recorder.lost_samples == 1000
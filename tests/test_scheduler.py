@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import time
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.scheduler import Scheduler
+
+
+class FakeRoot(object):
+    '''
+    Minimal stand-in for the after/after_cancel part of a Tk root.
+    '''
+    def __init__(self):
+        self.timers = {}
+        self.n_ids = 0
+
+    def after(self, ms, func):
+        self.n_ids += 1
+        self.timers[self.n_ids] = (time.time() + ms/1000, func)
+        return self.n_ids
+
+    def after_cancel(self, after_id):
+        del self.timers[after_id]
+
+    def run(self, duration):
+        end = time.time() + duration
+        while self.timers and time.time() < end:
+            after_id = min(self.timers, key=lambda i: self.timers[i][0])
+            deadline, func = self.timers.pop(after_id)
+            time.sleep(max(0, deadline - time.time()))
+            func()
+
+
+def test_periodic_and_one_shot_tasks():
+    root = FakeRoot()
+    scheduler = Scheduler(root)
+    calls = []
+    start = time.time()
+    scheduler.every(0.02, lambda: calls.append(('tick', time.time() - start)))
+    scheduler.at(start + 0.05, lambda: calls.append(('once', time.time() - start)))
+    cancelled = scheduler.at(start + 0.03, lambda: calls.append(('cancelled', 0)))
+    cancelled.cancel()
+    root.run(0.11)
+    scheduler.stop()
+    names = [name for name, _ in calls]
+    assert names.count('once') == 1
+    assert 'cancelled' not in names
+    assert 4 <= names.count('tick') <= 6
+    # Each call happens at or after its deadline, never early
+    ticks = [t for name, t in calls if name == 'tick']
+    assert all(t >= 0.02*(i + 1) for i, t in enumerate(ticks))
+    assert not root.timers
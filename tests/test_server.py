@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import socket
+import time
+import threading
+import numpy as np
+import pytest
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.server import GPIServer, RemoteDriver, RemoteAcquisition
+
+
+class StreamingDriver(object):
+    '''
+    Returns 100 new samples per call, each word being its own sample count.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.valve = 0
+
+    def get_GPI_data(self):
+        time.sleep(0.005)
+        self.index = self.count
+        self.count += 100
+        return np.arange(self.index, self.count, dtype='uint32')
+
+    def get_GPI_data_index(self):
+        return self.index
+
+    def set_slow_1(self, value):
+        self.valve = value
+
+    def get_slow_1_sts(self):
+        return self.valve
+
+    def get_status_registers(self):
+        return np.full(14, self.index, dtype='uint32')
+
+
+def run_server(tmpdir, driver):
+    server = GPIServer(driver, StreamingDriver, str(tmpdir.join('gpi.sock')))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    return server, thread
+
+
+def test_subscribers_get_every_block(tmpdir):
+    server, thread = run_server(tmpdir, StreamingDriver())
+    clients = [RemoteAcquisition(server.address) for _ in range(2)]
+    for client in clients:
+        client.start()
+    time.sleep(0.3)
+    server.close()
+    thread.join(1)
+    streams = []
+    for client in clients:
+        client.stop()
+        assert client.lost_samples == 0
+        words = np.concatenate([b.words for b in client.get_blocks()])
+        # No gaps in what each client received
+        assert np.array_equal(words, np.arange(words[0], words[0] + len(words)))
+        streams.append(words)
+        assert client.status is not None
+    overlap = max(s[0] for s in streams)
+    assert overlap in streams[0] and overlap in streams[1]
+
+
+def test_commands_are_forwarded(tmpdir):
+    driver = StreamingDriver()
+    server, thread = run_server(tmpdir, driver)
+    try:
+        remote = RemoteDriver(server.address)
+        remote.set_slow_1(1)
+        assert driver.valve == 1
+        assert remote.get_slow_1_sts() == 1
+        # Would steal samples from the subscribers
+        with pytest.raises(ValueError):
+            remote.get_GPI_data()
+        with pytest.raises(AttributeError):
+            remote.no_such_command()
+    finally:
+        server.close()
+        thread.join(1)
+
+
+def test_stale_socket_is_replaced(tmpdir):
+    address = str(tmpdir.join('gpi.sock'))
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(address) # as left behind by a killed server
+    stale.close()
+    server, thread = run_server(tmpdir, StreamingDriver())
+    try:
+        assert RemoteDriver(server.address).get_slow_1_sts() == 0
+        # A running server keeps its address
+        with pytest.raises(RuntimeError):
+            GPIServer(StreamingDriver(), StreamingDriver, address)
+    finally:
+        server.close()
+        thread.join(1)
+
+
+def test_clients_need_the_key(tmpdir):
+    server, thread = run_server(tmpdir, StreamingDriver())
+    try:
+        # Refused, or cut off by the server during the handshake
+        with pytest.raises((AuthenticationError, ConnectionResetError)):
+            Client(server.address, family='AF_UNIX', authkey=b'not the key')
+        # Still serving the clients that have it
+        assert RemoteDriver(server.address).get_slow_1_sts() == 0
+        assert oct(os.stat(server.address + '.key').st_mode & 0o777) == '0o600'
+    finally:
+        server.close()
+        thread.join(1)
+
+
+def test_shared_folders_are_refused(tmpdir):
+    shared = tmpdir.mkdir('shared')
+    shared.chmod(0o777) # like /tmp: anybody could put a socket there
+    with pytest.raises(PermissionError):
+        GPIServer(StreamingDriver(), StreamingDriver, str(shared.join('gpi.sock')))
+    with pytest.raises(PermissionError):
+        RemoteDriver(str(shared.join('gpi.sock')))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import uuid
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(__file__), '..')] + sys.path
+from gpi.shm import SharedRingWriter, SharedRingReader
+
+
+def write_counts(writer, start, n):
+    words = np.arange(start, start + n, dtype='uint32')
+    writer.write(start, words*0.5, words*0.25, words)
+
+
+def test_reader_follows_writer():
+    writer = SharedRingWriter('gpi_test_%s' % uuid.uuid4().hex[:8], capacity=1000)
+    reader = SharedRingReader(writer.name)
+    try:
+        write_counts(writer, 0, 300)
+        records = reader.read()
+        assert np.array_equal(records['index'], np.arange(300))
+        assert np.array_equal(records['abs'], records['word']*0.5)
+        assert np.shares_memory(records, reader.latest(1))
+        del records
+        # Wraps around the end of the ring
+        for start in range(300, 1500, 400):
+            write_counts(writer, start, 400)
+            assert np.array_equal(reader.read()['index'], np.arange(start, start + 400))
+        assert reader.lost_samples == 0
+        assert np.array_equal(reader.latest(0.05)['index'], np.arange(1000, 1500))
+        assert len(reader.latest(10)) == 1000
+        assert not reader.overrun()
+        write_counts(writer, 1500, 1)
+        assert reader.overrun()
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_writer_replaces_stale_segment():
+    name = 'gpi_test_%s' % uuid.uuid4().hex[:8]
+    stale = shared_memory.SharedMemory(name, create=True, size=64)
+    stale.close() # as after a crash, never unlinked
+    writer = SharedRingWriter(name, capacity=1000)
+    reader = SharedRingReader(name)
+    try:
+        assert reader.capacity == 1000
+        write_counts(writer, 0, 10)
+        assert np.array_equal(reader.read()['index'], np.arange(10))
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_overrun_is_counted():
+    writer = SharedRingWriter('gpi_test_%s' % uuid.uuid4().hex[:8], capacity=1000)
+    reader = SharedRingReader(writer.name)
+    try:
+        write_counts(writer, 0, 700)
+        write_counts(writer, 700, 700)
+        records = reader.read()
+        assert reader.lost_samples == 400
+        assert np.array_equal(records['index'], np.arange(400, 1400))
+        del records
+    finally:
+        reader.close()
+        writer.close()
+
+
+def read_latest(name, queue):
+    reader = SharedRingReader(name)
+    records = reader.latest(0.01)
+    queue.put(records['index'].tolist())
+    del records
+    reader.close()
+
+
+def test_reader_in_other_process():
+    writer = SharedRingWriter('gpi_test_%s' % uuid.uuid4().hex[:8], capacity=1000)
+    try:
+        write_counts(writer, 0, 250)
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=read_latest, args=(writer.name, queue))
+        process.start()
+        assert queue.get(timeout=10) == list(range(150, 250))
+        process.join(10)
+        # The reader must not have removed the shared memory on exit
+        SharedRingReader(writer.name).close()
+    finally:
+        writer.close()
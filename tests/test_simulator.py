@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import time
+import numpy as np
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path = [root, os.path.join(root, 'koheron-sdk', 'python')] + sys.path
+from gpi.simulator import SimulatedRedPitaya
+from gpi.acquisition import Acquisition
+from gpi.data import decode_GPI_data, abs_counts_to_torr
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def test_queue_fills_and_drops_like_the_server():
+    clock = Clock()
+    sim = SimulatedRedPitaya(clock=clock, seed=0)
+    clock.now = 0.1
+    assert len(sim.get_GPI_data()) == 1000
+    assert sim.get_GPI_data_index() == 0
+    clock.now = 10.1
+    words = sim.get_GPI_data()
+    assert len(words) == 50000
+    assert sim.get_GPI_data_index() == 101000 - 50000
+    abs_pressures, diff_pressures = decode_GPI_data(words)
+    assert abs(abs_pressures.mean() - 759.5) < 0.1
+    assert abs(diff_pressures.mean()) < 0.01
+
+
+def test_valves_drive_the_pressure():
+    clock = Clock()
+    sim = SimulatedRedPitaya(clock=clock, pressure=0, seed=0)
+    sim.set_slow_1(1) # V5, fill from the supply
+    clock.now = 1
+    filled = abs_counts_to_torr(sim.get_abs_gauge())
+    # Exponential approach to the supply pressure with V/C = 1.6 s
+    assert abs(filled - 1500*(1 - np.exp(-0.5/0.802))) < 2
+    assert sim.get_status()['slow_1_sts'] == 1
+    sim.set_slow_1(0)
+    sim.set_slow_2(1) # V4, pump out
+    clock.now = 20
+    assert abs_counts_to_torr(sim.get_abs_gauge()) < 0
+
+
+def test_puff_follows_timer():
+    clock = Clock()
+    sim = SimulatedRedPitaya(clock=clock, diff_noise=0, seed=0)
+    sim.set_slow_3(1) # close V3
+    sim.set_fast_permission_1(1)
+    sim.set_fast_delay_1(100)
+    sim.set_fast_duration_1(50)
+    clock.now = 0.1
+    sim.get_GPI_data()
+    sim.send_T1(1)
+    clock.now = 0.18
+    assert sim.get_fast_sts() == 0
+    clock.now = 0.22
+    assert sim.get_fast_sts() == 1
+    clock.now = 0.5
+    _, diff_pressures = decode_GPI_data(sim.get_GPI_data())
+    drop = 760*(1 - np.exp(-0.05*0.05/0.802))
+    assert abs(diff_pressures[:1000]).max() < 0.01
+    assert abs(diff_pressures[1500:] + drop).max() < 0.01
+    assert np.all(np.diff(diff_pressures[1000:1500]) <= 0.01)
+
+
+def test_latency_is_injected():
+    sim = SimulatedRedPitaya(latency=0.01, jitter=0.01, seed=0)
+    start = time.time()
+    for _ in range(5):
+        sim.get_abs_gauge()
+    assert 0.05 <= time.time() - start < 0.2
+
+
+def test_acquisition_from_simulator():
+    sim = SimulatedRedPitaya(sample_rate=100000, seed=0)
+    acquisition = Acquisition(lambda: sim, poll_interval=0.01)
+    acquisition.start()
+    time.sleep(0.3)
+    acquisition.stop()
+    assert acquisition.error is None
+    blocks = acquisition.get_blocks()
+    assert acquisition.dropped_samples == 0
+    assert [b.index for b in blocks[1:]] == [b.index + len(b.words) for b in blocks[:-1]]
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import re
+import numpy as np
+import yaml
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path = [root, os.path.join(root, 'koheron-sdk', 'python')] + sys.path
+from GPI_RP.GPI_RP import GPI_RP, STATUS_REGISTERS
+
+
+def test_status_registers_match_config():
+    with open(os.path.join(root, 'GPI_RP', 'config.yml')) as f:
+        config = yaml.safe_load(f)
+    names = []
+    # Same expansion of 'adc[n_adc]' as make.py's build_registers
+    for register in config['status_registers']:
+        match = re.match(r'(\w+)\[(\w+)\]', register)
+        if match:
+            name, parameter = match.groups()
+            names += [name + str(i) for i in range(config['parameters'][parameter])]
+        else:
+            names.append(register)
+    assert tuple(names) == STATUS_REGISTERS
+
+
+def test_status_is_decoded_by_name():
+    driver = GPI_RP(client=None)
+    driver.get_status_registers = lambda: np.arange(len(STATUS_REGISTERS), dtype='uint32')
+    status = driver.get_status()
+    assert status['adc0'] == 0
+    assert status['slow_1_sts'] == 8
+    assert status['fast_sts'] == 12
+    assert status.dtype.names == STATUS_REGISTERS